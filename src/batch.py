@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import pandas as pd
+import matplotlib
+from concurrent.futures import ProcessPoolExecutor
+
+# headless runs never open a window
+matplotlib.use('Agg')
+
+from src.data_prep import Data_Prep, pivot_index
+from src.graph_config import Categorical_Graph_Config, Numerical_Graph_Config
+from src.histograms import pyramid_index
+from src.pivot_store import Pivot_Cache, save_pivots
+from src.profiling import Stage_Profiler
+from src.graph_generator import (directory_setup, cat_graph_generate, cat_graph_generate_hist,
+                                 numeric_graph_generate, numeric_graph_generate_hist)
+
+
+STAGES = ['load', 'profile', 'target', 'config', 'pivots', 'render', 'save']
+
+
+def load_spec(path):
+    """
+    Desc:
+        Reads a JSON run spec. Keys under "defaults" apply to every dataset unless the dataset sets them itself.
+
+        {"n_jobs": 4,
+         "defaults": {"target_var": "target", "target_types": ["non-churn", "churn"]},
+         "datasets": [{"name": "churn_q1",                          # required
+                       "path": "data/churn_q1.csv",                 # required, .csv or .parquet
+                       "root_folder": "runs/churn_q1",              # default is the dataset name
+                       "read_kwargs": {"sep": ";"},                 # passed on to the pandas reader
+                       "drop": ["customer_id"],                     # columns removed before profiling
+                       "id_threshold": 0.5, "null_threshold": 0.99, "compact": false, "sketch": false,
+                       "sketch_error": 0.01, "exact_limit": 10000,   # accuracy of the sketch mode profile
+                       "desired_target": "3",                       # class to analyse for a multiclass target
+                       "target_types": ["non-churn", "churn"],      # labels of the 0 and 1 target values
+                       "cat_cols": ["region", "plan"],              # column subsets (default every detected column)
+                       "numeric_cols": ["age"],
+                       "default_max_cat": 10,
+                       "cat_config": {"region": {"soft_cat_limit": 5}},
+                       "num_config": {"age": {"bin_length": 5}},
+                       "sort_orders": {"plan": ["basic", "plus", "premium"]},
+                       "pivot_jobs": 1, "render_jobs": 1,            # worker processes within the dataset
+                       "pivot_cache": true,                          # loads unchanged pivots from root_folder/Pivots/cache
+                       "prebin_numeric": false,                      # bins numeric pivots while counting, num_config changes then need new pivots
+                       "force": false,                               # redraw graphs that are unchanged since the last run
+                       "profile": false}]}                           # per column stage report in root_folder/profile.csv/.json
+
+    Params:
+        path: location of the spec file
+
+    output:
+        datasets: list of per dataset specs with the defaults applied
+        n_jobs: number of datasets to run concurrently (None uses every core)
+
+    """
+
+    with open(path) as f:
+        spec = json.load(f)
+
+    defaults = spec.get('defaults', {})
+    datasets = [{**defaults, **dataset} for dataset in spec['datasets']]
+
+    for dataset in datasets:
+        for key in ['name', 'path']:
+            if key not in dataset:
+                raise ValueError("every dataset in the run spec needs a " + key)
+
+    return datasets, spec.get('n_jobs')
+
+def load_data(path, read_kwargs = None):
+    # reads a .csv or .parquet file into a dataframe
+    if read_kwargs is None:
+        read_kwargs = {}
+
+    if os.path.splitext(path)[1].lower() in ['.parquet', '.pq']:
+        return pd.read_parquet(path, **read_kwargs)
+    return pd.read_csv(path, **read_kwargs)
+
+def sort_positions(pivot, levels):
+    """
+    Desc: converts a custom sort order given as category levels into the index order custom_sort returns.
+          Levels not in the pivot are ignored and levels not listed keep their place after the listed ones
+
+    Params:
+        pivot: pivot of the column
+        levels: list of levels in the desired order
+
+    output:
+        list of integers which specifies the index order
+
+    """
+
+    names = [str(v) for v in pivot.index]
+    order = [names.index(str(level)) for level in levels if str(level) in names]
+    return order + [i for i in range(len(names)) if i not in order]
+
+def subset_cols(detected, requested):
+    # keeps the requested columns that survived the exclusion analysis, in detected order
+    if requested is None:
+        return detected
+    missing = [col for col in requested if col not in detected]
+    if missing:
+        print("skipping requested columns that were excluded or not found: " + str(missing))
+    return detected[detected.isin(requested)]
+
+def run_dataset(dataset):
+    """
+    Desc:
+        Runs the notebook pipeline end to end for one dataset without prompting: profiling, target definition,
+        configs, pivots, graphs and pivot save (root_folder/Pivots/pivots, see Pivot_Store). Every answer the notebook
+        asks for is read from the spec instead.
+
+    Params:
+        dataset: dataset spec as returned by load_spec
+
+    output:
+        timings: list of {dataset, stage, seconds, rows, cols} records of the stages that completed
+        error: traceback text if the run failed, None otherwise
+
+    """
+
+    name = dataset['name']
+    root_folder = dataset.get('root_folder', name)
+    target_var = dataset.get('target_var', '')
+    timings = []
+    profiler = Stage_Profiler() if dataset.get('profile', False) else None
+
+    def record(stage, start, rows, cols):
+        timings.append({'dataset': name, 'stage': stage, 'seconds': time.time() - start, 'rows': rows, 'cols': cols})
+
+    try:
+        start = time.time()
+        directory_setup(root_folder)
+        df = load_data(dataset['path'], dataset.get('read_kwargs'))
+        df = df.drop(columns = dataset.get('drop', []))
+        rows = len(df)
+        record('load', start, rows, df.shape[1])
+
+        start = time.time()
+        data_prep = Data_Prep(df, target_var, dataset.get('id_threshold', 0.5), dataset.get('null_threshold', 0.99),
+                              dataset.get('compact', False), dataset.get('sketch', False), profiler,
+                              dataset.get('sketch_error', 0.01), dataset.get('exact_limit', 10000))
+        cat_cols = subset_cols(data_prep.cat_cols, dataset.get('cat_cols'))
+        numeric_cols = subset_cols(data_prep.numeric_cols, dataset.get('numeric_cols'))
+        record('profile', start, rows, df.shape[1])
+
+        start = time.time()
+        target_types = ''
+        if target_var != '':
+            if data_prep.df[target_var].nunique() > 2 and dataset.get('desired_target') is None:
+                raise ValueError(target_var + " is multiclass, set desired_target in the run spec")
+            data_prep.define_target(dataset.get('desired_target'))
+            data_prep.label_target(dataset.get('target_types', ['non_target', 'target']))
+            target_types = data_prep.target_types
+        record('target', start, rows, 1 if target_var != '' else 0)
+
+        start = time.time()
+        cat_config = numeric_config = None
+        if len(cat_cols):
+            cat_config = Categorical_Graph_Config(data_prep.df, cat_cols, root_folder, dataset.get('default_max_cat', 10), profiler = profiler)
+            cat_config.change(values = dataset.get('cat_config', {}))
+        if len(numeric_cols):
+            numeric_config = Numerical_Graph_Config(data_prep.df, numeric_cols, target_var, root_folder, profiler = profiler)
+            numeric_config.change(values = dataset.get('num_config', {}))
+        record('config', start, rows, len(cat_cols) + len(numeric_cols))
+
+        start = time.time()
+        n_jobs = dataset.get('pivot_jobs', 1)
+        pivots_of = Pivot_Cache(root_folder).pivot_index if dataset.get('pivot_cache', True) else pivot_index
+        # categorical pivots only keep the levels their graph shows. Numeric pivots stay per value, so config changes
+        # re-aggregate through the histogram pyramids, unless binning while counting is asked for
+        cat_limits = cat_config.default_config_cat if cat_config is not None else None
+        numeric_bins = numeric_config.default_config_numeric if numeric_config is not None and dataset.get('prebin_numeric', False) else None
+        cat_pivots = pivots_of(data_prep.df_cat, cat_cols, target_var, target_types, n_jobs, profiler, cat_limits) if len(cat_cols) else {}
+        numeric_pivots = pivots_of(data_prep.df_numeric, numeric_cols, target_var, target_types, n_jobs, profiler, numeric_bins) if len(numeric_cols) else {}
+        record('pivots', start, rows, len(cat_cols) + len(numeric_cols))
+
+        start = time.time()
+        render_jobs = dataset.get('render_jobs', 1)
+        force = dataset.get('force', False)
+        if cat_config is not None:
+            config_cat = cat_config.default_config_cat.loc[list(cat_cols)]
+            sort_orders = {}
+            for col in config_cat.index[config_cat['custom_sort'] == 1]:
+                if col in dataset.get('sort_orders', {}):
+                    sort_orders[col] = sort_positions(cat_pivots[col], dataset['sort_orders'][col])
+                elif not os.path.isfile(root_folder + "/Config/custom_sort/" + col + ".csv"):
+                    print("no sort order for " + col + " in the run spec, keeping the pivot order")
+                    sort_orders[col] = list(range(len(cat_pivots[col])))
+
+            if target_var != '':
+                cat_graph_generate(cat_pivots, target_types, config_cat, root_folder, sort_orders = sort_orders, n_jobs = render_jobs, force = force, profiler = profiler)
+            else:
+                cat_graph_generate_hist(cat_pivots, config_cat, root_folder, sort_orders = sort_orders, n_jobs = render_jobs, force = force, profiler = profiler)
+
+        if numeric_config is not None:
+            config_numeric = numeric_config.default_config_numeric.loc[list(numeric_cols)]
+            pyramids = pyramid_index(numeric_pivots, numeric_cols)
+            if target_var != '':
+                numeric_graph_generate(numeric_pivots, target_types, config_numeric, root_folder, pyramids = pyramids, n_jobs = render_jobs, force = force, profiler = profiler)
+            else:
+                numeric_graph_generate_hist(numeric_pivots, config_numeric, root_folder, pyramids = pyramids, n_jobs = render_jobs, force = force, profiler = profiler)
+        record('render', start, rows, len(cat_cols) + len(numeric_cols))
+
+        start = time.time()
+        save_pivots({**numeric_pivots, **cat_pivots}, root_folder + "/Pivots/pivots")
+        record('save', start, rows, len(cat_cols) + len(numeric_cols))
+
+        if profiler is not None:
+            profiler.save(root_folder + "/profile")
+
+    except Exception:
+        return timings, traceback.format_exc()
+
+    return timings, None
+
+def throughput_summary(timings):
+    """
+    Desc: per stage totals and throughput across every dataset of a batch
+
+    Params:
+        timings: list of timing records from run_dataset
+
+    output:
+        summary: dataframe indexed by stage with datasets, seconds, rows, cols, rows_per_s and cols_per_s
+
+    """
+
+    timings = pd.DataFrame(timings, columns = ['dataset', 'stage', 'seconds', 'rows', 'cols'])
+
+    summary = timings.groupby('stage').agg(datasets = ('dataset', 'nunique'), seconds = ('seconds', 'sum'),
+                                           rows = ('rows', 'sum'), cols = ('cols', 'sum'))
+    summary = summary.reindex([stage for stage in STAGES if stage in summary.index])
+
+    summary['rows_per_s'] = summary['rows'] / summary['seconds']
+    summary['cols_per_s'] = summary['cols'] / summary['seconds']
+    return summary
+
+def run_batch(datasets, n_jobs = None):
+    """
+    Desc:
+        Runs many datasets concurrently, one worker process per dataset at a time. A failing dataset is reported and
+        does not stop the others
+
+    Params:
+        datasets: list of dataset specs as returned by load_spec
+        n_jobs: number of datasets run concurrently (default uses every core)
+
+    output:
+        summary: per stage throughput summary (see throughput_summary)
+        timings: dataframe of every timing record
+        errors: dict of dataset name -> traceback of the failed datasets
+
+    """
+
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers = n_jobs) as executor:
+        results = list(executor.map(run_dataset, datasets))
+
+    timings = [record for dataset_timings, error in results for record in dataset_timings]
+    errors = {dataset['name']: error for dataset, (dataset_timings, error) in zip(datasets, results) if error is not None}
+
+    for name, error in errors.items():
+        print("dataset " + name + " failed:")
+        print(error)
+
+    summary = throughput_summary(timings)
+    print("ran " + str(len(datasets) - len(errors)) + " of " + str(len(datasets)) + " datasets in " + str(round(time.time() - start, 2)) + "s")
+    print(summary)
+
+    return summary, pd.DataFrame(timings, columns = ['dataset', 'stage', 'seconds', 'rows', 'cols']), errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "runs the insights pipeline for every dataset of a run spec without prompting")
+    parser.add_argument('spec', help = "JSON run spec, see load_spec")
+    parser.add_argument('--n_jobs', type = int, default = None, help = "datasets run concurrently (default from the spec, else every core)")
+    args = parser.parse_args()
+
+    datasets, n_jobs = load_spec(args.spec)
+    summary, timings, errors = run_batch(datasets, args.n_jobs if args.n_jobs is not None else n_jobs)
+    sys.exit(1 if errors else 0)
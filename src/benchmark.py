@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+import matplotlib
+
+# benchmarks never open a window
+matplotlib.use('Agg')
+
+from src.data_prep import Data_Prep, pivot_index
+from src.graph_config import Categorical_Graph_Config, Numerical_Graph_Config
+from src.graph_generator import (directory_setup, cat_graph_generate, cat_graph_generate_hist,
+                                 numeric_graph_generate, numeric_graph_generate_hist)
+from src.profiling import Memory_Meter, start_tracing
+
+
+# synthetic_data settings of the standard cases
+CASES = {'small': {'rows': 10000, 'numeric_cols': 5, 'cat_cols': 5, 'cardinality': 20},
+         'medium': {'rows': 200000, 'numeric_cols': 20, 'cat_cols': 20, 'cardinality': 50},
+         'wide': {'rows': 50000, 'numeric_cols': 100, 'cat_cols': 100, 'cardinality': 20},
+         'high_cardinality': {'rows': 200000, 'numeric_cols': 5, 'cat_cols': 10, 'cardinality': 20000},
+         'multiclass': {'rows': 100000, 'numeric_cols': 10, 'cat_cols': 10, 'cardinality': 30, 'target_classes': 5},
+         'histogram': {'rows': 100000, 'numeric_cols': 10, 'cat_cols': 10, 'cardinality': 30, 'target_classes': 0}}
+
+
+def synthetic_data(rows = 10000, numeric_cols = 5, cat_cols = 5, cardinality = 20, null_rate = 0.01, date_cols = 1,
+                   target_classes = 2, seed = 0):
+    """
+    Desc: reproducible dataset shaped like the tool's inputs
+
+    Params:
+        rows: number of rows
+        numeric_cols: number of numeric columns (num_0, ...), alternately integer counts and continuous floats
+        cat_cols: number of text columns (cat_0, ...) with skewed level frequencies
+        cardinality: number of levels of each text column
+        null_rate: share of missing values in every non target column (integers with missing values load as floats)
+        date_cols: number of date columns stored as 'YYYY-MM-DD' text (date_0, ...), picked up by date_detect
+        target_classes: number of classes of the 'target' column (2 for binary, more for multiclass, 0 for no target)
+        seed: random seed
+
+    output:
+        df: dataframe
+        target_var: 'target', or '' when there is no target
+
+    """
+
+    rng = np.random.default_rng(seed)
+    data = {}
+
+    if target_classes:
+        data['target'] = rng.integers(0, target_classes, rows)
+
+    for i in range(numeric_cols):
+        if i % 2:
+            data['num_' + str(i)] = rng.normal(50, 15, rows).round(1)
+        else:
+            data['num_' + str(i)] = rng.poisson(5 + i, rows)
+
+    # zipf like frequencies, so a few levels dominate as in real categorical data
+    weights = 1 / np.arange(1, cardinality + 1)
+    weights = weights / weights.sum()
+    levels = np.array(['level_' + str(j) for j in range(cardinality)], dtype = 'object')
+    for i in range(cat_cols):
+        data['cat_' + str(i)] = levels[rng.choice(cardinality, rows, p = weights)]
+
+    days = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1000, rows), unit = 'D')
+    for i in range(date_cols):
+        data['date_' + str(i)] = days.strftime('%Y-%m-%d').to_numpy(dtype = 'object')
+
+    df = pd.DataFrame(data)
+
+    for col in df.columns:
+        if col != 'target' and null_rate > 0:
+            df[col] = df[col].mask(rng.random(rows) < null_rate)
+
+    return df, 'target' if target_classes else ''
+
+
+def run_case(name, params, root_folder, render = True, n_jobs = 1, memory = True):
+    """
+    Desc: runs the notebook pipeline on one synthetic dataset without prompting and times every stage. Fails when the
+          pipeline does not pick up every generated numeric and categorical column, or does not save a chart for each
+
+    Params:
+        name: case name
+        params: synthetic_data settings
+        root_folder: folder the configs and graphs are written to (emptied first)
+        render: also times graph rendering (every graph is redrawn, the render cache is bypassed)
+        n_jobs: worker processes for pivots and rendering
+        memory: traces memory allocations for peak_mb, which slows allocation heavy stages somewhat
+
+    output:
+        records: list of {case, stage, seconds, rows, cols, charts, peak_mb} records, peak_mb being the peak memory of
+                 the stage in this process (see Memory_Meter, NaN when memory is False)
+
+    """
+
+    if memory:
+        start_tracing()
+    
+    df, target_var = synthetic_data(**params)
+    rows = len(df)
+    records = []
+    generated = {'categorical': [col for col in df.columns if col.startswith('cat_')],
+                 'numeric': [col for col in df.columns if col.startswith('num_')]}
+
+    if os.path.isdir(root_folder):
+        shutil.rmtree(root_folder)
+    directory_setup(root_folder)
+
+    meter = Memory_Meter()
+    
+    def record(stage, start, cols, charts = 0):
+        seconds = time.time() - start
+        records.append({'case': name, 'stage': stage, 'seconds': seconds, 'rows': rows, 'cols': cols,
+                        'charts': charts, 'peak_mb': meter.lap(stage)})
+
+    start = time.time()
+    data_prep = Data_Prep(df, target_var)
+    cat_cols, numeric_cols = data_prep.cat_cols, data_prep.numeric_cols
+    record('profile', start, df.shape[1])
+    
+    # a timing of a pipeline that dropped columns is not comparable to the baseline
+    for kind, detected in [('categorical', cat_cols), ('numeric', numeric_cols)]:
+        missing = [col for col in generated[kind] if col not in detected]
+        if missing:
+            raise ValueError(name + ": " + str(len(missing)) + " of the " + str(len(generated[kind])) + " generated " + kind + 
+                             " columns were not detected as " + kind + ": " + str(missing))
+
+    start = time.time()
+    target_types = ''
+    if target_var != '':
+        data_prep.define_target('1' if params.get('target_classes', 2) > 2 else None)
+        data_prep.label_target(['non_target', 'target'])
+        target_types = data_prep.target_types
+    record('target', start, 1 if target_var != '' else 0)
+
+    start = time.time()
+    config_cat = Categorical_Graph_Config(data_prep.df, cat_cols, root_folder).default_config_cat.loc[list(cat_cols)]
+    config_numeric = Numerical_Graph_Config(data_prep.df, numeric_cols, target_var, root_folder).default_config_numeric.loc[list(numeric_cols)]
+    record('config', start, len(cat_cols) + len(numeric_cols))
+
+    start = time.time()
+    cat_pivots = pivot_index(data_prep.df_cat, cat_cols, target_var, target_types, n_jobs)
+    numeric_pivots = pivot_index(data_prep.df_numeric, numeric_cols, target_var, target_types, n_jobs)
+    record('pivots', start, len(cat_cols) + len(numeric_cols))
+
+    if render:
+        start = time.time()
+        if target_var != '':
+            cat_graph_generate(cat_pivots, target_types, config_cat, root_folder, n_jobs = n_jobs, force = True)
+            numeric_graph_generate(numeric_pivots, target_types, config_numeric, root_folder, n_jobs = n_jobs, force = True)
+        else:
+            cat_graph_generate_hist(cat_pivots, config_cat, root_folder, n_jobs = n_jobs, force = True)
+            numeric_graph_generate_hist(numeric_pivots, config_numeric, root_folder, n_jobs = n_jobs, force = True)
+        record('render', start, len(cat_cols) + len(numeric_cols), len(cat_cols) + len(numeric_cols))
+        
+        # failed charts are reported and skipped by the generators, the benchmark fails instead
+        for folder, cols in [('/Categorical', cat_cols), ('/Numeric', numeric_cols)]:
+            missing = [col for col in cols if not os.path.isfile(root_folder + folder + '/' + col + '.jpg')]
+            if missing:
+                raise RuntimeError(name + ": no chart was saved for " + str(missing))
+
+    return records
+
+def run_benchmark(cases, root_folder = None, repeats = 1, render = True, n_jobs = 1, memory = True):
+    """
+    Desc: runs every case repeats times and keeps the fastest run of each stage. Every run is a fresh process, so
+          neither memory nor caches carry over from the runs before it
+
+    Params:
+        cases: dict of case name -> synthetic_data settings (e.g. a subset of CASES)
+        root_folder: working folder for configs and graphs (default a temporary folder, removed afterwards)
+        repeats: runs per case, the minimum time is kept to reduce noise
+        render, n_jobs, memory: as per run_case
+
+    output:
+        results: dataframe with case, stage, seconds, rows, cols, charts, peak_mb, rows_per_s and charts_per_s
+
+    """
+
+    temporary = root_folder is None
+    if temporary:
+        root_folder = tempfile.mkdtemp(prefix = 'eda_benchmark_')
+
+    try:
+        records = []
+        for name, params in cases.items():
+            for repeat in range(repeats):
+                print("benchmark " + name + " run " + str(repeat + 1) + " of " + str(repeats))
+                with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context('spawn')) as executor:
+                    records.extend(executor.submit(run_case, name, params, root_folder + '/' + name, render, n_jobs, memory).result())
+    finally:
+        if temporary:
+            shutil.rmtree(root_folder, ignore_errors = True)
+
+    results = pd.DataFrame(records)
+    results = results.groupby(['case', 'stage'], sort = False).agg(seconds = ('seconds', 'min'), rows = ('rows', 'first'),
+                                                                  cols = ('cols', 'first'), charts = ('charts', 'first'),
+                                                                  peak_mb = ('peak_mb', 'max')).reset_index()
+
+    results['rows_per_s'] = results['rows'] / results['seconds']
+    results['charts_per_s'] = np.where(results['charts'] > 0, results['charts'] / results['seconds'], np.nan)
+    return results
+
+def save_results(results, path, cases = None):
+    # writes results with the settings of each case and the machine they ran on, so baselines are comparable
+    with open(path, 'w') as f:
+        json.dump({'machine': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                               'platform': platform.platform(), 'cpus': os.cpu_count()},
+                   'cases': cases if cases is not None else {},
+                   'results': json.loads(results.to_json(orient = 'records'))}, f, indent = 1)
+
+def load_results(path):
+    # results dataframe of a file written by save_results
+    with open(path) as f:
+        return pd.DataFrame(json.load(f)['results'])
+
+def compare(results, baseline, threshold = 0.25, memory_threshold = 0.25, min_seconds = 0.05):
+    """
+    Desc: compares results against a baseline stage by stage
+
+    Params:
+        results: output of run_benchmark
+        baseline: earlier results (e.g. load_results of the stored baseline)
+        threshold: relative slow down of a stage that counts as a regression
+        memory_threshold: relative growth of the peak memory of a stage that counts as a regression
+        min_seconds: absolute slack, so stages of a few milliseconds do not flag on timer noise
+
+    output:
+        comparison: dataframe per case and stage with the baseline and current seconds and peak_mb, their ratios and a
+                    regression flag (stages missing from the baseline are not flagged)
+
+    """
+
+    keys = ['case', 'stage']
+    comparison = results[keys + ['seconds', 'peak_mb']].merge(baseline[keys + ['seconds', 'peak_mb']], on = keys,
+                                                               how = 'left', suffixes = ('', '_baseline'))
+
+    comparison['time_ratio'] = comparison['seconds'] / comparison['seconds_baseline']
+    comparison['memory_ratio'] = comparison['peak_mb'] / comparison['peak_mb_baseline']
+
+    slower = comparison['seconds'] > comparison['seconds_baseline'] * (1 + threshold) + min_seconds
+    larger = comparison['peak_mb'] > comparison['peak_mb_baseline'] * (1 + memory_threshold)
+    comparison['regression'] = slower | larger
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "times every pipeline stage on synthetic data and compares against a baseline")
+    parser.add_argument('--cases', nargs = '+', default = ['small', 'medium'], choices = list(CASES), help = "cases to run")
+    parser.add_argument('--repeats', type = int, default = 3, help = "runs per case, the fastest is kept")
+    parser.add_argument('--n_jobs', type = int, default = 1, help = "worker processes for pivots and rendering")
+    parser.add_argument('--no_render', action = 'store_true', help = "skips the render stage")
+    parser.add_argument('--no_memory', action = 'store_true', help = "times without tracing memory, peak_mb is left empty")
+    parser.add_argument('--out', default = 'benchmark_results.json', help = "results file")
+    parser.add_argument('--baseline', default = None, help = "results file to compare against")
+    parser.add_argument('--save_baseline', action = 'store_true', help = "also writes the results to --baseline")
+    parser.add_argument('--threshold', type = float, default = 0.25, help = "relative slow down counted as a regression")
+    parser.add_argument('--memory_threshold', type = float, default = 0.25, help = "relative peak memory growth counted as a regression")
+    args = parser.parse_args()
+
+    cases = {name: CASES[name] for name in args.cases}
+    results = run_benchmark(cases, repeats = args.repeats, render = not args.no_render, n_jobs = args.n_jobs, memory = not args.no_memory)
+    save_results(results, args.out, cases)
+    print(results)
+
+    regressions = 0
+    if args.baseline is not None and args.save_baseline:
+        save_results(results, args.baseline, cases)
+        print("baseline saved to " + args.baseline)
+    elif args.baseline is not None:
+        comparison = compare(results, load_results(args.baseline), args.threshold, args.memory_threshold)
+        print(comparison)
+        regressions = int(comparison['regression'].sum())
+        print(str(regressions) + " regressions against " + args.baseline)
+
+    sys.exit(1 if regressions else 0)
@@ -12,10 +12,378 @@ import math
 import re
 from pathlib import Path
 import datetime
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 
+from src.sketches import sketch_profile_columns
+from src.profiling import Memory_Meter, start_tracing
+from src.graph_config import cat_limit, num_bins, bin_codes, bin_labels
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError: # older pandas versions
+    from pandas.core.tools.datetimes import guess_datetime_format
+
+
+def profile_columns(df, target_var = ''):
+    """
+    Desc: profiles every column of a dataframe in a single factorize pass per column, replacing the repeated
+          unique/dropna/value_counts/groupby scans previously done in Data_Prep
+    
+    Params:
+        df: raw dataframe
+        target_var: name of the target variable (default skips the per-target-class presence count)
+        
+    output: 
+        profile: dataframe indexed by column name with the columns
+            dtype: dtype of the column as a string
+            n_rows: number of rows
+            null_count: number of missing values
+            n_unique: number of distinct non-missing values
+            top_value/top_count: most frequent non-missing value and its count
+            target_levels: number of target classes present among the rows where the column is not missing
+            seconds: time taken to profile the column
+            peak_mb: peak memory of profiling the column (see Memory_Meter)
+    
+    """
+    
+    if target_var != '' and target_var in df.columns:
+        target_codes, target_uniques = pd.factorize(df[target_var])
+        n_classes = len(target_uniques)
+    else:
+        target_codes = None
+        n_classes = 0
+    
+    records = []
+    meter = Memory_Meter()
+    for col in df.columns:
+        start = time.time()
+        
+        codes, uniques = pd.factorize(df[col])
+        valid = codes >= 0
+        counts = np.bincount(codes[valid], minlength=len(uniques))
+        
+        if len(uniques) > 0:
+            top = counts.argmax()
+            top_value, top_count = uniques[top], int(counts[top])
+        else:
+            top_value, top_count = np.nan, 0
+        
+        # number of target classes seen alongside a non-missing value (mirrors groupby([col, target_var]) which drops missing keys)
+        if target_codes is not None:
+            both = valid & (target_codes >= 0)
+            target_levels = int(np.count_nonzero(np.bincount(target_codes[both], minlength=n_classes)))
+        else:
+            target_levels = 0
+        
+        records.append({'column': col,
+                        'dtype': str(df[col].dtype),
+                        'n_rows': len(codes),
+                        'null_count': int(len(codes) - valid.sum()),
+                        'n_unique': len(uniques),
+                        'top_value': top_value,
+                        'top_count': top_count,
+                        'target_levels': target_levels,
+                        'seconds': time.time() - start,
+                        'peak_mb': meter.lap(col)})
+    
+    return pd.DataFrame(records, columns = ['column', 'dtype', 'n_rows', 'null_count', 'n_unique', 'top_value', 
+                                            'top_count', 'target_levels', 'seconds', 'peak_mb']).set_index('column')
+
+def profile_exclusions(profile, id_threshold = 0.5, null_threshold = 0.99):
+    """
+    Desc: applies the Data_Prep exclusion rules to a column profile
+    
+    Params:
+        profile: column profile as produced by profile_columns
+        id_threshold: ratio of distinct values to non-missing rows above which a column is treated as an ID
+        null_threshold: share of missing rows above which a column is treated as empty
+        
+    output: 
+        Ids_cats, trivial, null_cols, num_exclude: lists of column names for each exclusion rule
+    
+    """
+    
+    non_null = profile['n_rows'] - profile['null_count']
+    
+    # unique() counts missing values as one extra level
+    n_levels = profile['n_unique'] + (profile['null_count'] > 0)
+    
+    Ids_cats = list(profile.index[n_levels / (non_null + 1) >= id_threshold])
+    trivial = list(profile.index[profile['n_unique'] == 1])
+    null_cols = list(profile.index[non_null / profile['n_rows'] <= (1 - null_threshold)])
+    num_exclude = list(profile.index[profile['dtype'].isin(['float64', 'int64']) & (profile['target_levels'] < 2)])
+    
+    return Ids_cats, trivial, null_cols, num_exclude
+
+def report_exclusions(prep):
+    """
+    Desc: prints the exclusion lists of a Data_Prep style object and sets its total_exclude
+
+    Params:
+        prep: object with the Ids_cats, trivial, date_cols, null_cols and num_exclude lists set
+
+    """
+
+    for cols, label in [(prep.Ids_cats, "ID variables"),
+                        (prep.trivial, "trivial variables (only one unique value)"),
+                        (prep.date_cols, "date variables"),
+                        (prep.null_cols, "heavy null variables"),
+                        (prep.num_exclude, "variables which are missing in a level of the class")]:
+        print("detected " + str(len(cols)) + " " + label + ":")
+        print(cols)
+
+    prep.total_exclude = prep.Ids_cats + prep.trivial + prep.date_cols + prep.null_cols + prep.num_exclude
+
+
+def top_k_positions(sort_counts, labels, k, ascending = False):
+    """
+    Desc: positions of the k largest (or smallest) counts with a partial selection instead of a full sort. Ties at the
+          cut go to the levels that come first in label order
+    
+    Params:
+        sort_counts: count of every level in the sort column
+        labels: level of every count
+        k: number of levels to keep
+        ascending: keeps the smallest counts
+        
+    output: 
+        positions of the kept levels, unordered
+    
+    """
+    
+    key = sort_counts if ascending else -sort_counts
+    kth = np.partition(key, k - 1)[k - 1]
+    
+    above = np.flatnonzero(key < kth)
+    ties = np.flatnonzero(key == kth)
+    ties = ties[np.argsort(np.asarray(labels, dtype = 'object')[ties], kind = 'stable')][:k - len(above)]
+    return np.concatenate([above, ties])
+
+def top_levels(counts, index, sort_pos, k, keep_other, ascending = False):
+    """
+    Desc: collapses pivot counts to the levels a categorical config row shows (see cat_limit). The kept levels stay in
+          level order and, with keep_other, every other level is summed exactly into a trailing 'other/unsp' row that
+          cat_table folds into its own 'other/unsp' row
+    
+    Params:
+        counts: 2d array of counts, one row per level
+        index: levels of the rows
+        sort_pos: count column the config sorts by
+        k, keep_other, ascending: as per cat_limit
+        
+    output: 
+        counts, index: collapsed counts and levels in level order (every level when there are no more than k)
+    
+    """
+    
+    if k >= len(index):
+        keep, keep_other = np.arange(len(index)), False
+    else:
+        keep = top_k_positions(counts[:, sort_pos], index, k, ascending)
+    keep = keep[np.argsort(np.asarray(index[keep], dtype = 'object'), kind = 'stable')]
+    
+    kept_counts, kept_index = counts[keep], index[keep]
+    if keep_other:
+        rest = np.ones(len(index), dtype = bool)
+        rest[keep] = False
+        kept_counts = np.vstack([kept_counts, counts[rest].sum(axis = 0, keepdims = True)])
+        kept_index = kept_index.append(pd.Index(['other/unsp'], name = index.name))
+    
+    return kept_counts, kept_index
+
+def collapse_pivot(temp, config, sort_col):
+    """
+    Desc: top_levels for a finished pivot, e.g. from Streaming_Data_Prep or Sql_Data_Prep
+    
+    Params:
+        temp: pivot of a categorical column
+        config: categorical config row of the column
+        sort_col: count column the config sorts by (second target type, or 'vals' for histograms)
+        
+    output: 
+        collapsed pivot (temp itself when the config needs every level)
+    
+    """
+    
+    limit = cat_limit(config)
+    if limit is None or limit[0] >= len(temp):
+        return temp
+    
+    counts, index = top_levels(temp.to_numpy(), temp.index, list(temp.columns).index(sort_col), *limit)
+    return pd.DataFrame(counts, index = index, columns = temp.columns)
+
+def crosstab_pivot(values, col, target_codes = None, target_uniques = None, target_types = '', keep_classes = False, limit = None):
+    """
+    Desc: builds the pivot table of a single column by factorizing it once and counting (value, target) code pairs with one bincount
+    
+    Params:
+        values: column to pivot
+        col: name of the column
+        target_codes: integer codes of the target variable (-1 for missing) as returned by pd.factorize(sort = True)
+        target_uniques: target values matching target_codes
+        target_types: the names of the two target values
+        keep_classes: keeps every target class as an integer count column, even classes never seen with this column (used for multiclass pivots)
+        limit: optional cat_limit of the column's config row, only the levels shown are kept (see top_levels) and the
+               full list of levels is never sorted
+        
+    output: 
+        temp: same table as df.groupby([col, target_var]).size().unstack().fillna(0), or the 'vals' histogram when no target is given
+    
+    """
+    
+    codes, uniques = pd.factorize(values, sort = limit is None)
+    if isinstance(uniques, pd.CategoricalIndex): # compact category columns pivot on their plain values
+        uniques = pd.Index(np.asarray(uniques), dtype = uniques.categories.dtype)
+    if uniques.dtype.kind in 'if' and uniques.dtype.itemsize < 8: # downcast compact numerics pivot on 64 bit values
+        uniques = uniques.astype(uniques.dtype.kind + '8')
+    index = pd.Index(uniques, name = col)
+    
+    if target_codes is None:
+        valid = codes >= 0
+        counts = np.bincount(codes[valid], minlength = len(uniques))[:, None]
+        columns = ['vals']
+    
+    else:
+        n_classes = len(target_uniques)
+        valid = (codes >= 0) & (target_codes >= 0)
+        counts = np.bincount(codes[valid] * n_classes + target_codes[valid], minlength = len(uniques) * n_classes).reshape(len(uniques), n_classes)
+        
+        # groupby only produces the (value, target) pairs that occur
+        rows = counts.any(axis = 1)
+        counts, index = counts[rows], index[rows]
+        columns = target_types
+        
+        if not keep_classes:
+            counts = counts[:, counts.any(axis = 0)]
+            
+            # unstack leaves gaps for missing pairs, which fillna turns into floats
+            if (counts == 0).any():
+                counts = counts.astype('float64')
+    
+    if limit is not None:
+        # sorted by the second target type, as cat_table does
+        counts, index = top_levels(counts, index, min(1, counts.shape[1] - 1), *limit)
+    
+    temp = pd.DataFrame(counts, index = index)
+    temp.columns = columns
+    return temp
+
+def binned_pivot(values, col, bins, target_codes = None, target_uniques = None, target_types = ''):
+    """
+    Desc: numeric pivot binned while counting, in place of the per value pivot later re-binned by bin_pivot. Values are
+          mapped straight to their lower_class row, bin or upper_class row and counted with one bincount, so the
+          pivot only ever holds the bins (continuous columns no longer give a row per distinct value)
+    
+    Params:
+        values: numeric column to pivot
+        col: name of the column
+        bins: dict of bin_length, upper_class and lower_class as per num_bins
+        target_codes, target_uniques, target_types: as per crosstab_pivot
+        
+    output: 
+        temp: same rows, labels and counts as bin_pivot on the per value pivot (counts stay integers), with the bins
+              kept in temp.attrs['binned'] so numeric_table uses the pivot as it is
+    
+    """
+    
+    bin_length, upper_class, lower_class = bins['bin_length'], bins['upper_class'], bins['lower_class']
+    
+    x = np.asarray(values, dtype = 'float64')
+    valid = ~np.isnan(x)
+    if target_codes is not None:
+        valid &= target_codes >= 0
+        classes = target_codes[valid]
+        n_classes = len(target_uniques)
+    else:
+        classes = np.zeros(valid.sum(), dtype = 'int64')
+        n_classes = 1
+    x = x[valid]
+    
+    # same rows as bin_pivot
+    k, below, above, origin = bin_codes(x, bin_length, upper_class, lower_class)
+    regular = ~below & ~above
+    codes = np.full(len(x), -1, dtype = 'int64')
+    labels = []
+    
+    if lower_class != 0:
+        codes[below] = 0
+        labels.append(lower_class)
+    
+    if regular.any() and bin_length != 0:
+        k = k[regular]
+        codes[regular] = len(labels) + k - k.min()
+        labels.extend(bin_labels(origin, np.arange(k.min(), k.max() + 1), bin_length, [c for c in [lower_class, upper_class] if c != 0]))
+    elif regular.any():
+        levels, inverse = np.unique(x[regular], return_inverse = True)
+        codes[regular] = len(labels) + inverse
+        labels.extend(levels)
+    
+    counted = codes >= 0
+    counts = np.bincount(codes[counted] * n_classes + classes[counted], minlength = len(labels) * n_classes).reshape(len(labels), n_classes)
+    
+    # counted on its own, like bin_pivot, so an upper_class below lower_class counts values in both rows
+    if upper_class != 0:
+        counts = np.vstack([counts, np.bincount(classes[above], minlength = n_classes)])
+        labels.append(upper_class)
+    
+    if target_codes is None:
+        columns = ['vals']
+    else:
+        # classes never seen with the column are left out, as in crosstab_pivot
+        counts = counts[:, counts.any(axis = 0)]
+        columns = target_types
+    
+    temp = pd.DataFrame(counts, index = pd.Index(labels, dtype = 'float64', name = col))
+    temp.columns = columns
+    temp.attrs['binned'] = dict(bins)
+    return temp
+
+def pivot_batch(df, columns, target_codes = None, target_uniques = None, target_types = '', keep_classes = False, limits = None, bins = None):
+    # pivots a batch of columns, used directly or as a process pool task. Also returns the seconds and peak memory
+    # (see Memory_Meter) per column
+    if limits is None:
+        limits = {}
+    if bins is None:
+        bins = {}
+    
+    pivots, seconds = {}, {}
+    meter = Memory_Meter()
+    for col in columns:
+        start = time.time()
+        if bins.get(col) is not None:
+            pivots[col] = binned_pivot(df[col], col, bins[col], target_codes, target_uniques, target_types)
+        else:
+            pivots[col] = crosstab_pivot(df[col], col, target_codes, target_uniques, target_types, keep_classes, limits.get(col))
+        seconds[col] = time.time() - start
+        meter.lap(col)
+    return pivots, seconds, meter.peaks
+
+def run_pivots(df, columns, target_codes, target_uniques, target_types = '', n_jobs = 1, keep_classes = False, profiler = None, limits = None, bins = None):
+    # runs pivot_batch in the current process or spread over n_jobs worker processes
+    columns = list(columns)
+    
+    if n_jobs == 1 or len(columns) < 2:
+        results = [pivot_batch(df, columns, target_codes, target_uniques, target_types, keep_classes, limits, bins)]
+    else:
+        # one task per worker, so the target codes are only sent n_jobs times
+        batches = [columns[i::n_jobs] for i in range(n_jobs) if columns[i::n_jobs]]
+        
+        with ProcessPoolExecutor(max_workers = n_jobs, initializer = start_tracing if tracemalloc.is_tracing() else None) as executor:
+            tasks = [executor.submit(pivot_batch, df[batch], batch, target_codes, target_uniques, target_types, keep_classes, limits, bins) for batch in batches]
+            results = [task.result() for task in tasks]
+    
+    pivots = {}
+    for batch_pivots, seconds, peak_mb in results:
+        pivots.update(batch_pivots)
+        if profiler is not None:
+            for col in batch_pivots:
+                profiler.record('pivot', col, seconds[col], len(df), len(batch_pivots[col]), peak_mb[col])
+    
+    return {col: pivots[col] for col in columns}
 
 #Create pivot tables
-def pivot_index(df, columns, target_var = '', target_types = ''):
+def pivot_index(df, columns, target_var = '', target_types = '', n_jobs = 1, profiler = None, config_df = None):
     """
     Desc: Takes a raw dataframe and produces a single dataframe object with multiple main dataframes
     
@@ -24,130 +392,459 @@ def pivot_index(df, columns, target_var = '', target_types = ''):
         columns: list of categorical columns, note this should be specified seperately from the df object
         target_var: name of the target variable (default allows regular histogram tables to be generated)
         target_types: the names of the two target values (default allows regular histogram tables to be generated)
+        n_jobs: number of worker processes to spread the columns over (default runs in the current process)
+        profiler: optional Stage_Profiler, records a pivot stage per column
+        config_df: optional categorical config (e.g. cat_config.default_config_cat). Columns whose row sorts and limits
+                   the levels only keep the levels their graph shows plus an exact 'other/unsp' remainder, so high
+                   cardinality columns cost about as much as small ones to pivot and render. Re-run pivot_index when
+                   their sort or limits change.
+                   With a numeric config (e.g. numeric_config.default_config_numeric) columns are binned while counting
+                   instead (see binned_pivot). This is opt-in for continuous columns too large to pivot per value: binned
+                   pivots get no Histogram_Pyramid, and pivot_index has to be re-run when their bin_length, upper_class
+                   or lower_class change
              
         
     output: 
         pivots: the collection of pivots generated from df 
     
     """
+    
     if target_var == '':
+        target_codes, target_uniques = None, None
+    else:
+        target_codes, target_uniques = pd.factorize(df[target_var], sort = True)
+    
+    limits, bins = {}, {}
+    if config_df is not None and 'bin_length' in config_df.columns:
+        bins = {col: num_bins(config_df.loc[col]) for col in columns if col in config_df.index}
+    elif config_df is not None:
+        limits = {col: cat_limit(config_df.loc[col]) for col in columns if col in config_df.index}
+    
+    return run_pivots(df, columns, target_codes, target_uniques, target_types, n_jobs, profiler = profiler, limits = limits, bins = bins)
+
+def class_pivot_index(df, columns, target, n_jobs = 1, profiler = None):
+    """
+    Desc: multiclass pivots, counting every target class of every column in a single pass
+    
+    Params:
+        df: raw dataframe (or Column_Subset)
+        columns: list of columns to pivot
+        target: series of target classes aligned with df (e.g. the original multiclass target column)
+        n_jobs: number of worker processes to spread the columns over
+        profiler: optional Stage_Profiler, records a pivot stage per column
         
-        pivots = {c: pd.DataFrame() for c in columns}
-        for col in columns:
-            #print(col) # debug tool
-            temp = df.groupby([col]).size().fillna(0).to_frame(name='vals')
-            pivots[col] = temp
+    output: 
+        pivots: dict of column -> dataframe of integer counts with one column per target class
     
+    """
     
-    else:
+    target_codes, target_uniques = pd.factorize(target, sort = True)
+    return run_pivots(df, columns, target_codes, target_uniques, list(target_uniques), n_jobs, keep_classes = True, profiler = profiler)
+
+def one_vs_rest(class_pivots, desired_target, target_types = ['non_target', 'target']):
+    """
+    Desc: derives the binary pivot of one class against all others from the multiclass pivots, without recounting
+    
+    Params:
+        class_pivots: output of class_pivot_index
+        desired_target: target class to compare against the rest
+        target_types: names of the rest and desired class columns
+        
+    output: 
+        pivots: same layout as pivot_index on a target relabelled to desired_target vs the rest
     
-        pivots = {c: pd.DataFrame() for c in columns}
-        for col in columns:
-            #print(col) # debug tool
-            temp = df.groupby([col, target_var]).size().unstack().fillna(0)
-            temp.columns = target_types
-            pivots[col] = temp
+    """
     
+    pivots = {}
+    for col, temp in class_pivots.items():
+        # classes are matched on their string form, as typed into define_target
+        target = temp[[c for c in temp.columns if str(c) == str(desired_target)][0]].values
+        rest = temp.values.sum(axis = 1) - target
+        counts = np.column_stack([rest, target])
+        
+        # matches the float cast of unstack when a pair is missing
+        if (counts == 0).any():
+            counts = counts.astype('float64')
+        
+        pivots[col] = pd.DataFrame(counts, index = temp.index, columns = target_types)
     return pivots
 
-def date_detect(df):
+def one_vs_rest_index(class_pivots):
     """
-    COULD BE OPTIMISED BY NOT LOOKING FOR MAX
-    Desc: finds columns likely to be dates in a dataframe
+    Desc: index value of every class against the rest of the classes for every level, from the multiclass pivots in one vectorised step per column
     
     Params:
-        dt: input dataframe
+        class_pivots: output of class_pivot_index
         
     output: 
-        date_list: returns names of columns in dt likely to be in date format
+        indexes: dict of column -> dataframe with one index column per class, the same value as the 'index' computed
+                 by the graph generators when that class is the target
     
     """
+    
+    indexes = {}
+    for col, temp in class_pivots.items():
+        counts = temp.values.astype('float64')
+        rest = counts.sum(axis = 1, keepdims = True) - counts
+        
+        # share of each class within the column divided by the share of the rest of the classes, inf or NaN where the
+        # rest is never seen with the level, as the pandas division of the graph generators gives
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            index = (counts / counts.sum(axis = 0)) / (rest / rest.sum(axis = 0))
+        indexes[col] = pd.DataFrame(index, index = temp.index, columns = temp.columns)
+    return indexes
+
+def date_sample(series, sample_size = 1000):
+    """
+    Desc: takes an evenly spaced sample of a column so that the start, middle and end of the data are all represented
+    
+    Params:
+        series: column to sample
+        sample_size: maximum number of rows to sample
+        
+    output: 
+        sample: non-missing values found at the sampled positions
+    
+    """
+    
+    n = len(series)
+    positions = np.unique(np.linspace(0, n - 1, num = min(n, sample_size)).astype(int))
+    return series.iloc[positions].dropna()
+
+def infer_date_format(sample):
+    """
+    Desc: infers a single datetime format for a sample of strings and checks that the whole sample parses with it
+    
+    Params:
+        sample: non-missing values of a column
+        
+    output: 
+        fmt: the inferred format (month first formats are tried before day first ones)
+        raises ValueError/TypeError if no single format parses the sample
+    
+    """
+    
+    first = sample.iloc[0]
+    if not isinstance(first, str):
+        raise TypeError("not a string column")
+    
+    for dayfirst in [False, True]:
+        fmt = guess_datetime_format(first, dayfirst = dayfirst)
+        if fmt is None:
+            continue
+        try:
+            pd.to_datetime(sample, format = fmt)
+            return fmt
+        except ValueError:
+            continue
+    
+    raise ValueError("no date format found")
+
+def date_detect(df, sample_size = 1000, date_formats = None, min_parsed = 0.9):
+    """
+    Desc: finds columns likely to be dates in a dataframe by parsing a sample of each object column, without modifying df.
+          A column whose sample parses is then parsed whole with the inferred format (a fast vectorised parse), and
+          kept only when most of its values fit that format
+    
+    Params:
+        df: input dataframe
+        sample_size: number of rows sampled from each object column
+        min_parsed: share of the non-missing values of the column that must parse with the inferred format
+        date_formats: optional dict cache of column name -> inferred format, filled in for each detected column
+                      and reused on later calls so a column is only sampled once
+        
+    output: 
+        date_list: returns names of columns in df likely to be in date format
+    
+    """
+    
+    if date_formats is None:
+        date_formats = {}
 
-    test = df.select_dtypes(include=['object'])
     date_list = list(df.select_dtypes(include=['datetime']).columns)
     
-    for col in test.columns:
+    for col in [col for col in df.columns if is_text_dtype(df[col].dtype)]:
+        if col in date_formats:
+            date_list.append(col)
+            continue
+        
+        sample = date_sample(df[col], sample_size)
+        if len(sample) == 0:
+            continue
+        
         try:
-            df[col] = pd.to_datetime(df[col])
+            fmt = infer_date_format(sample)
+        except (ValueError, TypeError, OverflowError):
+            continue
+        
+        # the sample can miss values of another shape, e.g. a free text column that starts with dates
+        parsed = pd.to_datetime(df[col], format = fmt, errors = 'coerce').notna().sum()
+        if parsed >= min_parsed * df[col].notna().sum():
+            date_formats[col] = fmt
             date_list.append(col)
-        except:
-            pass
+    
     return date_list
 
-class Data_Prep: # this takes a while, could make the df objects a bit more efficient by fixing how they are used in the config and graph generating steps
+def convert_dates(df, date_formats):
+    """
+    Desc: converts detected date columns in place using the format inferred for each column. Values that do not
+          parse with it (date_detect only checks a sample) become NaT
+    
+    Params:
+        df: input dataframe
+        date_formats: dict of column name -> format as filled in by date_detect
+        
+    output: 
+        df: the same dataframe with the date columns converted to datetime
+    
+    """
+    
+    for col, fmt in date_formats.items():
+        df[col] = pd.to_datetime(df[col], format = fmt, errors = 'coerce')
+    
+    return df
+
+def is_text_dtype(dtype):
+    # object columns, and the string dtype pandas 3 gives text read from csv or built into a dataframe
+    return pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+def compact_series(series):
+    """
+    Desc: stores a column in the smallest safe representation
+    
+    Params:
+        series: column to compact
+        
+    output: 
+        text columns as category dtype, integers downcast to the smallest integer width and floats downcast to float32
+        only when no value changes, any other column is returned as is
+    
+    """
+    
+    if is_text_dtype(series.dtype):
+        return series.astype('category')
+    
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return pd.to_numeric(series, downcast = 'integer')
+    
+    if series.dtype == 'float64':
+        small = series.astype('float32')
+        if ((small.astype('float64') == series) | series.isna()).all():
+            return small
+    
+    return series
+
+def memory_mb(df):
+    # deep memory usage of a dataframe in megabytes
+    return df.memory_usage(deep = True).sum() / 1024**2
 
-    def __init__(self, df, target_var = '', id_threshold = 0.5, null_threshold = 0.99):
+class Column_Subset:
+    """
+    Desc: 
+        Read-only view of a subset of columns of a shared dataframe, used by the compact Data_Prep mode in place of
+        copied df_numeric/df_cat frames. Supports the column access used by pivot_index; to_frame() materialises a copy.
+    
+    Params:
+        store: shared dataframe holding the data
+        columns: list of columns visible through the view
+    
+    """
+    
+    def __init__(self, store, columns):
+        self.store = store
+        self.columns = pd.Index(columns)
+    
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self.columns:
+                raise KeyError(key)
+        elif not set(key) <= set(self.columns):
+            raise KeyError(list(set(key) - set(self.columns)))
+        return self.store[key]
+    
+    def __len__(self):
+        return len(self.store)
+    
+    def __repr__(self):
+        return "Column_Subset of " + str(len(self.columns)) + " columns x " + str(len(self.store)) + " rows"
+    
+    @property
+    def dtypes(self):
+        return self.store.dtypes[self.columns]
+    
+    def head(self, n = 5):
+        return self.store[list(self.columns)].head(n)
+    
+    def to_frame(self):
+        return self.store[list(self.columns)].copy()
+
+class Data_Prep: # could make the df objects a bit more efficient by fixing how they are used in the config and graph generating steps
+
+    def __init__(self, df, target_var = '', id_threshold = 0.5, null_threshold = 0.99, compact = False, sketch = False, profiler = None,
+                 error = 0.01, exact_limit = 10000):
+        """
+        Desc: 
+            Profiles the dataframe, lists the columns to exclude from analysis and splits the rest into numeric and categorical subsets
+            
+        Params:
+            df: raw dataframe
+            target_var: name of the target variable (default allows regular histogram tables to be generated)
+            id_threshold: ratio of distinct values to rows above which a column is treated as an ID
+            null_threshold: share of missing rows above which a column is treated as empty
+            compact: keeps a single compacted copy of the analysed columns (categories and downcast numerics) in self.df, 
+                     with df_numeric/df_cat as Column_Subset views over it instead of copies
+            sketch: profiles with constant memory distinct count sketches (see sketch_profile_columns) instead of exact counts
+            profiler: optional Stage_Profiler, records the profile stage per column and the date_detect and compact steps
+            error, exact_limit: HyperLogLog error and exact distinct count limit of the sketches in sketch mode
+        
+        """
         
         self.df = df
         self.target_var = target_var
+        self.compact = compact
         
-        self.Ids_cats = [col for col in df.columns if len(df[col].unique())/(len(df[col].dropna())+1) >= id_threshold]
-        print("detected " + str(len(self.Ids_cats)) + " ID variables:")
-        print(self.Ids_cats)
+        # single pass over every column, replaces the repeated unique/dropna/groupby scans
+        if sketch:
+            self.profile = sketch_profile_columns(df, target_var, error, exact_limit)
+        else:
+            self.profile = profile_columns(df, target_var)
+        Ids_cats, trivial, null_cols, num_exclude = profile_exclusions(self.profile, id_threshold, null_threshold)
+        
+        if profiler is not None:
+            for col, row in self.profile.iterrows():
+                profiler.record('profile', col, row['seconds'], row['n_rows'], row['n_unique'], row.get('peak_mb', np.nan))
+        
+        self.Ids_cats = Ids_cats
         
         # flags/trivial variables
-        self.trivial = [col for col in df.columns if len(df[col].dropna().value_counts()) == 1]
-        print("detected " + str(len(self.trivial)) + " trivial variables (only one unique value):")
-        print(self.trivial)
+        self.trivial = trivial
         
-        #likely date columns
-        self.date_cols = date_detect(df)
-        print("detected " + str(len(self.date_cols)) + " date variables:")
-        print(self.date_cols)
+        #likely date columns, df is left unconverted (see convert_dates)
+        start = time.time()
+        meter = Memory_Meter()
+        self.date_formats = {}
+        self.date_cols = date_detect(df, date_formats = self.date_formats)
+        if profiler is not None:
+            profiler.record('date_detect', '', time.time() - start, len(df), len(self.date_cols), meter.lap())
         
         #empty variables exclusion list
-        self.null_cols = [col for col in df.columns if len(df[col].dropna())/len(df) <= (1 - null_threshold) ]
-        print("detected " + str(len(self.null_cols)) + " heavy null variables:")
-        print(self.null_cols)
+        self.null_cols = null_cols
         
         # Excludes analysing numerical columns that are completely missing in one of the target classes
-        try:
-            self.num_exclude = [col for col in df.select_dtypes(include=['float64', 'int64']).columns if len(df.groupby([col, target_var]).size().unstack().fillna(0).columns) < 2]
-        except KeyError:
-            self.num_exclude =[]
-        print("detected " + str(len(self.num_exclude)) + " variables which are missing in a level of the class:")
-        print(self.num_exclude)
+        if target_var in df.columns:
+            self.num_exclude = num_exclude
+        else:
+            self.num_exclude = []
         
-
-        self.total_exclude = self.Ids_cats + self.trivial + self.date_cols + self.null_cols + self.num_exclude
+        report_exclusions(self)
+        
+        print("profiled " + str(len(self.profile)) + " columns in " + str(round(self.profile['seconds'].sum(), 2)) + "s, slowest:")
+        print(self.profile['seconds'].sort_values(ascending = False).head(5))
         
         
         #Sets up Column Lists sorted by categorical/numeric, while excluding columns listed in Section
 
         # set up subsets
-        self.df_numeric = df[[col for col in df.columns if col != target_var and col not in self.total_exclude]].select_dtypes(include=['float64', 'int64']).copy()
-        self.df_cat = df[[col for col in df.columns if col != target_var and col not in self.total_exclude]].select_dtypes(include=['object']).copy()
-
-        self.numeric_cols = self.df_numeric.columns
-        self.cat_cols = self.df_cat.columns
+        keep = [col for col in df.columns if col != target_var and col not in self.total_exclude]
+        self.numeric_cols = pd.Index([col for col in keep if df[col].dtype in ['float64', 'int64']])
+        self.cat_cols = pd.Index([col for col in keep if is_text_dtype(df[col].dtype)])
         
-        # adding target to front of each subset
-        try:
-            self.df_numeric.insert(loc = 0, column = self.target_var, value = self.df[[self.target_var]])
-            self.df_cat.insert(loc = 0, column = self.target_var, value = self.df[[self.target_var]])
-        except KeyError:
+        has_target = target_var in df.columns
+        if not has_target:
             print("Histograms Only")
+        
+        if compact:
+            start = time.time()
+            meter = Memory_Meter()
+            before = memory_mb(df)
+            
+            store_cols = ([target_var] if has_target else []) + list(self.numeric_cols) + list(self.cat_cols)
+            self.df = pd.DataFrame({col: compact_series(df[col]) for col in store_cols}, index = df.index)
+            
+            # detected date columns are kept as they are, so convert_dates can still parse them
+            for col in self.date_cols:
+                self.df[col] = df[col]
+            
+            print("compact store: " + str(round(before, 1)) + "MB -> " + str(round(memory_mb(self.df), 1)) + "MB")
+            if profiler is not None:
+                profiler.record('compact', '', time.time() - start, len(df), len(store_cols), meter.lap())
+            
+            # adding target to front of each subset
+            target_front = [target_var] if has_target else []
+            self.df_numeric = Column_Subset(self.df, target_front + list(self.numeric_cols))
+            self.df_cat = Column_Subset(self.df, target_front + list(self.cat_cols))
+        
+        else:
+            self.df_numeric = df[list(self.numeric_cols)].copy()
+            self.df_cat = df[list(self.cat_cols)].copy()
+            
+            # adding target to front of each subset
+            if has_target:
+                self.df_numeric.insert(loc = 0, column = self.target_var, value = self.df[self.target_var])
+                self.df_cat.insert(loc = 0, column = self.target_var, value = self.df[self.target_var])
     
-    def define_target(self):
+    def convert_dates(self):
+        # converts the detected date columns of the full dataframe using the cached formats
+        convert_dates(self.df, self.date_formats)
+    
+    def define_target(self, desired_target = None):
+        """
+        Desc: 
+            For a multiclass target, relabels the target as desired class (1) vs the rest (0) so the binary
+            graph steps can run. The original classes are kept in self.class_target for class_pivots.
+            
+        Params:
+            desired_target: class to analyse (default prompts for it)
+        
+        """
+        
         target_vals = list(self.df[self.target_var].unique())
         print(target_vals)
 
         if len(target_vals) > 2:
-            print('input desired target class') 
-            desired_target = str(input())
-
-            self.df[self.target_var] = ['target' if i == desired_target else 'non_target' for i in self.df[self.target_var] ]
-            self.df_numeric[self.target_var] = self.df[self.target_var]
-            self.df_cat[self.target_var] = self.df[self.target_var]
+            if desired_target is None:
+                print('input desired target class') 
+                desired_target = str(input())
+            
+            # input() returns text, so the class is matched on its string form
+            self.class_target = self.df[self.target_var].copy()
+            self.desired_target = desired_target
+            self.df[self.target_var] = (self.class_target.astype(str) == str(desired_target)).astype('int64')
             
-            self.multiclass_ind = 1 #functionality to be added using this indicator
+            # compact views read the target straight from self.df
+            if not self.compact:
+                self.df_numeric[self.target_var] = self.df[self.target_var]
+                self.df_cat[self.target_var] = self.df[self.target_var]
+            
+            self.multiclass_ind = 1
 
         else:
             self.multiclass_ind = 0
             print('not multiclass')
+    
+    def class_pivots(self, columns, n_jobs = 1, profiler = None):
+        """
+        Desc: multiclass pivots of the original target classes (after define_target), for one_vs_rest/one_vs_rest_index
+        
+        Params:
+            columns: list of columns e.g. cat_cols or numeric_cols
+            n_jobs: number of worker processes
+            profiler: optional Stage_Profiler
             
-    def label_target(self):
+        output: 
+            pivots: dict of column -> dataframe of counts with one column per class
+        
+        """
+        
+        return class_pivot_index(self.df, columns, self.class_target, n_jobs, profiler)
+            
+    def label_target(self, target_types = None):
         # enter names for what your targets mean. do based on the order shown by the previous cell
+        # target_types: list of the two labels, given up front (e.g. from a batch run spec) instead of prompted for
+        if target_types is not None:
+            self.target_types = list(target_types)
+            return
+        
         target_vals = list(self.df[self.target_var].unique())
         print(target_vals)
         
@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 import math 
 
+from src.profiling import Memory_Meter
+
 
 #repetitive check if input is a number
 def int_check_input(question):
@@ -51,11 +53,434 @@ def closest_value(input_list, input_value):
     return arr[i]
 
 
+def closest_sorted_value(sorted_values, input_value):
+    """
+    Desc: closest_value for an ascending array of unique values, found by binary search instead of a full scan
+    
+    Params:
+        sorted_values: ascending numpy array of unique values (e.g. from np.unique)
+        input_value: number to check closest value
+        
+    output: 
+        returns closest value from sorted_values to input_value, ties go to the larger value as closest_value does on a descending list
+    
+    """
+    
+    if np.isnan(input_value):
+        return sorted_values[-1]
+    
+    i = np.searchsorted(sorted_values, input_value)
+    if i == 0:
+        return sorted_values[0]
+    if i == len(sorted_values):
+        return sorted_values[-1]
+    
+    below, above = sorted_values[i - 1], sorted_values[i]
+    return above if abs(above - input_value) <= abs(below - input_value) else below
+
+def numeric_defaults(df, cols, target_var = ''):
+    """
+    Desc: computes the default upper_class, lower_class and bin_length of every numeric column with one quantile call
+    
+    Params:
+        df: dataframe to analyse
+        cols: numeric columns
+        target_var: name of target variable, quantiles are taken over the target == 1 rows (default uses all rows)
+        
+    output: 
+        default_config_numeric: dataframe indexed by column with upper_class, lower_class and bin_length
+    
+    """
+    
+    cols = list(cols)
+    
+    if target_var != '':
+        target_list = df.loc[df[target_var] == 1, cols]
+    else:
+        target_list = df[cols]
+    
+    quantiles = target_list.quantile([0.05, 0.25, 0.75, 0.95])
+    counts = target_list.count()
+    
+    default_config_numeric = pd.DataFrame(np.zeros((len(cols),3)), columns = ['upper_class','lower_class','bin_length']).set_index(pd.Index(cols))
+    
+    upper, lower = [], []
+    for col in cols:
+        # sorted once per column and shared by both lookups
+        sorted_values = np.unique(df[col].dropna().values)
+        upper.append(closest_sorted_value(sorted_values, quantiles.loc[0.95, col]))
+        lower.append(closest_sorted_value(sorted_values, quantiles.loc[0.05, col]))
+    
+    default_config_numeric['upper_class'] = upper
+    default_config_numeric['lower_class'] = lower
+    
+    # Freedman-Diaconis rule
+    default_config_numeric['bin_length'] = [math.ceil(2*(quantiles.loc[0.75, col] - quantiles.loc[0.25, col])/(counts[col]**(1/3))) for col in cols]
+    
+    return default_config_numeric
+
+
+def sketch_numeric_defaults(sketches, cols):
+    """
+    Desc: numeric_defaults computed from Quantile_Sketch objects (e.g. built chunk by chunk or merged from partitions)
+          instead of an in-memory dataframe. The quantile values returned by the sketches already are values from the data,
+          so no closest value lookup is needed
+    
+    Params:
+        sketches: dict of column -> Quantile_Sketch over the target == 1 rows (all rows when there is no target)
+        cols: numeric columns
+        
+    output: 
+        default_config_numeric: dataframe in the numeric_defaults layout, within the sketch rank error of the exact defaults
+    
+    """
+    
+    cols = list(cols)
+    quantiles = pd.DataFrame({col: sketches[col].quantile([0.05, 0.25, 0.75, 0.95]) for col in cols}, index = [0.05, 0.25, 0.75, 0.95])
+    
+    default_config_numeric = pd.DataFrame(np.zeros((len(cols),3)), columns = ['upper_class','lower_class','bin_length']).set_index(pd.Index(cols))
+    default_config_numeric['upper_class'] = [quantiles.loc[0.95, col] for col in cols]
+    default_config_numeric['lower_class'] = [quantiles.loc[0.05, col] for col in cols]
+    
+    # Freedman-Diaconis rule
+    default_config_numeric['bin_length'] = [math.ceil(2*(quantiles.loc[0.75, col] - quantiles.loc[0.25, col])/(sketches[col].count()**(1/3))) for col in cols]
+    
+    return default_config_numeric
+
+def cat_fingerprint(df, cols):
+    """
+    Desc: per-column fingerprint of categorical columns used to spot changed data when refreshing the config
+    
+    Params:
+        df: dataframe to analyse
+        cols: categorical columns
+        
+    output: 
+        fingerprint: dataframe indexed by column with dtype and n_levels (distinct values including missing)
+    
+    """
+    
+    return pd.DataFrame({'dtype': [str(df[col].dtype) for col in cols],
+                         'n_levels': [df[col].nunique(dropna = False) for col in cols]}, index = pd.Index(cols))
+
+def num_fingerprint(df, cols, target_var = ''):
+    """
+    Desc: per-column fingerprint of numeric columns used to spot changed data when refreshing the config
+    
+    Params:
+        df: dataframe to analyse
+        cols: numeric columns
+        target_var: name of target variable, the quantile summary is taken over the target == 1 rows as for the defaults
+        
+    output: 
+        fingerprint: dataframe indexed by column with dtype, count and the 5/25/75/95% quantiles
+    
+    """
+    
+    cols = list(cols)
+    
+    if target_var != '':
+        target_list = df.loc[df[target_var] == 1, cols]
+    else:
+        target_list = df[cols]
+    
+    fingerprint = target_list.quantile([0.05, 0.25, 0.75, 0.95]).transpose()
+    fingerprint.columns = ['q05', 'q25', 'q75', 'q95']
+    fingerprint.insert(0, 'count', target_list.count())
+    fingerprint.insert(0, 'dtype', [str(df[col].dtype) for col in cols])
+    return fingerprint
+
+def sketch_num_fingerprint(sketches, cols):
+    # num_fingerprint from Quantile_Sketch objects
+    cols = list(cols)
+    fingerprint = pd.DataFrame([sketches[col].quantile([0.05, 0.25, 0.75, 0.95]) for col in cols], index = pd.Index(cols), columns = ['q05', 'q25', 'q75', 'q95'])
+    fingerprint.insert(0, 'count', [sketches[col].count() for col in cols])
+    fingerprint.insert(0, 'dtype', [sketches[col].dtype for col in cols])
+    return fingerprint
+
+def drifted_cols(saved, fingerprint, drift_tolerance = 0.05):
+    """
+    Desc: lists the columns whose data has drifted since their fingerprint was saved
+    
+    Params:
+        saved: previously saved fingerprints
+        fingerprint: current fingerprints
+        drift_tolerance: relative change of any numeric fingerprint field that counts as drift
+        
+    output: 
+        list of columns with a changed dtype or a fingerprint field that moved by more than drift_tolerance
+    
+    """
+    
+    cols = [col for col in fingerprint.index if col in saved.index]
+    fields = [f for f in fingerprint.columns if f != 'dtype']
+    
+    old = saved.loc[cols, fields].astype('float64').values
+    new = fingerprint.loc[cols, fields].astype('float64').values
+    
+    scale = np.where(old != 0, np.abs(old), 1)
+    with np.errstate(invalid = 'ignore'):
+        moved = (np.abs(new - old) / scale > drift_tolerance) | (np.isnan(old) != np.isnan(new))
+    
+    changed = moved.any(axis = 1) | (saved.loc[cols, 'dtype'].astype(str).values != fingerprint.loc[cols, 'dtype'].values)
+    return [col for col, c in zip(cols, changed) if c]
+
+def refresh_config(config, saved, fingerprint, defaults, drift_tolerance = 0.05):
+    """
+    Desc: 
+        Brings a saved config up to date with the current columns. Default rows are only computed for new columns
+        and for columns whose data drifted, rows the user edited (that differ from the defaults saved alongside
+        the fingerprint) are always kept.
+    
+    Params:
+        config: saved config (None if there is no config file yet)
+        saved: saved fingerprint file with a default_<setting> column per config setting (None if there is none yet;
+               rows of an existing config without fingerprints are then treated as user edited)
+        fingerprint: current fingerprints of the columns
+        defaults: function taking a list of columns and returning their default config rows
+        drift_tolerance: as per drifted_cols
+        
+    output: 
+        config: updated config
+        saved: updated fingerprint file
+    
+    """
+    
+    cols = list(fingerprint.index)
+    
+    if config is None:
+        new_cols = cols
+        config = defaults([])
+    else:
+        missing = [col for col in config.index if col not in cols]
+        if missing:
+            print("Cols in config file not found in current column list: " + str(missing))
+        new_cols = [col for col in cols if col not in config.index]
+    
+    settings = list(config.columns)
+    default_cols = ['default_' + c for c in settings]
+    
+    if saved is None:
+        saved = pd.DataFrame(columns = list(fingerprint.columns) + default_cols)
+    
+    drifted = drifted_cols(saved, fingerprint.loc[[col for col in cols if col in config.index]], drift_tolerance)
+    
+    # a row differing from the defaults it was generated with was edited by the user (rows without saved defaults count as edited)
+    edited = [col for col in drifted if (config.loc[col, settings].values.astype('float64') != saved.loc[col, default_cols].values.astype('float64')).any()]
+    
+    regen = new_cols + [col for col in drifted if col not in edited]
+    
+    print(str(len(new_cols)) + " new cols, " + str(len(drifted) - len(edited)) + " drifted cols regenerated, " + 
+          str(len(cols) - len(regen) - len(edited)) + " cols unchanged")
+    if edited:
+        print("drifted cols kept as user edited: " + str(edited))
+    
+    new_rows = defaults(regen)
+    if len(config) == 0:
+        config = new_rows
+    elif regen:
+        config = pd.concat([config.drop([col for col in regen if col in config.index]), new_rows]).reindex(list(config.index) + new_cols)
+    
+    # fingerprints stay those of the data the defaults were built from, so small drifts add up to a refresh. Only
+    # regenerated rows, and rows without a saved fingerprint yet, take the current one
+    saved = saved.reindex(cols)[list(fingerprint.columns) + default_cols]
+    fresh = [col for col in cols if col in regen or pd.isna(saved.loc[col, 'dtype'])]
+    for field in fingerprint.columns:
+        saved.loc[fresh, field] = fingerprint.loc[fresh, field]
+    saved.loc[regen, default_cols] = new_rows[settings].values
+    
+    return config, saved
+
+def set_config_values(config, values):
+    """
+    Desc: non-interactive equivalent of the change prompts
+    
+    Params:
+        config: config dataframe, edited in place
+        values: dict of column -> {setting: value}
+    
+    """
+    
+    for col, settings in values.items():
+        if col not in config.index:
+            raise KeyError(str(col) + " is not in the config")
+        for setting, value in settings.items():
+            if setting not in config.columns:
+                raise KeyError(str(setting) + " is not a config setting, expected one of " + str(list(config.columns)))
+            config.loc[col, setting] = value
+
+def cat_limit(config):
+    """
+    Desc: how many levels of a categorical column a config row shows, so pivots can be collapsed to those levels
+    
+    Params:
+        config: categorical config row
+    
+    output:
+        (k, keep_other, ascending): the k levels with the largest (smallest when ascending) sort count are shown, and
+        keep_other is True when the rest is shown as the 'other/unsp' row. None when every level is needed
+        (custom_sort, no asc/desc order or no limit)
+    
+    """
+    
+    if config['custom_sort'] == 1 or config['asc/desc'] == 0:
+        return None
+    
+    soft, hard = int(config['soft_cat_limit']), int(config['hard_cat_limit'])
+    if soft == 0 and hard == 0:
+        return None
+    
+    # a hard limit at or below the soft limit cuts the 'other/unsp' row off again
+    if soft != 0 and (hard == 0 or hard > soft):
+        return soft, True, bool(config['asc/desc'] == 1)
+    return hard, False, bool(config['asc/desc'] == 1)
+
+def num_bins(config):
+    # bin_length, upper_class and lower_class of a numeric config row as a dict, None when none of them is set
+    bins = {setting: float(config[setting]) for setting in ['bin_length', 'upper_class', 'lower_class']}
+    return bins if any(bins.values()) else None
+
+def bin_codes(values, bin_length, upper_class = 0, lower_class = 0, codes = None):
+    """
+    Desc: places every value of a numeric column under its config row, the one binning rule shared by bin_pivot,
+          binned_pivot, bin_long and Histogram_Pyramid. Values up to lower_class go to the lower_class row and values
+          from upper_class up to the upper_class row. With a bin_length the rest fall in bin k, which holds
+          (origin + k*bin_length, origin + (k+1)*bin_length], anchored at lower_class when it is set and else at the
+          smallest value (the origin itself falls in bin 0). The last edge is capped at upper_class: the bin reaching
+          upper_class is part of the upper_class row. Every row is so labelled by its right edge, and labels are unique
+          and sorted. A setting of 0 switches it off
+    
+    Params:
+        values: numeric values
+        bin_length, upper_class, lower_class: settings, or per column arrays when codes is set
+        codes: column of every value, to bin the values of several columns at once (default one column)
+        
+    output: 
+        k: bin of every value (0 outside the bins)
+        below, above: masks of the values in the lower_class and upper_class rows
+        origin: anchor of the bins, per column when codes is set
+    
+    """
+    
+    values = np.asarray(values, dtype = 'float64')
+    if codes is None:
+        origin = lower_class if lower_class != 0 else (values.min() if len(values) else np.nan)
+        row_origin = origin
+    else:
+        origin = np.full(len(bin_length), np.inf)
+        np.minimum.at(origin, codes, values)
+        origin = np.where(lower_class != 0, lower_class, origin)
+        row_origin = origin[codes]
+        bin_length, upper_class, lower_class = bin_length[codes], upper_class[codes], lower_class[codes]
+    
+    bin_length = np.broadcast_to(np.asarray(bin_length, dtype = 'float64'), values.shape)
+    upper_class = np.broadcast_to(np.asarray(upper_class, dtype = 'float64'), values.shape)
+    lower_class = np.broadcast_to(np.asarray(lower_class, dtype = 'float64'), values.shape)
+    row_origin = np.broadcast_to(np.asarray(row_origin, dtype = 'float64'), values.shape)
+    
+    below = (lower_class != 0) & (values <= lower_class)
+    above = (upper_class != 0) & (values >= upper_class)
+    
+    # bin number from the distance to the origin in bin lengths, rounded so values on an edge are not pushed up by float error
+    k = np.zeros(len(values), dtype = 'int64')
+    in_bins = ~below & ~above & (bin_length != 0)
+    o, b = row_origin[in_bins], bin_length[in_bins]
+    k[in_bins] = np.clip(np.ceil(np.round((values[in_bins] - o) / b, 9)).astype('int64') - 1, 0, None)
+    
+    # values in the bin whose right edge reaches upper_class
+    capped = upper_class[in_bins] != 0
+    reach = capped & (k[in_bins] + 1 >= np.round((upper_class[in_bins] - o) / b, 9))
+    above[np.flatnonzero(in_bins)[reach]] = True
+    k[above] = 0
+    
+    return k, below, above, origin
+
+def round_labels(labels, fixed = ()):
+    """
+    Desc: rounds bin labels the way pd.cut rounds its bin edges: to 3 decimals (3 significant digits below 1), with more
+          digits when that would make two labels, or a label and one of the fixed labels, equal
+    
+    Params:
+        labels: bin labels of one column
+        fixed: labels the bins sit between (the lower_class and upper_class settings in use)
+        
+    output: 
+        rounded labels
+    
+    """
+    
+    labels = np.asarray(labels, dtype = 'float64')
+    fixed = np.asarray(fixed, dtype = 'float64')
+    whole = np.modf(labels)[1]
+    
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        leading = np.floor(np.log10(np.abs(labels - whole)))
+    for precision in range(3, 20):
+        digits = np.where((whole == 0) & np.isfinite(leading), -leading - 1 + precision, precision)
+        scale = 10.0**digits
+        rounded = np.where(np.isfinite(labels) & (labels != 0), np.round(labels * scale) / scale, labels)
+        if len(np.unique(rounded)) == len(rounded) and not np.isin(rounded, fixed).any():
+            return rounded
+    return labels
+
+def bin_labels(origin, k, bin_length, fixed = ()):
+    # bins are labelled by their right edge, rounded as per round_labels
+    return round_labels(origin + (np.asarray(k) + 1) * bin_length, fixed)
+
+def bin_counts(values, counts, bin_length = 0, upper_class = 0, lower_class = 0):
+    """
+    Desc: sums per value counts into the rows of a numeric config: the lower_class row, the values or the bins (every bin
+          between the first and last occupied one, empty bins included) and the upper_class row (see bin_codes)
+    
+    Params:
+        values: sorted numeric values
+        counts: 2d array of counts, one row per value
+        bin_length, upper_class, lower_class: as per the Numerical_Graph_Config settings
+        
+    output: 
+        rows: 2d array of counts, one row per label
+        labels: float array of row labels
+    
+    """
+    
+    values = np.asarray(values, dtype = 'float64')
+    k, below, above, origin = bin_codes(values, bin_length, upper_class, lower_class)
+    regular = ~below & ~above
+    rows, labels = [], []
+    
+    if lower_class != 0:
+        rows.append(counts[below].sum(axis = 0))
+        labels.append(lower_class)
+    
+    if bin_length != 0 and regular.any():
+        k = k[regular]
+        binned = np.zeros((k.max() - k.min() + 1, counts.shape[1]), dtype = counts.dtype)
+        np.add.at(binned, k - k.min(), counts[regular])
+        rows.extend(binned)
+        labels.extend(bin_labels(origin, np.arange(k.min(), k.max() + 1), bin_length, [c for c in [lower_class, upper_class] if c != 0]))
+    else:
+        rows.extend(counts[regular])
+        labels.extend(values[regular])
+    
+    if upper_class != 0:
+        rows.append(counts[above].sum(axis = 0))
+        labels.append(upper_class)
+    
+    return np.array(rows, dtype = counts.dtype).reshape(len(rows), counts.shape[1]), np.array(labels, dtype = 'float64')
+
+def read_config(path):
+    # loads a saved config or fingerprint file, None if it does not exist
+    try:
+        return pd.read_csv(path, index_col=0)
+    except FileNotFoundError:
+        return None
+
+
 class Categorical_Graph_Config:
 
-# delete previous config file if you want auto-generate a new one on updated data
+# new cols and cols whose data drifted get fresh defaults, delete previous config file if you want to regenerate every col
 
-    def __init__(self, df, cols, root_folder, default_max_cat = 10):
+    def __init__(self, df, cols, root_folder, default_max_cat = 10, drift_tolerance = 0.05, profiler = None):
         """
         Desc: 
             Loads existing category graph config or creates one based on basic rules
@@ -75,44 +500,45 @@ class Categorical_Graph_Config:
             Root_folder: parent directory folder (default specified from section 2)
             cols: column list to assign configs (default assigned as cat_cols var from Section 3)
             default_max_cat: when creating a new config file, provides the number for the soft_cat_limit logic
+            drift_tolerance: relative change in a col's number of levels that triggers new defaults (see refresh_config)
+            profiler: optional Stage_Profiler, records the config stage
 
         output: 
             default_config_cat: dataframe object with configuration values for each category column
 
         """
         
+        start = time.time()
+        meter = Memory_Meter()
         self.root_folder = root_folder
         
-        try:
-            self.default_config_cat = pd.read_csv(self.root_folder + "/Config/cat_config.csv", index_col=0)
-
-            if len(self.default_config_cat) > len(cols):
-                diff = list(set(self.default_config_cat.columns) - set(cols))
-                print("Cols not found in category list: " + str(diff))
-                print("revisit original dataframe to check for missing cols, otherwise delete existing config file")
-
-            elif len(self.default_config_cat) < len(cols):    
-                diff = list(set(cols) - set(self.default_config_cat.columns))
-                print("New cols not in previously saved config file: " + str(diff))
-                print("revisit original dataframe to check for missing cols, otherwise delete existing config file")
-
-            
-        except FileNotFoundError:
-
-            self.default_config_cat = pd.DataFrame(np.zeros((len(cols),4)), columns = ['custom_sort','asc/desc','soft_cat_limit', 'hard_cat_limit']).set_index(cols)
-            self.default_config_cat['soft_cat_limit'] = [0 if len(df[col].unique()) <= default_max_cat else default_max_cat for col in cols ] # setting default max at 10 if # of levels in category exceeds 10
-            self.default_config_cat['asc/desc'] = -1 # descending is default
-            
-            self.default_config_cat.to_csv(self.root_folder + "/Config/cat_config.csv")
-            
-            print("config file not loaded. default created & saved")
-            print(self.default_config_cat)
-            
-            
+        config = read_config(self.root_folder + "/Config/cat_config.csv")
+        if config is None:
+            print("config file not loaded. Creating Default File")
+        
+        fingerprint = cat_fingerprint(df, cols)
+        
+        def defaults(new_cols):
+            default_config_cat = pd.DataFrame(np.zeros((len(new_cols),4)), columns = ['custom_sort','asc/desc','soft_cat_limit', 'hard_cat_limit']).set_index(pd.Index(new_cols))
+            default_config_cat['soft_cat_limit'] = [0 if fingerprint.loc[col, 'n_levels'] <= default_max_cat else default_max_cat for col in new_cols] # setting default max at 10 if # of levels in category exceeds 10
+            default_config_cat['asc/desc'] = -1 # descending is default
+            return default_config_cat
+        
+        self.default_config_cat, saved = refresh_config(config, read_config(self.root_folder + "/Config/cat_config_fingerprint.csv"), 
+                                                        fingerprint, defaults, drift_tolerance)
+        
+        self.default_config_cat.to_csv(self.root_folder + "/Config/cat_config.csv")
+        saved.to_csv(self.root_folder + "/Config/cat_config_fingerprint.csv")
+        
+        if profiler is not None:
+            profiler.record('config', '', time.time() - start, len(df), len(cols), meter.lap())
+        
+        print("config file saved")
+        print(self.default_config_cat)
                
 
     # changing specific values in config file
-    def change(self, cols_to_change = []):
+    def change(self, cols_to_change = [], values = None):
         """
         Desc: 
             Changes config file based on list and saves config file for future runs
@@ -122,6 +548,7 @@ class Categorical_Graph_Config:
             existing_config: previous config file to edit
             cols_to_change: list of columns to change in the config file (default is no changes)
             Root_folder: parent directory folder (default specified from section 2)
+            values: dict of column -> {setting: value} applied without prompting e.g. {'region': {'soft_cat_limit': 5}}
 
 
         output: 
@@ -154,13 +581,16 @@ class Categorical_Graph_Config:
                 n4 = int_check_input("hard_cat_limit")
                 self.default_config_cat.loc[col] = [n1, n2, n3, n4]
 
+        if values is not None:
+            set_config_values(self.default_config_cat, values)
+
         self.default_config_cat.to_csv(self.root_folder + "/Config/cat_config.csv")
         
         print(self.default_config_cat)
 
 class Numerical_Graph_Config:        
         
-    def __init__(self, df, cols, target_var, root_folder):
+    def __init__(self, df, cols, target_var, root_folder, drift_tolerance = 0.05, sketches = None, profiler = None):
         """
         Desc: 
             Loads existing numerical graph config or creates one based on basic rules
@@ -177,53 +607,49 @@ class Numerical_Graph_Config:
             root_folder: number to check closest value (default assigned as root_folder var from Section 2)
             cols: column list to assign configs (default assigned as numeric_cols var from Section 3)
             target_var: name of target variable (default assigned as per global variable in Section 3)
+            drift_tolerance: relative change in a col's count or quantiles that triggers new defaults (see refresh_config)
+            sketches: optional dict of column -> Quantile_Sketch over the target rows (e.g. Streaming_Data_Prep.quantile_sketches),
+                      used in place of df for chunked or partitioned input (df can then be None)
+            profiler: optional Stage_Profiler, records the config stage
 
         output: 
             default_config_numeric: dataframe object with configuration values for each numerical column
 
         """    
+        start = time.time()
+        meter = Memory_Meter()
         self.root_folder = root_folder
         
-        try:
-            self.default_config_numeric = pd.read_csv(root_folder + "/Config/num_config.csv", index_col=0)
-
-            if len(self.default_config_numeric) > len(cols):
-                diff = list(set(self.default_config_numeric.columns) - set(cols))
-                print("Cols not found in category list: " + str(diff))
-
-            elif len(self.default_config_numeric) < len(cols):    
-                diff = list(set(cols) - set(self.default_config_numeric.columns))
-                print("New cols not in previously saved config file: " + str(diff))
-
-        except FileNotFoundError:
+        config = read_config(root_folder + "/Config/num_config.csv")
+        if config is None:
             print("config file not loaded. Creating Default File")
-
-            if target_var != '':
-                target_list = df.loc[df[target_var] == 1]
-            else:
-                target_list = df
-
-
-            self.default_config_numeric = pd.DataFrame(np.zeros((len(cols),3)), columns = ['upper_class','lower_class','bin_length']).set_index(cols)
-
-            print("calculating upper_class")
-            self.default_config_numeric['upper_class'] = [closest_value(list(df[col].dropna().sort_values(ascending = False).unique()), target_list[col].quantile(0.95)) for col in cols]
-
-            print("calculating lower_class")
-            self.default_config_numeric['lower_class'] = [closest_value(list(df[col].dropna().sort_values(ascending = False).unique()), target_list[col].quantile(0.05)) for col in cols]
-
-            print("calculating bin_length")
-            self.default_config_numeric['bin_length'] = [math.ceil(2*(target_list[col].quantile(0.75) - target_list[col].quantile(0.25))/(len(target_list[col].dropna())**(1/3))) for col in cols]
-
-            self.default_config_numeric.to_csv(self.root_folder + "/Config/num_config.csv")
-            
-            print("config file not loaded. default created & saved")
-            print(self.default_config_numeric)
-
         
+        def defaults(new_cols):
+            if new_cols:
+                print("calculating upper_class, lower_class and bin_length for " + str(len(new_cols)) + " cols")
+            if sketches is not None:
+                return sketch_numeric_defaults(sketches, new_cols)
+            return numeric_defaults(df, new_cols, target_var)
+        
+        if sketches is not None:
+            fingerprint = sketch_num_fingerprint(sketches, cols)
+        else:
+            fingerprint = num_fingerprint(df, cols, target_var)
+        
+        self.default_config_numeric, saved = refresh_config(config, read_config(root_folder + "/Config/num_config_fingerprint.csv"),
+                                                            fingerprint, defaults, drift_tolerance)
+        
+        self.default_config_numeric.to_csv(self.root_folder + "/Config/num_config.csv")
+        saved.to_csv(self.root_folder + "/Config/num_config_fingerprint.csv")
+        
+        if profiler is not None:
+            profiler.record('config', '', time.time() - start, len(df) if df is not None else np.nan, len(cols), meter.lap())
+        
+        print("config file saved")
+        print(self.default_config_numeric)
 
 
-    def change(self, cols_to_change = []):
+    def change(self, cols_to_change = [], values = None):
         """
         Desc: makes spot changes and saves the numerical config file
 
@@ -231,6 +657,7 @@ class Numerical_Graph_Config:
             cols: list of numerical columns
             existing_config: previous config file to edit
             cols_to_change: list of columns to change the config file for
+            values: dict of column -> {setting: value} applied without prompting e.g. {'age': {'bin_length': 5}}
 
 
         output: 
@@ -251,6 +678,9 @@ class Numerical_Graph_Config:
                 n3 = int_check_input("bin_length?")
                 self.default_config_numeric.loc[col] = [n1, n2, n3]
 
+        if values is not None:
+            set_config_values(self.default_config_numeric, values)
+
        
         self.default_config_numeric.to_csv(self.root_folder + "/Config/num_config.csv")
         print(self.default_config_numeric)
\ No newline at end of file
@@ -1,10 +1,33 @@
 import time
 import os
+import json
+import hashlib
+import traceback
+import tracemalloc
 import pandas as pd
 import numpy as np
 import matplotlib
 import seaborn as sns
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from src.profiling import Memory_Meter, start_tracing
+from src.graph_config import cat_limit, num_bins, bin_counts
+from src.lift import lift_tables
+
+
+def directory_setup(root_folder):
+    """
+    Desc: creates the output folders the config, graph and pivot steps write to
+    
+    Params:
+        root_folder: name of parent folder
+    
+    """
+    
+    for folder in ['/Config/custom_sort', '/Categorical', '/Numeric', '/Pivots']:
+        os.makedirs(root_folder + folder, exist_ok = True)
 
 #Generate custom sort list function
 def custom_sort(df):
@@ -41,102 +64,458 @@ def custom_sort(df):
     return order
 
 
-#long runtime means lots of cateogires: Recategorisation is necessary
-def cat_graph_generate(df, target_types, config_df, root_folder, columns = []):
+def sort_order(temp, cat, root_folder, sort_orders = None):
     """
-    Desc: 
-        Runs through the configuration file and treats the pivots, resulting in bar & line graphs
+    Desc: index order of a custom_sort column, taken from sort_orders, else the saved order, else prompted for and saved
     
     Params:
+        temp: pivot of the column
+        cat: column name
+        root_folder: parent folder holding Config/custom_sort
+        sort_orders: dict of column -> index order (as custom_sort returns)
+        
+    output: list of integers which specifies the index order
     
-        df: named dataframes which should be in pivot form already
-        columns: list of categorical columns, note this should be specified seperately from the df object (categorical col list is default as per Section 4)
-        target_types: the names of the two target names
-        config_df: configuration dataframe 
-        Root_folder: name of parent folder to save graphs
+    """
+    
+    my_file = Path(root_folder + "/Config/custom_sort/" + cat + ".csv")
+    
+    if sort_orders is not None and cat in sort_orders:
+        order = list(sort_orders[cat])
+        order_config = pd.DataFrame(order, columns = [cat])
+        order_config.to_csv(root_folder + "/Config/custom_sort/" + cat + ".csv", index = False)
+    elif my_file.is_file():
+        order = pd.read_csv(root_folder + "/Config/custom_sort/" + cat + ".csv").iloc[:,0].to_list()
+    else:
+        order = custom_sort(temp)
+        order_config = pd.DataFrame(order, columns = [cat])
+        order_config.to_csv(root_folder + "/Config/custom_sort/" + cat + ".csv", index = False)
+    
+    return order
+
+
+def cat_table(temp, cat, config, sort_col, order = None):
+    """
+    Desc: applies a categorical config row to a pivot
+    
+    Params:
+        temp: pivot of the column
+        cat: column name
+        config: config row of the column
+        sort_col: count column the asc/desc setting sorts by (second target type, or 'vals' for histograms), levels
+                  with equal counts keep their pivot order
+        order: custom sort order, used when custom_sort is on
         
-    output: it saves graphs to the directory
-        time_list: runtime for each graph to identify pain points
+    output: treated pivot
+    
     """
-    if columns == []:
-        columns = list(config_df.index)
     
-    time_list = []
+    rest = None
+    if 'other/unsp' in temp.index:
+        # remainder of the levels left out at pivot time (see pivot_index config_df)
+        rest = temp.loc[['other/unsp']]
+        temp = temp.drop(index = 'other/unsp')
+        limit = cat_limit(config)
+        if limit is None or not limit[1] or limit[0] != len(temp):
+            raise ValueError(str(cat) + " was collapsed to " + str(len(temp)) + " levels at pivot time, re-run pivot_index with the current config")
     
-    for cat in columns:
+    if config['custom_sort'] == 1:
         
-        start = time.time()
+        temp = temp.reset_index()
+        temp = temp.reindex(order)
+        temp = temp.set_index(cat)
         
-        config = config_df.loc[cat]
-        temp = df[cat]
+    elif config['asc/desc'] == -1: 
         
-        #Config based data adjustments
+        temp = temp.sort_values([sort_col], ascending=False, kind='stable')
         
-        if config['custom_sort'] == 1:
-            
-            my_file = Path(root_folder + "/Config/custom_sort/" + cat + ".csv")
-            
-            if my_file.is_file():
-                order = pd.read_csv(root_folder + "/Config/custom_sort/" + cat + ".csv").iloc[:,0].to_list()
-            else:
-                order = custom_sort(temp)
-                order_config = pd.DataFrame(order, columns = [cat])
-                order_config.to_csv(root_folder + "/Config/custom_sort/" + cat + ".csv", index = False)
-                
-           
-            temp = temp.reset_index()
-            temp = temp.reindex(order)
-            temp = temp.set_index(cat)
-            
-        elif config['asc/desc'] == -1: 
-            
-            temp = temp.sort_values([target_types[1]], ascending=False)
-            
-        elif config['asc/desc'] == 1:
-            
-            temp = temp.sort_values([target_types[1]], ascending=True) 
-            
-        if config['soft_cat_limit'] != 0:
-            
-            other = pd.DataFrame(temp.iloc[int(config['soft_cat_limit']):].sum(), columns = ['other/unsp']).transpose()
-            temp = temp.iloc[:int(config['soft_cat_limit'])]
-            temp = pd.concat([temp, other], ignore_index=False)
-        
-        if config['hard_cat_limit'] != 0:
-            
-            temp = temp.iloc[:config['hard_cat_limit']]
-                    
-        #By default divides second target_var (churn) entry type by first (non-churn)
-        temp['index'] = temp[target_types[1]].transform(lambda x: x/sum(x))/temp[target_types[0]].transform(lambda x: x/sum(x))
-        temp['index benchmark'] = 1
+    elif config['asc/desc'] == 1:
+        
+        temp = temp.sort_values([sort_col], ascending=True, kind='stable')
+        
+    if config['soft_cat_limit'] != 0:
+        
+        other = pd.DataFrame(pd.concat([temp.iloc[int(config['soft_cat_limit']):], rest]).sum(), columns = ['other/unsp']).transpose()
+        temp = temp.iloc[:int(config['soft_cat_limit'])]
+        temp = pd.concat([temp, other], ignore_index=False)
+    
+    if config['hard_cat_limit'] != 0:
+        
+        temp = temp.iloc[:int(config['hard_cat_limit'])]
+    
+    return temp
+
+
+def numeric_table(temp, config, count_cols, pyramid = None):
+    """
+    Desc: applies a numerical config row (bin_length, upper_class, lower_class) to a pivot
+    
+    Params:
+        temp: pivot of the column
+        config: config row of the column
+        count_cols: count columns of the pivot (target types, or ['vals'] for histograms)
+        pyramid: optional Histogram_Pyramid of the column, binned columns are then served from it
+        
+    output: treated pivot
+    
+    """
+    
+    if 'binned' in temp.attrs:
+        # binned at pivot time (see pivot_index config_df)
+        if temp.attrs['binned'] != num_bins(config):
+            raise ValueError(str(temp.index.name) + " was binned with " + str(temp.attrs['binned']) + " at pivot time, re-run pivot_index with the current config")
+        return temp[list(count_cols)]
+    
+    if pyramid is not None and config['bin_length'] != 0:
+        # re-aggregated from the stored histogram levels, the per value pivot is not re-binned
+        return pyramid.rebin(config['bin_length'], config['upper_class'], config['lower_class'])
+    
+    return bin_pivot(temp, count_cols, config['bin_length'], config['upper_class'], config['lower_class'])
+
+
+def bin_pivot(temp, count_cols, bin_length = 0, upper_class = 0, lower_class = 0):
+    """
+    Desc: bins a numeric pivot on numeric edges. Values up to lower_class are summed into one row labelled lower_class and
+          values from upper_class up into one row labelled upper_class. The rest are kept per value, or with a bin_length
+          fall into bins labelled by their right edge (see bin_codes and bin_counts). A setting of 0 switches it off
+    
+    Params:
+        temp: pivot of the column, indexed by sorted values
+        count_cols: count columns to sum (target types, or ['vals'] for histograms)
+        bin_length, upper_class, lower_class: as per the Numerical_Graph_Config settings
+        
+    output: dataframe of counts with a numeric index, rows in order lower_class row, values or bins, upper_class row
+    
+    """
+    
+    rows, labels = bin_counts(temp.index, temp[list(count_cols)].to_numpy(), bin_length, upper_class, lower_class)
+    return pd.DataFrame(rows, index = pd.Index(labels, dtype = 'float64', name = temp.index.name), columns = list(count_cols))
+
+
+class Chart_Template:
+
+    def __init__(self, figsize, index = True):
+        """
+        Desc:
+            Reusable chart drawn with plain matplotlib artists. The figure, axes, bars and lines are created once and
+            each graph only updates bar heights, line data and tick labels before saving, in place of the per graph
+            figure setup and seaborn calls. The look follows the seaborn bar and point plots it replaces.
+        
+        Params:
+            figsize: figure size in inches
+            index: draws the index and index benchmark lines on a second axis (False for histograms)
+        
+        """
         
-        #Graphing steps
         matplotlib.rc_file_defaults()
-        ax1 = sns.set_style(style=None, rc=None )
+        
+        # not registered with pyplot, so nothing is left open or displayed in the notebook
+        self.fig = Figure(figsize = figsize)
+        self.ax1 = self.fig.subplots()
+        self.bars = []
+        
+        self.ax2 = self.ax1.twinx() if index else None
+        if index:
+            # seaborn point plot sizing: line width 1.8 * scale, marker size and edge width in proportion to it
+            width = matplotlib.rcParams['lines.linewidth'] * 1.8
+            self.index_line, = self.ax2.plot([], [], marker = 'o', color = sns.color_palette()[0], linewidth = width, 
+                                             markersize = width * np.sqrt(2 * np.pi), markeredgewidth = width * 0.75)
+            self.benchmark_line, = self.ax2.plot([], [], marker = 'o', linestyle = '--', color = "#071cb5", linewidth = width * 0.5, 
+                                                 markersize = width * 0.5 * np.sqrt(2 * np.pi), markeredgewidth = width * 0.5 * 0.75)
+            self.ax2.set_ylabel('index')
+    
+    def draw(self, temp, bar_col, path, colors, index = None, meter = None):
+        """
+        Desc: updates the chart with one treated pivot and saves it
+        
+        Params:
+            temp: treated pivot, one bar per row
+            bar_col: column drawn as bars
+            path: output file
+            colors: one bar colour per row
+            index: index values drawn on the second axis (index charts only)
+            meter: optional Memory_Meter, takes a draw lap before savefig and a savefig lap after it
+        
+        output:
+            seconds spent in savefig
+        
+        """
+        
+        n = len(temp)
+        x = np.arange(n)
+        heights = temp[bar_col].to_numpy(dtype = 'float64')
+        
+        if len(self.bars) < n:
+            self.bars.extend(self.ax1.bar(np.arange(len(self.bars), n), np.zeros(n - len(self.bars)), width = 0.8, alpha = 0.5).patches)
+        for i, bar in enumerate(self.bars):
+            bar.set_visible(i < n)
+            if i < n:
+                bar.set_height(heights[i])
+                bar.set_facecolor(colors[i])
+        
+        self.ax1.set_xticks(x)
+        self.ax1.set_xticklabels([str(v) for v in temp.index])
+        self.ax1.set_xlim(-0.5, n - 0.5)
+        top = np.nanmax(heights) if n and np.isfinite(heights).any() else 0
+        self.ax1.set_ylim(0, top * 1.05 if top > 0 else 1)
+        self.ax1.set_xlabel(temp.index.name if temp.index.name is not None else '')
+        self.ax1.set_ylabel(bar_col)
+        
+        if self.ax2 is not None:
+            values = np.asarray(index, dtype = 'float64')
+            self.index_line.set_data(x, np.where(np.isfinite(values), values, np.nan))
+            self.benchmark_line.set_data(x, np.ones(n))
+            self.ax2.relim()
+            self.ax2.autoscale_view()
+        
+        if meter is not None:
+            meter.lap('draw')
+        start = time.time()
+        self.fig.savefig(path)
+        seconds = time.time() - start
+        if meter is not None:
+            meter.lap('savefig')
+        return seconds
+
+
+# one template per process, chart type and figure size
+templates = {}
+
+def chart_template(figsize, index = True):
+    key = (tuple(figsize), index)
+    if key not in templates:
+        templates[key] = Chart_Template(figsize, index)
+    return templates[key]
+
+
+def index_chart(temp, target_types, path, figsize, meter = None):
+    # bar chart of the second target type with the index line and its benchmark on a second axis, returns the savefig seconds
+    
+    #By default divides second target_var (churn) entry type by first (non-churn), unless lift_tables already did
+    if 'index' not in temp.columns:
+        temp['index'] = (temp[target_types[1]] / temp[target_types[1]].sum()) / (temp[target_types[0]] / temp[target_types[0]].sum())
+        temp['index benchmark'] = 1
+    
+    #Assumes churn is second entry in target_types list
+    colors = [sns.desaturate("#8dd3d6", 0.75)] * len(temp)
+    return chart_template(figsize).draw(temp, target_types[1], path, colors, temp['index'], meter)
+
+
+def hist_chart(temp, path, figsize, meter = None):
+    # bar chart of the value counts, returns the savefig seconds
+    colors = [sns.desaturate(sns.color_palette()[0], 0.75)] * len(temp)
+    return chart_template(figsize, index = False).draw(temp, 'vals', path, colors, meter = meter)
 
-        fig, ax1 = plt.subplots(figsize=(12,6))
 
-        ax2 = ax1.twinx()
+# bump when the chart drawing changes, so cached charts are redrawn
+RENDERER_VERSION = 1
 
-        sns.pointplot(data = temp, x = temp.index, y= 'index', ax=ax2, colour = "#22b6f5")
-        sns.pointplot(data = temp, x = temp.index, y= 'index benchmark', 
-                      linestyles= "--", color="#071cb5", scale = 0.5, ax=ax2)
 
+def chart_key(kind, cat):
+    # graph file of a column relative to its root_folder, the key of its render manifest entry
+    folder = 'Categorical/' if kind in ['cat', 'cat_hist'] else 'Numeric/'
+    return folder + cat + '.jpg'
 
+
+def chart_path(kind, cat, root_folder):
+    # graph file of a column, built as directory_setup builds the folders (root_folder '' saves under /)
+    return root_folder + '/' + chart_key(kind, cat)
+
+
+def render_key(kind, cat, temp, config, target_types, root_folder, order = None, pyramid = None, treated = False):
+    """
+    Desc: hash of everything a graph is drawn from: the pivot data, the config row, the target labels, the custom sort
+          order, whether a histogram pyramid is used, and the renderer version
+    
+    Params:
+        as per render_column
         
-        #Assumes churn is second entry in target_types list
-        sns.barplot(data = temp, x = temp.index, y= target_types[1], alpha=0.5, ax=ax1, color = "#8dd3d6")
+    output:
+        hex digest string
+    
+    """
+    
+    digest = hashlib.sha1()
+    digest.update(json.dumps([RENDERER_VERSION, kind, str(cat), list(target_types), order, treated,
+                              None if pyramid is None else pyramid.base_width,
+                              {str(k): str(v) for k, v in config.items()}, temp.attrs,
+                              [str(c) for c in temp.columns], [str(d) for d in temp.dtypes]]).encode())
+    digest.update(pd.util.hash_pandas_object(temp, index = True).values.tobytes())
+    return digest.hexdigest()
 
 
-        plt.savefig(root_folder + '/Categorical/' + cat + '.jpg')
-        plt.close()
-        time_list.append((time.time()-start))
-    return time_list #check runtime
+def read_manifest(root_folder):
+    # render manifest of a folder: chart path (relative to root_folder) -> render_key of the saved chart
+    try:
+        return pd.read_csv(root_folder + "/render_manifest.csv", index_col = 0)['key'].to_dict()
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(root_folder, manifest):
+    pd.DataFrame({'key': pd.Series(manifest, dtype = 'object')}).rename_axis('path').sort_index().to_csv(root_folder + "/render_manifest.csv")
 
 
+def render_column(kind, cat, temp, config, target_types, root_folder, order = None, pyramid = None, treated = False):
+    """
+    Desc: treats one pivot and saves its graph. Errors are reported and do not stop the other columns
+    
+    Params:
+        kind: 'cat', 'cat_hist', 'numeric' or 'numeric_hist'
+        cat: column name, the graph is saved as <root_folder>/Categorical/<cat>.jpg or <root_folder>/Numeric/<cat>.jpg
+        temp: pivot of the column (not modified)
+        config: config row of the column
+        target_types: the names of the two target names ('' for histograms)
+        root_folder: name of parent folder to save graphs
+        order: custom sort order of a categorical column
+        pyramid: optional Histogram_Pyramid of a numeric column
+        treated: temp was already treated by lift_tables, only the graph is drawn
+        
+    output: 
+        timings: dict of transform, draw and savefig seconds (stages reached), total seconds, rows of the pivot,
+                 levels drawn and peak_mb, the peak memory of each stage reached (see Memory_Meter)
+        ok: whether the graph was saved
+    
+    """
+    
+    start = time.time()
+    meter = Memory_Meter()
+    timings = {'rows': len(temp), 'levels': np.nan}
+    temp = temp.copy()
+    path = chart_path(kind, cat, root_folder)
+    
+    try:
+        if kind in ['cat', 'cat_hist']:
+            figsize = (12,6)
+            if not treated:
+                sort_col = target_types[1] if kind == 'cat' else 'vals'
+                temp = cat_table(temp, cat, config, sort_col, order)
+        else:
+            print(cat)
+            figsize = (20,6)
+            if not treated:
+                count_cols = list(target_types) if kind == 'numeric' else ['vals']
+                temp = numeric_table(temp, config, count_cols, pyramid)
+        if not treated:
+            timings['transform'] = time.time() - start
+            meter.lap('transform')
+        timings['levels'] = len(temp)
+        
+        drawn = time.time()
+        if kind in ['cat', 'numeric']:
+            timings['savefig'] = index_chart(temp, target_types, path, figsize, meter)
+        else:
+            timings['savefig'] = hist_chart(temp, path, figsize, meter)
+        timings['draw'] = time.time() - drawn - timings['savefig']
+        ok = True
+    
+    except Exception:
+        print("failed to render " + str(cat) + ":")
+        print(traceback.format_exc())
+        ok = False
+    
+    timings['seconds'] = time.time() - start
+    timings['peak_mb'] = meter.peaks
+    return timings, ok
+
+
+def render_columns(tasks, n_jobs = 1, force = False, profiler = None):
+    """
+    Desc: renders a list of render_column tasks, serially or spread over worker processes. Charts whose render_key
+          matches the render manifest of their root_folder, and whose file still exists, are skipped
+    
+    Params:
+        tasks: list of render_column argument tuples
+        n_jobs: number of worker processes (1 renders in this process)
+        force: redraws every chart regardless of the manifest
+        profiler: optional Stage_Profiler, records the transform, draw and savefig stages of every rendered chart
+        
+    output:
+        time_list: runtime for each graph, in task order (0 for skipped charts)
+    
+    """
+    
+    time_list = [0.0] * len(tasks)
+    manifests = {}
+    keys = {}
+    todo = []
+    
+    for i, task in enumerate(tasks):
+        kind, cat, root_folder = task[0], task[1], task[5]
+        if root_folder not in manifests:
+            manifests[root_folder] = read_manifest(root_folder)
+        
+        keys[i] = render_key(*task)
+        unchanged = manifests[root_folder].get(chart_key(kind, cat)) == keys[i] and os.path.isfile(chart_path(kind, cat, root_folder))
+        if force or not unchanged:
+            todo.append(i)
+    
+    print("render cache: " + str(len(tasks) - len(todo)) + " unchanged, " + str(len(todo)) + " to render")
+    
+    if n_jobs == 1 or len(todo) < 2:
+        results = [render_column(*tasks[i]) for i in todo]
+    else:
+        # several columns per submission so the pivots and results are shipped in batches
+        chunksize = max(1, len(todo) // (n_jobs * 4))
+        with ProcessPoolExecutor(max_workers = n_jobs, initializer = start_tracing if tracemalloc.is_tracing() else None) as executor:
+            results = list(executor.map(render_column, *zip(*[tasks[i] for i in todo]), chunksize = chunksize))
+    
+    for i, (timings, ok) in zip(todo, results):
+        kind, cat, root_folder = tasks[i][0], tasks[i][1], tasks[i][5]
+        time_list[i] = timings['seconds']
+        
+        if profiler is not None:
+            for stage in ['transform', 'draw', 'savefig']:
+                if stage in timings:
+                    profiler.record(stage, cat, timings[stage], timings['rows'], timings['levels'], timings['peak_mb'].get(stage, np.nan))
+        
+        if ok:
+            manifests[root_folder][chart_key(kind, cat)] = keys[i]
+        else:
+            manifests[root_folder].pop(chart_key(kind, cat), None)
+    
+    for root_folder, manifest in manifests.items():
+        write_manifest(root_folder, manifest)
+    
+    return time_list
+
+
+def graph_tasks(kind, df, config_df, columns, target_types, root_folder, sort_orders = None, pyramids = None, profiler = None):
+    """
+    Desc: render_column tasks of the generate functions. Custom sort orders are gathered first (prompting if needed),
+          then every column is treated in one pass by lift_tables, columns it leaves out are treated by render_column
+    
+    Params:
+        kind: 'cat', 'cat_hist', 'numeric' or 'numeric_hist'
+        df, config_df, columns, target_types, root_folder, sort_orders, pyramids: as per the generate functions
+        profiler: optional Stage_Profiler, records the lift_tables pass as one transform stage
+        
+    output:
+        tasks: list of render_column argument tuples
+    
+    """
+    
+    if columns == []:
+        columns = list(config_df.index)
+    
+    orders = {}
+    if kind in ['cat', 'cat_hist']:
+        for cat in columns:
+            if config_df.loc[cat, 'custom_sort'] == 1:
+                orders[cat] = sort_order(df[cat], cat, root_folder, sort_orders)
+    
+    start = time.time()
+    meter = Memory_Meter()
+    tables = lift_tables(kind, df, config_df, columns, target_types, orders, pyramids)
+    if profiler is not None:
+        profiler.record('transform', '', time.time() - start, sum(len(df[cat]) for cat in columns), sum(len(temp) for temp in tables.values()), meter.lap())
+    
+    return [(kind, cat, tables.get(cat, df[cat]), config_df.loc[cat], target_types, root_folder, orders.get(cat),
+             pyramids.get(cat) if pyramids is not None else None, cat in tables) for cat in columns]
+
 
 #long runtime means lots of cateogires: Recategorisation is necessary
-def cat_graph_generate_hist(df, config_df, root_folder, columns = []):
+def cat_graph_generate(df, target_types, config_df, root_folder, columns = [], sort_orders = None, n_jobs = 1, force = False, profiler = None):
     """
     Desc: 
         Runs through the configuration file and treats the pivots, resulting in bar & line graphs
@@ -148,79 +527,49 @@ def cat_graph_generate_hist(df, config_df, root_folder, columns = []):
         target_types: the names of the two target names
         config_df: configuration dataframe 
         Root_folder: name of parent folder to save graphs
+        sort_orders: dict of column -> index order (as custom_sort returns) used instead of prompting for custom_sort columns
+        n_jobs: number of worker processes rendering graphs in parallel (custom sort prompts still happen here first)
+        force: redraws every graph, by default graphs whose pivot, config row and labels are unchanged are skipped
+        profiler: optional Stage_Profiler, records the transform pass over every column and the draw and savefig stages per column (see Stage_Profiler)
         
     output: it saves graphs to the directory
         time_list: runtime for each graph to identify pain points
     """
-    
-    if columns == []:
-        columns = list(config_df.index)
-    
-    time_list = []
-    
-    for cat in columns:
-        
-        start = time.time()
-        
-        config = config_df.loc[cat]
-        temp = df[cat]
-        
-        #Config based data adjustments
-        
-        if config['custom_sort'] == 1:
-            
-            my_file = Path(root_folder + "/Config/custom_sort/" + cat + ".csv")
-            
-            if my_file.is_file():
-                order = pd.read_csv(root_folder + "/Config/custom_sort/" + cat + ".csv").iloc[:,0].to_list()
-            else:
-                order = custom_sort(temp)
-                order_config = pd.DataFrame(order, columns = [cat])
-                order_config.to_csv(root_folder + "/Config/custom_sort/" + cat + ".csv", index = False)
-                
-           
-            temp = temp.reset_index()
-            temp = temp.reindex(order)
-            temp = temp.set_index(cat)
-            
-        elif config['asc/desc'] == -1: 
-            
-            temp = temp.sort_values(['vals'], ascending=False)
-            
-        elif config['asc/desc'] == 1:
-            
-            temp = temp.sort_values(['vals'], ascending=True) 
-            
-        if config['soft_cat_limit'] != 0:
-            
-            other = pd.DataFrame(temp.iloc[int(config['soft_cat_limit']):].sum(), columns = ['other/unsp']).transpose()
-            temp = temp.iloc[:int(config['soft_cat_limit'])]
-            temp = pd.concat([temp, other], ignore_index=False)
-        
-        if config['hard_cat_limit'] != 0:
-            
-            temp = temp.iloc[:config['hard_cat_limit']]
-                    
- 
-        
-        #Graphing steps
-        matplotlib.rc_file_defaults()
-        ax1 = sns.set_style(style=None, rc=None )
+    tasks = graph_tasks('cat', df, config_df, columns, target_types, root_folder, sort_orders, profiler = profiler)
+    time_list = render_columns(tasks, n_jobs, force, profiler)
+    return time_list #check runtime
 
-        fig, ax1 = plt.subplots(figsize=(12,6))
 
-        
-        #Assumes churn is second entry in target_types list
-        sns.barplot(data = temp, x = temp.index, y= temp['vals'], alpha=0.5, ax=ax1)
 
-        plt.savefig(root_folder + '/Categorical/' + cat + '.jpg')
-        plt.close()
-        time_list.append((time.time()-start))
+#long runtime means lots of cateogires: Recategorisation is necessary
+def cat_graph_generate_hist(df, config_df, root_folder, columns = [], sort_orders = None, n_jobs = 1, force = False, profiler = None):
+    """
+    Desc: 
+        Runs through the configuration file and treats the pivots, resulting in bar & line graphs
+    
+    Params:
+    
+        df: named dataframes which should be in pivot form already
+        columns: list of categorical columns, note this should be specified seperately from the df object (categorical col list is default as per Section 4)
+        target_types: the names of the two target names
+        config_df: configuration dataframe 
+        Root_folder: name of parent folder to save graphs
+        sort_orders: dict of column -> index order (as custom_sort returns) used instead of prompting for custom_sort columns
+        n_jobs: number of worker processes rendering graphs in parallel (custom sort prompts still happen here first)
+        force: redraws every graph, by default graphs whose pivot, config row and labels are unchanged are skipped
+        profiler: optional Stage_Profiler, records the transform pass over every column and the draw and savefig stages per column (see Stage_Profiler)
+        
+    output: it saves graphs to the directory
+        time_list: runtime for each graph to identify pain points
+    """
+    
+    tasks = graph_tasks('cat_hist', df, config_df, columns, '', root_folder, sort_orders, profiler = profiler)
+    time_list = render_columns(tasks, n_jobs, force, profiler)
     return time_list #check runtime
 
 
 
-def numeric_graph_generate(df, target_types, config_df, root_folder, columns =[]):
+def numeric_graph_generate(df, target_types, config_df, root_folder, columns =[], pyramids = None, n_jobs = 1, force = False, profiler = None):
     """
     Desc: Runs through the configuration file and treats the pivots, resulting in bar & line graphs
     
@@ -231,94 +580,23 @@ def numeric_graph_generate(df, target_types, config_df, root_folder, columns =[]
         target_types: the names of the two target names
         config_df: configuration dataframe        
         root_folder: name of parent folder to save graphs
+        pyramids: optional dict of column -> Histogram_Pyramid (see pyramid_index), binned columns are then served from the
+                  pyramid instead of re-binning the pivot
+        n_jobs: number of worker processes rendering graphs in parallel
+        force: redraws every graph, by default graphs whose pivot, config row and labels are unchanged are skipped
+        profiler: optional Stage_Profiler, records the transform pass over every column and the draw and savefig stages per column (see Stage_Profiler)
         
     output: it saves graphs to the directory
     time_list: runtime for each graph to identify pain points
     
     """
-    if columns == []:
-        columns = list(config_df.index)
-    
-    time_list = []
+    tasks = graph_tasks('numeric', df, config_df, columns, target_types, root_folder, pyramids = pyramids, profiler = profiler)
     
-    for cat in columns:
-        start = time.time()
-        config = config_df.loc[cat]
-        temp = df[cat]
-        
-        print(cat)
-        #Config based data adjustments
-        
-        if config['bin_length'] != 0:
-            temp['x']=temp.index
-            temp['bins'] = pd.cut(temp.x, bins = np.arange(min(temp.x),max(temp.x),config['bin_length']).tolist())
-        
-        if config['upper_class'] != 0:
-            
-            max_class = pd.DataFrame(temp.iloc[temp.index.get_loc(config['upper_class']):].sum(), columns = [config['upper_class']]).transpose() # add < label
-            temp = temp.iloc[:temp.index.get_loc(config['upper_class'])]
-            temp = pd.concat([temp, max_class], ignore_index=False)
-            
-        if config['lower_class'] != 0:
-            
-            min_class = pd.DataFrame(temp.iloc[:temp.index.get_loc(config['lower_class'])].sum(), columns = [config['lower_class']]).transpose() # add < label
-            temp = temp.iloc[temp.index.get_loc(config['lower_class'])+1:]
-            temp = pd.concat([min_class, temp], ignore_index=False)
-            
-        if config['bin_length'] != 0: #reindex
-            temp['x']=temp.index
-            temp['bins'] = temp['bins'].fillna(temp.x).astype(str)
-            
-            test2 = temp[['bins', target_types[1], target_types[0]]].groupby(['bins']).sum().fillna(0)
-            test2['index'] = test2[target_types[1]].transform(lambda x: x/sum(x))/test2[target_types[0]].transform(lambda x: x/sum(x))
-            test2['index benchmark'] = 1
-            
-            l = []
-
-            for i in test2.index:
-                if '(' in i:
-                    start = i.find(", ") + len(", ")
-                    end = i.find("]")
-                    substring = i[start:end]
-                    l.append(float(substring))
-                else:
-                    l.append(float(i))
-
-            test2.index = l
-            test2.sort_index(ascending=True)
-            
-            temp = test2
-            
-        #By default divides second target_var (churn) entry type by first (non-churn)
-        temp['index'] = temp[target_types[1]].transform(lambda x: x/sum(x))/temp[target_types[0]].transform(lambda x: x/sum(x))
-        temp['index benchmark'] = 1
-        
-        #Graph step
-        
-        matplotlib.rc_file_defaults()
-        ax1 = sns.set_style(style=None, rc=None )
-
-        fig, ax1 = plt.subplots(figsize=(20,6))
-
-        ax2 = ax1.twinx()
-
-        sns.pointplot(data = temp, x = temp.index, y= 'index', ax=ax2, colour = "#22b6f5")
-        sns.pointplot(data = temp, x = temp.index, y= 'index benchmark', 
-                      linestyles= "--", color="#071cb5", scale = 0.5, ax=ax2)
-
-
-        
-        #Assumes churn is second entry in target_types list
-        sns.barplot(data = temp, x = temp.index, y= target_types[1], alpha=0.5, ax=ax1, color = "#8dd3d6")
-
-
-        plt.savefig(root_folder + '/Numeric/' + cat + '.jpg')
-        plt.close()
-        time_list.append((time.time()-start))
+    time_list = render_columns(tasks, n_jobs, force, profiler)
     return time_list  #check runtime
 
 
-def numeric_graph_generate_hist(df, config_df, root_folder, columns = []):
+def numeric_graph_generate_hist(df, config_df, root_folder, columns = [], pyramids = None, n_jobs = 1, force = False, profiler = None):
     """
     Desc: Runs through the configuration file and treats the pivots, resulting in bar & line graphs
     
@@ -329,76 +607,17 @@ def numeric_graph_generate_hist(df, config_df, root_folder, columns = []):
         target_types: the names of the two target names
         config_df: configuration dataframe        
         root_folder: name of parent folder to save graphs
+        pyramids: optional dict of column -> Histogram_Pyramid (see pyramid_index), binned columns are then served from the
+                  pyramid instead of re-binning the pivot
+        n_jobs: number of worker processes rendering graphs in parallel
+        force: redraws every graph, by default graphs whose pivot, config row and labels are unchanged are skipped
+        profiler: optional Stage_Profiler, records the transform pass over every column and the draw and savefig stages per column (see Stage_Profiler)
         
     output: it saves graphs to the directory
     time_list: runtime for each graph to identify pain points
     
     """
-    if columns == []:
-        columns = list(config_df.index)
-    
-    time_list = []
+    tasks = graph_tasks('numeric_hist', df, config_df, columns, '', root_folder, pyramids = pyramids, profiler = profiler)
     
-    for cat in columns:
-        start = time.time()
-        config = config_df.loc[cat]
-        temp = df[cat]
-        
-        print(cat)
-        #Config based data adjustments
-        
-        if config['bin_length'] != 0:
-            temp['x']=temp.index
-            temp['bins'] = pd.cut(temp.x, bins = np.arange(min(temp.x),max(temp.x),config['bin_length']).tolist())
-        
-        if config['upper_class'] != 0:
-            
-            max_class = pd.DataFrame(temp.iloc[temp.index.get_loc(config['upper_class']):].sum(), columns = [config['upper_class']]).transpose() # add < label
-            temp = temp.iloc[:temp.index.get_loc(config['upper_class'])]
-            temp = pd.concat([temp, max_class], ignore_index=False)
-            
-        if config['lower_class'] != 0:
-            
-            min_class = pd.DataFrame(temp.iloc[:temp.index.get_loc(config['lower_class'])].sum(), columns = [config['lower_class']]).transpose() # add < label
-            temp = temp.iloc[temp.index.get_loc(config['lower_class'])+1:]
-            temp = pd.concat([min_class, temp], ignore_index=False)
-            
-        if config['bin_length'] != 0: #reindex
-            temp['x']=temp.index
-            temp['bins'] = temp['bins'].fillna(temp.x).astype(str)
-            
-            test2 = temp[['bins', 'vals']].groupby(['bins']).sum().fillna(0)
- 
-            
-            l = []
-
-            for i in test2.index:
-                if '(' in i:
-                    start = i.find(", ") + len(", ")
-                    end = i.find("]")
-                    substring = i[start:end]
-                    l.append(float(substring))
-                else:
-                    l.append(float(i))
-
-            test2.index = l
-            test2.sort_index(ascending=True)
-            
-            temp = test2
-            
-        
-        #Graph step
-        
-        matplotlib.rc_file_defaults()
-        ax1 = sns.set_style(style=None, rc=None )
-
-        fig, ax1 = plt.subplots(figsize=(20,6))
-
-        
-        #Assumes churn is second entry in target_types list
-        sns.barplot(data = temp, x = temp.index, y= temp['vals'], alpha=0.5, ax=ax1)
-
-        plt.savefig(root_folder + '/Numeric/' + cat + '.jpg')
-        plt.close()
-        time_list.append((time.time()-start))
+    time_list = render_columns(tasks, n_jobs, force, profiler)
     return time_list  #check runtime
\ No newline at end of file
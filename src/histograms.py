@@ -0,0 +1,138 @@
+import math
+import pandas as pd
+import numpy as np
+
+from src.graph_config import bin_counts, bin_labels
+
+
+class Histogram_Pyramid:
+
+    def __init__(self, pivot, columns = None, max_bins = 4096):
+        """
+        Desc:
+            Multi-resolution histogram of a numeric pivot, so that any bin_length / upper_class / lower_class combination
+            from Numerical_Graph_Config is served from stored bins instead of re-binning the per value pivot with
+            bin_pivot (same bins, labels and class rows, see bin_codes).
+
+            Level 0 holds exact counts per target class in base bins (origin + k*w, origin + (k+1)*w] anchored at the
+            smallest value (which falls in the first bin), where w is a power of two. Level j sums neighbouring pairs of
+            level j-1, so its bins are w * 2**j wide. The smallest and largest value of every base bin are kept too.
+
+            A bin_length that is a multiple of w with no class cuts sums whole bins of the coarsest level that lines up.
+            Any other setting bins the occupied base bins as bin_pivot bins values, each base bin placed by its largest
+            value. By default w is the largest power of two not above the smallest gap between values, so each base bin
+            holds at most one distinct value and every query is exact. When that would need more than max_bins base
+            bins, w is widened instead. The per value pivot is then kept as well, and settings other than aligned
+            multiples of w without class cuts are binned from it, as a base bin holding several values can straddle
+            a class cut or bin edge.
+
+        Params:
+            pivot: numeric pivot as per pivot_index, indexed by sorted values
+            columns: count columns to keep (default every column of the pivot e.g. target_types or 'vals')
+            max_bins: upper limit on the number of base bins
+
+        """
+
+        if columns is None:
+            columns = list(pivot.columns)
+
+        values = np.asarray(pivot.index, dtype = 'float64')
+        counts = pivot[columns].to_numpy()
+
+        self.columns = list(columns)
+        self.dtype = counts.dtype
+        self.origin = values.min()
+        span = values.max() - self.origin
+
+        gaps = np.diff(np.unique(values))
+        width = 2.0**math.floor(math.log2(gaps.min())) if len(gaps) else 1.0
+        self.widened = span / width > max_bins
+        if self.widened:
+            width = 2.0**math.ceil(math.log2(span / max_bins))
+            self.values, self.counts = values, counts
+        self.base_width = width
+        self.name = pivot.index.name
+
+        # bin k holds (origin + k*w, origin + (k+1)*w], rounded so values on an edge are not pushed up by float error
+        n_bins = max(1, int(math.ceil(round(span / width, 9))))
+        k = np.clip(np.ceil(np.round((values - self.origin) / width, 9)).astype('int64') - 1, 0, n_bins - 1)
+
+        base = np.zeros((n_bins, len(self.columns)), dtype = self.dtype)
+        np.add.at(base, k, counts)
+
+        self.bin_min = np.full(n_bins, np.inf)
+        self.bin_max = np.full(n_bins, -np.inf)
+        np.minimum.at(self.bin_min, k, values)
+        np.maximum.at(self.bin_max, k, values)
+
+        # the smallest value shares base bin 0 with the values up to origin + w, so its counts are kept apart
+        self.origin_counts = counts[values == self.origin].sum(axis = 0)
+
+        self.levels = [base]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            if len(level) % 2:
+                level = np.vstack([level, np.zeros((1, level.shape[1]), dtype = level.dtype)])
+            self.levels.append(level[0::2] + level[1::2])
+
+    def rebin(self, bin_length, upper_class = 0, lower_class = 0):
+        """
+        Desc: binned counts for one numeric config row, as bin_pivot bins the per value pivot: values up to lower_class
+              summed into one row labelled lower_class, values from upper_class up into one row labelled upper_class,
+              and the rest in bins of bin_length labelled by their right edge (0 switches a class cut off)
+
+        Params:
+            bin_length, upper_class, lower_class: as per the Numerical_Graph_Config settings
+
+        output:
+            temp: dataframe of counts, one column per count column, in the order lower_class row, bins, upper_class row
+
+        """
+
+        if bin_length <= 0:
+            raise ValueError("bin_length must be positive, unbinned graphs use the pivot itself")
+
+        base = self.levels[0]
+        occupied = np.flatnonzero(self.bin_min <= self.bin_max)
+        r = int(round(bin_length / self.base_width))
+
+        if upper_class == 0 and lower_class == 0 and r > 0 and r * self.base_width == bin_length:
+            # bins of r base bins anchored at the smallest value, summed from the coarsest level that lines up with the edges
+            j = min((r & -r).bit_length() - 1, len(self.levels) - 1)
+            regular = np.add.reduceat(self.levels[j], np.arange(0, len(self.levels[j]), r >> j), axis = 0)
+            first, last = occupied[0] // r, occupied[-1] // r
+            rows = regular[first:last + 1]
+            labels = bin_labels(self.origin, np.arange(first, last + 1), bin_length)
+        elif self.widened:
+            rows, labels = bin_counts(self.values, self.counts, bin_length, upper_class, lower_class)
+        else:
+            values, counts = self.bin_max[occupied], base[occupied]
+            if self.bin_min[0] < self.bin_max[0]:
+                values = np.concatenate([[self.origin], values])
+                counts = np.vstack([self.origin_counts, counts])
+                counts[1] -= self.origin_counts
+            rows, labels = bin_counts(values, counts, bin_length, upper_class, lower_class)
+
+        return pd.DataFrame(np.asarray(rows, dtype = self.dtype).reshape(len(rows), len(self.columns)),
+                            index = pd.Index(labels, dtype = 'float64', name = self.name), columns = self.columns)
+
+
+def pyramid_index(pivots, columns = None, max_bins = 4096):
+    """
+    Desc: builds a Histogram_Pyramid for every numeric pivot, once, so config changes only re-aggregate. Pivots already
+          binned at pivot time (see binned_pivot) are left out
+
+    Params:
+        pivots: numeric pivots as per pivot_index
+        columns: list of numeric columns (default every pivot)
+        max_bins: as per Histogram_Pyramid
+
+    output:
+        pyramids: dict of column -> Histogram_Pyramid
+
+    """
+
+    if columns is None:
+        columns = list(pivots)
+
+    return {col: Histogram_Pyramid(pivots[col], max_bins = max_bins) for col in columns if 'binned' not in pivots[col].attrs}
@@ -0,0 +1,353 @@
+import pandas as pd
+import numpy as np
+
+from src.graph_config import cat_limit, num_bins, bin_codes, bin_labels
+
+
+class Long_Pivots:
+
+    def __init__(self, columns, codes, levels, counts, count_cols, index_names, level_dtypes, count_dtypes):
+        """
+        Desc:
+            Pivots of many columns stacked into one long table, one row per (column, level) holding the class counts of
+            the level, so config rules, class shares and the index are computed for every column in one pass of array
+            operations instead of pivot by pivot. Rows are grouped by column, in column order, and within a column in
+            the order they are drawn. Counts are held as float64 (exact for whole counts up to 2**53) and every column
+            gets its own count dtype back in frames.
+
+        Params:
+            columns: column names, codes index into it
+            codes: column code of every row, non decreasing
+            levels: level of every row (object array)
+            counts: 2d float64 array of counts, one column per count column
+            count_cols: names of the count columns (target types, or ['vals'] for histograms)
+            index_names: per column name of the pivot index
+            level_dtypes: per column dtype of the pivot index
+            count_dtypes: per column dtype of the counts
+
+        """
+
+        self.columns = list(columns)
+        self.codes = codes
+        self.levels = levels
+        self.counts = counts
+        self.count_cols = list(count_cols)
+        self.index_names = list(index_names)
+        self.level_dtypes = list(level_dtypes)
+        self.count_dtypes = list(count_dtypes)
+
+    @classmethod
+    def stack(cls, pivots, count_cols):
+        # long table of a dict of column -> pivot holding every count column
+        columns = list(pivots)
+        counts = [(pivots[col] if list(pivots[col].columns) == list(count_cols) else pivots[col][list(count_cols)]).to_numpy()
+                  for col in columns]
+
+        return cls(columns,
+                   np.repeat(np.arange(len(columns)), [len(c) for c in counts]),
+                   np.concatenate([np.asarray(pivots[col].index, dtype = 'object') for col in columns] + [np.empty(0, dtype = 'object')]),
+                   np.concatenate([c.astype('float64') for c in counts] + [np.empty((0, len(count_cols)))]),
+                   count_cols,
+                   [pivots[col].index.name for col in columns],
+                   [pivots[col].index.dtype for col in columns],
+                   [c.dtype for c in counts])
+
+    @classmethod
+    def concat(cls, parts):
+        # one long table of several with the same count columns, each column in one part only
+        offsets = np.cumsum([0] + [len(part.columns) for part in parts])
+        return cls([col for part in parts for col in part.columns],
+                   np.concatenate([part.codes + offset for part, offset in zip(parts, offsets)] + [np.empty(0, dtype = 'int64')]),
+                   np.concatenate([part.levels for part in parts] + [np.empty(0, dtype = 'object')]),
+                   np.concatenate([part.counts for part in parts] + [np.empty((0, len(parts[0].count_cols)))]),
+                   parts[0].count_cols,
+                   [name for part in parts for name in part.index_names],
+                   [dtype for part in parts for dtype in part.level_dtypes],
+                   [dtype for part in parts for dtype in part.count_dtypes])
+
+    def bounds(self):
+        # first row of every column, plus the number of rows
+        return np.searchsorted(self.codes, np.arange(len(self.columns) + 1))
+
+    def shares(self):
+        # every count divided by its column total of the same count column, all columns at once
+        totals = np.stack([np.bincount(self.codes, weights = self.counts[:, j], minlength = len(self.columns))
+                           for j in range(len(self.count_cols))], axis = 1)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return self.counts / totals[self.codes]
+
+    def index(self, target_types):
+        # share of the second target type over the share of the first (non target), as index_chart computes it
+        shares = self.shares()
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return shares[:, self.count_cols.index(target_types[1])] / shares[:, self.count_cols.index(target_types[0])]
+
+    def frames(self, target_types = ''):
+        """
+        Desc: splits the long table back into one treated pivot per column
+
+        Params:
+            target_types: the names of the two target types, adds the index and index benchmark columns index_chart
+                          draws ('' for histograms)
+
+        output:
+            frames: dict of column -> dataframe of counts indexed by level
+
+        """
+
+        bounds = self.bounds()
+        index = self.index(target_types) if target_types != '' else None
+
+        frames = {}
+        for i, col in enumerate(self.columns):
+            rows = slice(bounds[i], bounds[i + 1])
+            data = dict(zip(self.count_cols, self.counts[rows].astype(self.count_dtypes[i]).T))
+            if index is not None:
+                data['index'] = index[rows]
+                data['index benchmark'] = np.ones(bounds[i + 1] - bounds[i], dtype = 'int64')
+            frames[col] = pd.DataFrame(data, index = pd.Index(self.levels[rows], dtype = self.level_dtypes[i], name = self.index_names[i]),
+                                       copy = False)
+
+        return frames
+
+
+def cat_long(pivots, config_df, columns, count_cols, sort_col, orders = None):
+    """
+    Desc: applies categorical config rows to every pivot at once, with the same rows, order and 'other/unsp' sums as
+          cat_table: custom sort or a stable sort on sort_col, levels past the soft limit (and the remainder of a pivot
+          collapsed at pivot time) summed into an 'other/unsp' row, then the hard limit. Pivots cat_table would reject,
+          or whose custom sort order is not a permutation of their rows, are left out
+
+    Params:
+        pivots: dict of column -> pivot
+        config_df: categorical configuration dataframe
+        columns: columns to treat
+        count_cols: count columns of the pivots (target types, or ['vals'] for histograms)
+        sort_col: count column the asc/desc setting sorts by
+        orders: dict of column -> custom sort order of the custom_sort columns
+
+    output:
+        long: Long_Pivots of the treated pivots
+
+    """
+
+    if orders is None:
+        orders = {}
+
+    configs = config_df.loc[list(dict.fromkeys(columns)), ['custom_sort', 'asc/desc', 'soft_cat_limit', 'hard_cat_limit']].to_dict('index')
+
+    stacked, custom, direction, soft, hard = {}, {}, [], [], []
+    for col in columns:
+        temp, config = pivots[col], configs[col]
+        if list(temp.columns) != list(count_cols):
+            continue
+
+        n = len(temp)
+        if 'other/unsp' in temp.index:
+            limit = cat_limit(config)
+            n -= 1
+            if limit is None or not limit[1] or limit[0] != n:
+                continue
+
+        if config['custom_sort'] == 1:
+            order = orders.get(col)
+            if order is None or sorted(order) != list(range(n)):
+                continue
+            # position of every row in the custom order
+            custom[col] = np.empty(n, dtype = 'float64')
+            custom[col][np.asarray(order, dtype = 'int64')] = np.arange(n)
+            # custom_sort sets the column name as the index name
+            temp = temp.rename_axis(col)
+
+        stacked[col] = temp
+        direction.append(config['asc/desc'] if config['custom_sort'] != 1 and config['asc/desc'] in [-1, 1] else 0)
+        soft.append(int(config['soft_cat_limit']))
+        hard.append(int(config['hard_cat_limit']))
+
+    long = Long_Pivots.stack(stacked, count_cols)
+    direction = np.array(direction, dtype = 'float64')
+    soft, hard = np.array(soft, dtype = 'int64'), np.array(hard, dtype = 'int64')
+
+    # sort key: counts signed by asc/desc, else the pivot or custom order. Rows collapsed at pivot time sort last and
+    # always go to 'other/unsp'
+    rest = long.levels == 'other/unsp'
+    bounds = long.bounds()
+    position = np.arange(len(long.codes)) - bounds[long.codes]
+    key = np.where(direction[long.codes] != 0, long.counts[:, list(count_cols).index(sort_col)] * direction[long.codes], position)
+    for col, ranks in custom.items():
+        i = long.columns.index(col)
+        key[bounds[i]:bounds[i + 1]] = ranks
+
+    # stable: equal counts keep their pivot order, as cat_table sorts
+    order = np.lexsort((position, key, rest, long.codes))
+    codes, levels, counts, rest = long.codes[order], long.levels[order], long.counts[order], rest[order]
+    rank = np.arange(len(codes)) - bounds[codes]
+
+    limit = soft[codes]
+    kept = ~rest & ((limit == 0) | (rank < limit))
+    levels_count = np.bincount(codes[~rest], minlength = len(long.columns))
+
+    other = np.flatnonzero(soft != 0)
+    other_counts = np.stack([np.bincount(codes[~kept], weights = counts[~kept, j], minlength = len(long.columns))[other]
+                             for j in range(len(long.count_cols))], axis = 1)
+    other_rank = np.minimum(soft, levels_count)[other]
+
+    kept &= (hard[codes] == 0) | (rank < hard[codes])
+    other_kept = (hard[other] == 0) | (other_rank < hard[other])
+
+    codes = np.concatenate([codes[kept], other[other_kept]])
+    rank = np.concatenate([rank[kept], other_rank[other_kept]])
+    levels = np.concatenate([levels[kept], np.full(other_kept.sum(), 'other/unsp', dtype = 'object')])
+    counts = np.concatenate([counts[kept], other_counts[other_kept]])
+    order = np.lexsort((rank, codes))
+
+    # appending the 'other/unsp' row leaves an unnamed object index, as pd.concat does in cat_table
+    index_names = [None if s != 0 else name for s, name in zip(soft, long.index_names)]
+    level_dtypes = [np.dtype('object') if s != 0 else dtype for s, dtype in zip(soft, long.level_dtypes)]
+
+    return Long_Pivots(long.columns, codes[order], levels[order], counts[order], long.count_cols, index_names,
+                       level_dtypes, long.count_dtypes)
+
+
+def bin_long(long, bin_length, upper_class, lower_class):
+    """
+    Desc: bin_pivot for every per value pivot of a long table at once: values up to lower_class summed into one row
+          labelled lower_class, values from upper_class up into one row labelled upper_class, the rest kept per value
+          or counted in bins of bin_length (see bin_codes)
+
+    Params:
+        long: Long_Pivots of per value numeric pivots, levels sorted within each column
+        bin_length, upper_class, lower_class: per column arrays of the Numerical_Graph_Config settings (0 is off)
+
+    output:
+        long: Long_Pivots of the binned pivots, same rows, labels and counts as bin_pivot
+
+    """
+
+    m = len(long.columns)
+    codes = long.codes
+    values = long.levels.astype('float64')
+
+    k, below, above, origin = bin_codes(values, bin_length, upper_class, lower_class, codes)
+    regular = ~below & ~above
+    binned = (bin_length != 0) & (np.bincount(codes[regular], minlength = m) > 0)
+    in_bins = regular & binned[codes]
+
+    k_min = np.full(m, np.iinfo('int64').max)
+    k_max = np.full(m, -1)
+    np.minimum.at(k_min, codes[in_bins], k[in_bins])
+    np.maximum.at(k_max, codes[in_bins], k[in_bins])
+
+    # rows per column: lower_class row, bins (empty ones included) or values, upper_class row
+    per_value = regular & ~binned[codes]
+    low, high = (lower_class != 0).astype('int64'), (upper_class != 0).astype('int64')
+    middle = np.where(binned, k_max - k_min + 1, np.bincount(codes[per_value], minlength = m))
+    sizes = low + middle + high
+    start = np.cumsum(sizes) - sizes
+
+    # per value rows keep their order within the column
+    value_rows = np.flatnonzero(per_value)
+    value_rank = np.arange(len(value_rows)) - np.searchsorted(codes[value_rows], codes[value_rows])
+
+    slot = np.empty(len(codes), dtype = 'int64')
+    slot[below] = start[codes[below]]
+    slot[in_bins] = (start + low - k_min)[codes[in_bins]] + k[in_bins]
+    slot[value_rows] = (start + low)[codes[value_rows]] + value_rank
+
+    # an upper_class below lower_class counts values in both rows, as bin_pivot does
+    counted = below | regular
+    slots = np.concatenate([slot[counted], (start + low + middle)[codes[above]]])
+    weights = np.concatenate([long.counts[counted], long.counts[above]])
+    counts = np.stack([np.bincount(slots, weights = weights[:, j], minlength = sizes.sum()) for j in range(len(long.count_cols))], axis = 1)
+
+    new_codes = np.repeat(np.arange(m), sizes)
+    position = np.arange(len(new_codes)) - start[new_codes]
+    first = (low[new_codes] == 1) & (position == 0)
+    last = (high[new_codes] == 1) & (position == sizes[new_codes] - 1)
+
+    labels = np.empty(len(new_codes), dtype = 'float64')
+    labels[first] = lower_class[new_codes[first]]
+    labels[last] = upper_class[new_codes[last]]
+    # bin labels are rounded per column, against that column's class rows
+    for i in np.flatnonzero(binned):
+        rows = slice(start[i] + low[i], start[i] + low[i] + middle[i])
+        labels[rows] = bin_labels(origin[i], np.arange(k_min[i], k_max[i] + 1), bin_length[i], [c for c in [lower_class[i], upper_class[i]] if c != 0])
+    labels[slot[value_rows]] = values[value_rows]
+
+    return Long_Pivots(long.columns, new_codes, labels.astype('object'), counts, long.count_cols, long.index_names,
+                       [np.dtype('float64')] * m, long.count_dtypes)
+
+
+def numeric_long(pivots, config_df, columns, count_cols, pyramids = None):
+    """
+    Desc: applies numerical config rows to every pivot at once, as numeric_table does. Pivots binned at pivot time are
+          used as they are and pivots with a Histogram_Pyramid are served from it, every per value pivot is binned in
+          one pass by bin_long. Pivots numeric_table would reject are left out
+
+    Params:
+        pivots: dict of column -> pivot
+        config_df: numerical configuration dataframe
+        columns: columns to treat
+        count_cols: count columns of the pivots (target types, or ['vals'] for histograms)
+        pyramids: optional dict of column -> Histogram_Pyramid
+
+    output:
+        long: Long_Pivots of the treated pivots
+
+    """
+
+    configs = config_df.loc[list(dict.fromkeys(columns)), ['bin_length', 'upper_class', 'lower_class']].to_dict('index')
+
+    ready, per_value = {}, {}
+    for col in columns:
+        temp, config = pivots[col], configs[col]
+        if not set(count_cols) <= set(temp.columns):
+            continue
+
+        pyramid = pyramids.get(col) if pyramids is not None else None
+        if 'binned' in temp.attrs:
+            if temp.attrs['binned'] == num_bins(config):
+                ready[col] = temp[list(count_cols)]
+        elif pyramid is not None and config['bin_length'] > 0:
+            ready[col] = pyramid.rebin(config['bin_length'], config['upper_class'], config['lower_class'])
+        elif pyramid is None or config['bin_length'] == 0:
+            per_value[col] = temp
+
+    settings = np.array([[configs[col][setting] for setting in ['bin_length', 'upper_class', 'lower_class']] for col in per_value],
+                        dtype = 'float64').reshape(-1, 3)
+    binned = bin_long(Long_Pivots.stack(per_value, count_cols), settings[:, 0], settings[:, 1], settings[:, 2])
+    return Long_Pivots.concat([Long_Pivots.stack(ready, count_cols), binned])
+
+
+def lift_tables(kind, pivots, config_df, columns, target_types = '', orders = None, pyramids = None):
+    """
+    Desc:
+        Treats the pivots of every column in one pass over a long table (see Long_Pivots) in place of cat_table or
+        numeric_table and the index of index_chart per column, with the same numbers. Columns it leaves out (pivots
+        the per column functions reject, or custom sort orders that are not a permutation of the pivot) are left to
+        render_column, which reports them.
+
+    Params:
+        kind: 'cat', 'cat_hist', 'numeric' or 'numeric_hist'
+        pivots: dict of column -> pivot
+        config_df: configuration dataframe of the kind
+        columns: columns to treat
+        target_types: the names of the two target types ('' for histograms)
+        orders: dict of column -> custom sort order of the custom_sort columns
+        pyramids: optional dict of column -> Histogram_Pyramid of the numeric columns
+
+    output:
+        tables: dict of column -> treated pivot, with the index and index benchmark columns for 'cat' and 'numeric'
+
+    """
+
+    target = kind in ['cat', 'numeric']
+    count_cols = list(target_types) if target else ['vals']
+
+    if kind in ['cat', 'cat_hist']:
+        long = cat_long(pivots, config_df, columns, count_cols, target_types[1] if target else 'vals', orders)
+    else:
+        long = numeric_long(pivots, config_df, columns, count_cols, pyramids)
+
+    frames = long.frames(target_types if target else '')
+    return {col: frames[col] for col in columns if col in frames}
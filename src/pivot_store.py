@@ -0,0 +1,333 @@
+import os
+import glob
+import json
+import hashlib
+import pandas as pd
+import numpy as np
+
+from src.data_prep import pivot_index
+from src.graph_config import cat_limit, num_bins
+
+
+def series_hash(series):
+    """
+    Desc: content hash of a column, based on the pandas row hashes so it is independent of memory layout
+
+    Params:
+        series: column to hash
+
+    output:
+        hex digest string
+
+    """
+
+    digest = hashlib.sha1()
+    digest.update(str(series.dtype).encode())
+    digest.update(str(len(series)).encode())
+    digest.update(pd.util.hash_pandas_object(series, index = False).values.tobytes())
+    return digest.hexdigest()
+
+def target_fingerprint(df, target_var = '', target_types = ''):
+    """
+    Desc: fingerprint of the target definition, shared by every pivot built against it
+
+    Params:
+        df: dataframe holding the target column
+        target_var: name of the target variable (default for histogram pivots)
+        target_types: the names of the two target values
+
+    output:
+        hex digest string
+
+    """
+
+    digest = hashlib.sha1()
+    digest.update(str(target_var).encode())
+    digest.update(str(list(target_types)).encode())
+    if target_var != '':
+        digest.update(series_hash(df[target_var]).encode())
+    return digest.hexdigest()
+
+def column_fingerprint(series, col, target_key):
+    """
+    Desc: fingerprint of a single pivot: column name, dtype, length and content together with the target definition
+
+    Params:
+        series: column values
+        col: column name
+        target_key: target_fingerprint of the target definition
+
+    output:
+        hex digest string
+
+    """
+
+    digest = hashlib.sha1()
+    digest.update(str(col).encode())
+    digest.update(series_hash(series).encode())
+    digest.update(target_key.encode())
+    return digest.hexdigest()
+
+
+class Pivot_Cache:
+
+    def __init__(self, root_folder, max_mb = 500):
+        """
+        Desc:
+            Persistent cache around pivot_index. Each pivot is saved under root_folder/Pivots/cache keyed by the
+            fingerprint of its column and target, and is only recomputed when that fingerprint changes.
+            Least recently used pivots are evicted once the cache exceeds max_mb.
+
+        Params:
+            root_folder: parent directory folder (default specified from section 2)
+            max_mb: size limit of the cache folder in megabytes
+
+        """
+
+        self.folder = root_folder + "/Pivots/cache"
+        self.max_bytes = max_mb * 1024**2
+        os.makedirs(self.folder, exist_ok = True)
+
+    def path(self, key):
+        return self.folder + "/" + key + ".pkl"
+
+    def pivot_index(self, df, columns, target_var = '', target_types = '', n_jobs = 1, profiler = None, config_df = None):
+        """
+        Desc: same as pivot_index, loading unchanged pivots from the cache
+
+        Params:
+            as per pivot_index
+
+        output:
+            pivots: the collection of pivots generated from df
+
+        """
+
+        target_key = target_fingerprint(df, target_var, target_types)
+        keys = {col: column_fingerprint(df[col], col, target_key) for col in columns}
+
+        # collapsed and binned pivots depend on the config row too
+        if config_df is not None:
+            rule = num_bins if 'bin_length' in config_df.columns else cat_limit
+            for col in columns:
+                if col in config_df.index and rule(config_df.loc[col]) is not None:
+                    keys[col] = hashlib.sha1((keys[col] + str(rule(config_df.loc[col]))).encode()).hexdigest()
+
+        pivots = {}
+        misses = []
+        for col in columns:
+            if os.path.isfile(self.path(keys[col])):
+                pivots[col] = pd.read_pickle(self.path(keys[col]))
+                os.utime(self.path(keys[col])) # marks as recently used
+            else:
+                misses.append(col)
+
+        print("pivot cache: " + str(len(columns) - len(misses)) + " loaded, " + str(len(misses)) + " computed")
+
+        if misses:
+            computed = pivot_index(df, misses, target_var, target_types, n_jobs, profiler, config_df)
+            for col in misses:
+                computed[col].to_pickle(self.path(keys[col]))
+                pivots[col] = computed[col]
+            self.evict()
+
+        return {col: pivots[col] for col in columns}
+
+    def evict(self):
+        # removes least recently used pivots until the cache fits in max_mb
+        files = sorted(glob.glob(self.folder + "/*.pkl"), key = os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+
+        while files and total > self.max_bytes:
+            oldest = files.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def clear(self):
+        # empties the cache folder
+        for f in glob.glob(self.folder + "/*.pkl"):
+            os.remove(f)
+
+
+# type tags of the levels of object indexes, stored as text with their tag so 1 and '1' stay apart
+LEVEL_PARSERS = {'str': str, 'int': int, 'float': float, 'bool': lambda text: text == 'True', 'null': lambda text: None}
+
+def level_tag(level):
+    # type tag of one level of an object index, bool first as it is also an int
+    if level is None:
+        return 'null'
+    if isinstance(level, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(level, (int, np.integer)):
+        return 'int'
+    if isinstance(level, (float, np.floating)):
+        return 'float'
+    if isinstance(level, str):
+        return 'str'
+    raise TypeError("levels of type " + type(level).__name__ + " can not be saved, convert the column to text or numbers first")
+
+def level_text(level, tag):
+    # text of one level that its parser in LEVEL_PARSERS turns back into the same value
+    if tag == 'null':
+        return None
+    if tag == 'float':
+        return repr(float(level))
+    if tag == 'int':
+        return str(int(level))
+    return str(level)
+
+def save_pivots(pivots, path):
+    """
+    Desc:
+        Writes a collection of pivots into one uncompressed Arrow (Feather v2) file in long format, one row per
+        (column, level) with a count column per class, plus a JSON index of where each column's rows start. Replaces
+        one CSV per column: numeric levels are kept as numbers and the index dtype is restored on load (see Pivot_Store).
+        Levels of object indexes keep their type as well, as long as they are text, numbers, booleans or None.
+
+        Layout of path.arrow:
+            column: column name
+            level: text levels (null for numeric columns and missing levels)
+            level_type: type tag of each level of an object index (see LEVEL_PARSERS), null for other indexes
+            value: numeric levels (null for text columns)
+            count_0, count_1, ...: counts of every class seen across the pivots (e.g. the two target types, or 'vals')
+
+    Params:
+        pivots: dict of column -> pivot (e.g. {**numeric_pivots, **cat_pivots}), or a Pivot_Store
+        path: output path without extension e.g. root_folder + "/Pivots/pivots"
+
+    """
+
+    import pyarrow as pa # optional dependency, only needed for the pivot store
+    import pyarrow.feather as feather
+
+    columns = list(pivots.keys())
+    temps = [pivots[col] for col in columns]
+
+    count_names = []
+    for temp in temps:
+        count_names.extend([name for name in temp.columns if name not in count_names])
+
+    lengths = np.array([len(temp) for temp in temps], dtype = 'int64')
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    counts = np.full((offsets[-1], len(count_names)), np.nan)
+    values = np.full(offsets[-1], np.nan)
+    levels = np.full(offsets[-1], None, dtype = 'object')
+    tags = np.full(offsets[-1], None, dtype = 'object')
+    index = []
+
+    for i, (col, temp) in enumerate(zip(columns, temps)):
+        rows = slice(offsets[i], offsets[i + 1])
+        positions = [count_names.index(name) for name in temp.columns]
+        counts[rows, positions] = temp.to_numpy(dtype = 'float64')
+
+        # numbers stay numbers, any other level is stored as text and cast back on load
+        numeric = temp.index.dtype.kind in 'iufb'
+        tagged = temp.index.dtype == 'object'
+        if numeric:
+            values[rows] = np.asarray(temp.index, dtype = 'float64')
+        elif tagged:
+            level_tags = [level_tag(level) for level in temp.index]
+            tags[rows] = level_tags
+            levels[rows] = [level_text(level, tag) for level, tag in zip(temp.index, level_tags)]
+        else:
+            levels[rows] = np.where(temp.index.isna(), None, np.asarray(temp.index.astype(str), dtype = 'object'))
+
+        index.append({'column': col, 'offset': int(offsets[i]), 'rows': int(lengths[i]),
+                      'level_dtype': str(temp.index.dtype), 'numeric': numeric, 'tagged': tagged, 'index_name': temp.index.name,
+                      'counts': positions, 'count_dtypes': [str(dtype) for dtype in temp.dtypes], 'attrs': temp.attrs})
+
+    arrays = {'column': pa.DictionaryArray.from_arrays(pa.array(np.repeat(np.arange(len(columns)), lengths), type = pa.int32()),
+                                                       pa.array([str(col) for col in columns], type = pa.string())),
+              'level': pa.array(levels, type = pa.string()),
+              'level_type': pa.array(tags, type = pa.string()).dictionary_encode(),
+              'value': pa.array(values, type = pa.float64())}
+    for position in range(len(count_names)):
+        arrays['count_' + str(position)] = pa.array(counts[:, position], type = pa.float64())
+
+    # uncompressed, so Pivot_Store can memory map the file and read one column's rows without loading the rest
+    feather.write_feather(pa.table(arrays), path + ".arrow", compression = 'uncompressed')
+
+    # class labels of multiclass pivots can be numpy scalars
+    count_names = [name.item() if isinstance(name, np.generic) else name for name in count_names]
+    with open(path + ".json", 'w') as f:
+        json.dump({'count_names': count_names, 'pivots': index}, f)
+
+
+class Pivot_Store:
+
+    def __init__(self, path):
+        """
+        Desc:
+            Read only, dict like view of the pivots written by save_pivots. Only the JSON index is read up front; the
+            Arrow file is memory mapped and each pivot is built from its own rows when it is first asked for, so a
+            single column loads without reading the others. Can be passed to the graph generators in place of the
+            pivots dict.
+
+        Params:
+            path: path given to save_pivots e.g. root_folder + "/Pivots/pivots"
+
+        """
+
+        self.path = path
+        with open(path + ".json") as f:
+            index = json.load(f)
+
+        self.count_names = index['count_names']
+        self.index = {entry['column']: entry for entry in index['pivots']}
+        self.table = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __contains__(self, col):
+        return col in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def items(self):
+        return ((col, self[col]) for col in self.index)
+
+    def __getitem__(self, col):
+        """
+        Desc: pivot of one column, in the layout pivot_index produced
+
+        Params:
+            col: column name
+
+        output:
+            temp: dataframe of counts indexed by level
+
+        """
+
+        import pyarrow as pa # optional dependency, only needed for the pivot store
+
+        entry = self.index[col]
+        if self.table is None:
+            # zero copy: only the pages of the rows that are read are loaded
+            self.table = pa.ipc.open_file(pa.memory_map(self.path + ".arrow", 'r')).read_all()
+
+        rows = self.table.slice(entry['offset'], entry['rows'])
+
+        if entry['numeric']:
+            levels = pd.Index(rows.column('value').to_numpy()).astype(entry['level_dtype'])
+        elif entry.get('tagged', False):
+            texts = rows.column('level').to_pylist()
+            levels = pd.Index([LEVEL_PARSERS[tag](text) for text, tag in zip(texts, rows.column('level_type').to_pylist())], dtype = 'object')
+        else:
+            levels = pd.Index(rows.column('level').to_numpy(zero_copy_only = False)).astype(entry['level_dtype'])
+        levels.name = entry['index_name']
+
+        temp = pd.DataFrame({self.count_names[position]: rows.column('count_' + str(position)).to_numpy().astype(dtype)
+                             for position, dtype in zip(entry['counts'], entry['count_dtypes'])}, index = levels)
+        temp.attrs.update(entry.get('attrs', {}))
+        return temp
+
+    def load(self, columns = None):
+        # pivots dict of a list of columns (default every column)
+        if columns is None:
+            columns = list(self.index)
+        return {col: self[col] for col in columns}
@@ -0,0 +1,168 @@
+import json
+import weakref
+import tracemalloc
+import pandas as pd
+import numpy as np
+
+
+RECORD_COLUMNS = ['stage', 'column', 'seconds', 'rows', 'levels', 'peak_mb']
+
+# meters of the stages being measured. A lap resets the traced peak, so the peak reached so far is first passed on
+# to the other meters, which lets stages be measured inside other stages
+open_meters = weakref.WeakSet()
+
+
+def start_tracing():
+    # traces memory allocations of this process from here on. Also the process pool initializer that carries tracing
+    # over to the worker processes of a traced run
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+class Memory_Meter:
+
+    def __init__(self):
+        """
+        Desc:
+            Peak memory of a stage, measured with tracemalloc as the most memory traced (python objects and the numpy
+            buffers of arrays and dataframes) above what was already in use when the stage started. Stages measured
+            one after another share a meter through lap. Measures NaN unless start_tracing was called in the process,
+            so untraced runs pay nothing for it. Memory allocated outside python and numpy (e.g. the matplotlib
+            renderer) is not traced.
+
+        output:
+            object whose lap returns the peak megabytes since the previous lap, also kept in peaks by stage name
+
+        """
+
+        self.peaks = {}
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing:
+            self.peak = 0
+            open_meters.add(self)
+            self.reset()
+
+    def reset(self):
+        current, peak = tracemalloc.get_traced_memory()
+        for meter in open_meters:
+            meter.peak = max(meter.peak, peak)
+        tracemalloc.reset_peak()
+        self.start, self.peak = current, current
+
+    def lap(self, stage = ''):
+        # peak megabytes of the stage that just finished, the next stage is measured from here
+        if not self.tracing:
+            peak_mb = np.nan
+        else:
+            peak_mb = (max(self.peak, tracemalloc.get_traced_memory()[1]) - self.start) / 1024**2
+            self.reset()
+        self.peaks[stage] = peak_mb
+        return peak_mb
+
+
+class Stage_Profiler:
+
+    def __init__(self):
+        """
+        Desc:
+            Collects per column, per stage timings across Data_Prep, pivot_index, the config classes and the graph
+            generators, which all take it as an optional profiler argument. Stages recorded:
+                profile: column profiling in Data_Prep (rows = rows profiled, levels = distinct values)
+                date_detect, compact: whole dataframe steps of Data_Prep
+                pivot: pivot of a column (rows = rows counted, levels = pivot rows)
+                config: config creation for a list of columns (levels = number of columns)
+                transform: config rows applied to the pivots, one record for the lift_tables pass over every column of
+                           a graph generate call, per column for the pivots it leaves out (rows = pivot rows, levels = rows
+                           left to draw)
+                draw: index computation and chart update
+                savefig: writing the chart file
+            peak_mb is the peak memory of the stage alone (see Memory_Meter). Creating a profiler starts tracing memory
+            allocations (start_tracing), which slows allocation heavy stages somewhat, in the worker processes as well.
+
+        output:
+            object with a records list, a report dataframe, summaries and save
+
+        """
+
+        self.records = []
+        start_tracing()
+
+    def record(self, stage, column = '', seconds = 0.0, rows = np.nan, levels = np.nan, peak_mb = np.nan):
+        # adds one timing, column is '' for stages that cover several columns at once
+        self.records.append({'stage': stage,
+                             'column': column,
+                             'seconds': seconds,
+                             'rows': rows,
+                             'levels': levels,
+                             'peak_mb': peak_mb})
+
+    def report(self):
+        # every record as a dataframe
+        return pd.DataFrame(self.records, columns = RECORD_COLUMNS)
+
+    def stage_summary(self):
+        """
+        Desc: totals per stage, slowest stage first
+
+        output:
+            dataframe indexed by stage with records (number of timings), seconds, max_seconds, peak_mb and share of
+            the total time
+
+        """
+
+        report = self.report()
+        summary = report.groupby('stage', sort = False).agg(records = ('seconds', 'count'), seconds = ('seconds', 'sum'),
+                                                            max_seconds = ('seconds', 'max'), peak_mb = ('peak_mb', 'max'))
+        summary['share'] = summary['seconds'] / summary['seconds'].sum()
+        return summary.sort_values('seconds', ascending = False)
+
+    def column_summary(self, top = 10):
+        """
+        Desc: slowest columns over every stage, the high cardinality columns worth regrouping show up here
+
+        Params:
+            top: number of columns kept
+
+        output:
+            dataframe indexed by column with seconds (all stages), rows, levels (largest seen), slowest_stage and its seconds
+
+        """
+
+        report = self.report()
+        report = report[report['column'] != '']
+
+        summary = report.groupby('column').agg(seconds = ('seconds', 'sum'), rows = ('rows', 'max'), levels = ('levels', 'max'))
+        slowest = report.loc[report.groupby('column')['seconds'].idxmax()].set_index('column')
+        summary['slowest_stage'] = slowest['stage']
+        summary['slowest_stage_seconds'] = slowest['seconds']
+        return summary.sort_values('seconds', ascending = False).head(top)
+
+    def summary(self, top = 10):
+        # prints and returns the stage and column summaries
+        stages, columns = self.stage_summary(), self.column_summary(top)
+        print("time per stage:")
+        print(stages)
+        print("slowest " + str(len(columns)) + " columns:")
+        print(columns)
+        return stages, columns
+
+    def save(self, path, top = 10):
+        """
+        Desc: writes the report to path.csv (one row per record) and path.json (stage summary, slowest columns and records)
+
+        Params:
+            path: output path without extension e.g. root_folder + "/profile"
+            top: number of columns in the slowest columns summary
+
+        """
+
+        self.report().to_csv(path + ".csv", index = False)
+
+        def records(df):
+            # to_json turns NaN into null, which json.dump would not
+            return json.loads(df.to_json(orient = 'records'))
+
+        with open(path + ".json", 'w') as f:
+            json.dump({'stages': records(self.stage_summary().reset_index()),
+                       'slowest_columns': records(self.column_summary(top).reset_index()),
+                       'records': records(self.report())}, f, indent = 1)
@@ -0,0 +1,399 @@
+import math
+import time
+import pandas as pd
+import numpy as np
+
+
+def hash_values(values):
+    """
+    Desc: 64 bit hashes of the non-missing values of a column. Integers are hashed as floats so that chunks of the
+          same column with and without missing values hash equal values the same way, and -0.0 as 0.0
+
+    Params:
+        values: series
+
+    output:
+        uint64 numpy array, one hash per non-missing value
+
+    """
+
+    values = values.dropna()
+    if pd.api.types.is_integer_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+        values = values.astype('float64')
+    if pd.api.types.is_float_dtype(values.dtype):
+        # -0.0 + 0.0 is 0.0, so both zeros hash as the one value unique() sees
+        values = values + 0.0
+    return pd.util.hash_pandas_object(values, index = False).values
+
+def leading_zeros(w):
+    # number of leading zero bits of uint64 values, computed on 32 bit halves so float log2 stays exact
+    hi = (w >> np.uint64(32)).astype('float64')
+    lo = (w & np.uint64(0xFFFFFFFF)).astype('float64')
+
+    with np.errstate(divide = 'ignore'):
+        lz_hi = 31 - np.floor(np.log2(hi))
+        lz_lo = 63 - np.floor(np.log2(lo))
+
+    return np.where(hi > 0, lz_hi, np.where(lo > 0, lz_lo, 64)).astype('int64')
+
+
+class Distinct_Sketch:
+
+    def __init__(self, error = 0.01, exact_limit = 10000):
+        """
+        Desc:
+            Distinct value counter. Counts exactly (a set of value hashes) until exact_limit distinct values have been seen,
+            then switches to a HyperLogLog register array of constant size. Sketches of the same column built from
+            different chunks or partitions can be merged.
+
+        Params:
+            error: target relative standard error of the HyperLogLog estimate (1.04 / sqrt(registers))
+            exact_limit: number of distinct values counted exactly before switching to the sketch
+
+        """
+
+        self.precision = min(18, max(4, math.ceil(math.log2((1.04 / error)**2))))
+        self.exact_limit = exact_limit
+        self.exact = set()
+        self.registers = None
+
+    def update(self, hashes):
+        # adds uint64 value hashes
+        if self.registers is None:
+            self.exact.update(np.unique(hashes).tolist())
+            if len(self.exact) > self.exact_limit:
+                self.to_registers()
+        else:
+            self.add_registers(hashes)
+
+    def to_registers(self):
+        # switches from exact counting to the HyperLogLog registers
+        self.registers = np.zeros(2**self.precision, dtype = 'uint8')
+        self.add_registers(np.fromiter(self.exact, dtype = 'uint64', count = len(self.exact)))
+        self.exact = set()
+
+    def add_registers(self, hashes):
+        p = np.uint64(self.precision)
+        buckets = (hashes >> (np.uint64(64) - p)).astype('int64')
+
+        # position of the first set bit in the remaining 64 - p bits
+        rho = np.minimum(leading_zeros(hashes << p) + 1, 64 - self.precision + 1).astype('uint8')
+        np.maximum.at(self.registers, buckets, rho)
+
+    def merge(self, other):
+        """
+        Desc: merges another sketch of the same column into this one
+
+        Params:
+            other: Distinct_Sketch built with the same error
+
+        """
+
+        if other.registers is None and self.registers is None:
+            self.exact |= other.exact
+            if len(self.exact) > self.exact_limit:
+                self.to_registers()
+            return
+
+        if self.registers is None:
+            self.to_registers()
+        if other.registers is None:
+            self.add_registers(np.fromiter(other.exact, dtype = 'uint64', count = len(other.exact)))
+        else:
+            np.maximum(self.registers, other.registers, out = self.registers)
+
+    def count(self):
+        """
+        Desc: number of distinct values, exact while below exact_limit
+
+        output:
+            distinct count (rounded estimate once the sketch is in use)
+
+        """
+
+        if self.registers is None:
+            return len(self.exact)
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m**2 / np.sum(2.0 ** -self.registers.astype('float64'))
+
+        # linear counting for the small range
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+
+class Column_Sketch:
+
+    def __init__(self, error = 0.01, exact_limit = 10000):
+        """
+        Desc:
+            Constant memory column profile for the ID, trivial, null and per-class presence checks of Data_Prep
+
+        Params:
+            error, exact_limit: as per Distinct_Sketch
+
+        """
+
+        self.dtype = None
+        self.n_rows = 0
+        self.null_count = 0
+        self.distinct = Distinct_Sketch(error, exact_limit)
+        self.class_counts = pd.Series(dtype = 'int64')
+        self.seconds = 0.0
+
+    def update(self, values, target = None):
+        """
+        Desc: adds a chunk of the column
+
+        Params:
+            values: series of column values
+            target: series of target values aligned with values (default skips the per-class presence)
+
+        """
+
+        start = time.time()
+
+        self.dtype = str(values.dtype)
+        self.n_rows += len(values)
+        valid = values.notna()
+        self.null_count += int(len(values) - valid.sum())
+        self.distinct.update(hash_values(values))
+
+        if target is not None:
+            present = target[valid.values].value_counts()
+            self.class_counts = self.class_counts.add(present, fill_value = 0)
+
+        self.seconds += time.time() - start
+
+    @classmethod
+    def from_counts(cls, counts, dtype, error = 0.01, exact_limit = 10000, seconds = 0.0):
+        """
+        Desc: sketch of a column from its exact counts, e.g. when those grow too large to keep
+
+        Params:
+            counts: series of row counts indexed by value, or by (value, target)
+            dtype: dtype string of the column
+            error, exact_limit: as per Distinct_Sketch
+            seconds: time already spent on the column
+
+        output:
+            Column_Sketch equal to one fed the rows behind the counts
+
+        """
+
+        sketch = cls(error, exact_limit)
+        values = counts.index.get_level_values(0)
+        valid = ~values.isna()
+
+        sketch.dtype = dtype
+        sketch.n_rows = int(counts.sum())
+        sketch.null_count = int(counts[~valid].sum())
+        sketch.distinct.update(hash_values(pd.Series(values[valid]).drop_duplicates()))
+        if counts.index.nlevels > 1:
+            present = counts[valid].groupby(level = 1).sum()
+            sketch.class_counts = present[present > 0]
+        sketch.seconds = seconds
+        return sketch
+
+    def merge(self, other):
+        # merges the sketch of the same column from another chunk or partition
+        self.dtype = other.dtype if self.dtype is None else self.dtype
+        self.n_rows += other.n_rows
+        self.null_count += other.null_count
+        self.distinct.merge(other.distinct)
+        self.class_counts = self.class_counts.add(other.class_counts, fill_value = 0)
+        self.seconds += other.seconds
+
+    def record(self, dtype = None):
+        # profile_columns row for this column, the top value is not tracked
+        return {'dtype': self.dtype if dtype is None else dtype,
+                'n_rows': self.n_rows,
+                'null_count': self.null_count,
+                'n_unique': self.distinct.count(),
+                'top_value': np.nan,
+                'top_count': 0,
+                'target_levels': int((self.class_counts > 0).sum()),
+                'seconds': self.seconds}
+
+
+def sketch_profile(sketches, dtypes = None):
+    """
+    Desc: profile dataframe in the profile_columns layout from a dict of column sketches
+
+    Params:
+        sketches: dict of column name -> Column_Sketch
+        dtypes: optional dict of column name -> resolved dtype string (e.g. across chunks)
+
+    output:
+        profile: dataframe indexed by column name
+
+    """
+
+    if dtypes is None:
+        dtypes = {}
+
+    profile = pd.DataFrame.from_dict({col: sketch.record(dtypes.get(col)) for col, sketch in sketches.items()}, orient = 'index')
+    profile.index.name = 'column'
+    return profile
+
+def sketch_profile_columns(df, target_var = '', error = 0.01, exact_limit = 10000):
+    """
+    Desc: sketch based alternative to profile_columns. Distinct counts are exact below exact_limit and within the
+          HyperLogLog error above it, so the ID rule only differs from the exact method for columns whose distinct
+          ratio is within that error of id_threshold. The trivial, null and num_exclude rules stay exact.
+
+    Params:
+        df: dataframe
+        target_var: name of the target variable (default skips the per-target-class presence count)
+        error, exact_limit: as per Distinct_Sketch
+
+    output:
+        profile: dataframe in the profile_columns layout
+
+    """
+
+    target = df[target_var] if target_var in df.columns else None
+
+    sketches = {}
+    for col in df.columns:
+        sketches[col] = Column_Sketch(error, exact_limit)
+        sketches[col].update(df[col], target)
+
+    return sketch_profile(sketches)
+
+
+class Quantile_Sketch:
+
+    def __init__(self, k = 200, seed = 0):
+        """
+        Desc:
+            Mergeable KLL quantile sketch. Values are held in compactors of weight 1, 2, 4, ...; a full compactor is
+            sorted and every other item (random offset) is promoted to the next level. Memory is bounded by about 3k items
+            whatever the number of values fed in, and sketches of different chunks or partitions merge level by level.
+
+            Rank error guarantee: for any quantile q the returned value has a rank within epsilon * n of q * n, where
+            epsilon is O(1/k) (Karnin, Lang & Liberty 2016). For the default k = 200 this is about 1.65% of n with
+            99% confidence. Returned values are always values that were fed in, and the 0 and 1 quantiles are exact.
+
+        Params:
+            k: size of the top compactor, trades accuracy (~1/k) against memory (~3k items)
+            seed: seed for the compaction offsets, so results are reproducible
+
+        """
+
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.dtype = None
+
+    def capacity(self, h):
+        # lower levels get geometrically smaller capacities, the top level holds k items
+        depth = len(self.levels) - h - 1
+        return max(2, int(math.ceil(self.k * (2 / 3)**depth)))
+
+    def update(self, values):
+        """
+        Desc: adds a chunk of values, missing values are ignored
+
+        Params:
+            values: series or array of numbers
+
+        """
+
+        dtype = str(getattr(values, 'dtype', 'float64'))
+        values = np.asarray(values, dtype = 'float64')
+        values = values[~np.isnan(values)]
+
+        self.dtype = resolve_sketch_dtype(self.dtype, dtype)
+        if len(values) == 0:
+            return
+
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def compress(self):
+        # compacts the lowest full level until every level fits its capacity
+        while True:
+            full = [h for h in range(len(self.levels)) if len(self.levels[h]) > self.capacity(h)]
+            if not full:
+                return
+
+            h = full[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+
+            items = np.sort(self.levels[h])
+            odd = len(items) % 2
+            offset = self.rng.integers(2)
+
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[odd:][offset::2]])
+            self.levels[h] = items[:odd]
+
+    def merge(self, other):
+        """
+        Desc: merges another sketch (e.g. of another chunk or partition of the same column) into this one
+
+        Params:
+            other: Quantile_Sketch
+
+        """
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.dtype = resolve_sketch_dtype(self.dtype, other.dtype)
+        self.compress()
+
+    def quantile(self, q):
+        """
+        Desc: approximate quantiles
+
+        Params:
+            q: quantile or list of quantiles between 0 and 1
+
+        output:
+            value (or list of values) from the data, NaN if the sketch is empty
+
+        """
+
+        qs = np.atleast_1d(np.asarray(q, dtype = 'float64'))
+
+        if self.n == 0:
+            result = np.full(len(qs), np.nan)
+        else:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(items_h), 2.0**h) for h, items_h in enumerate(self.levels)])
+            order = np.argsort(items, kind = 'stable')
+            items, cumulative = items[order], np.cumsum(weights[order])
+
+            positions = np.searchsorted(cumulative, qs * cumulative[-1], side = 'left')
+            result = items[np.clip(positions, 0, len(items) - 1)]
+            result = np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, result))
+
+        return result[0] if np.ndim(q) == 0 else list(result)
+
+    def count(self):
+        # number of non-missing values fed in, exact
+        return self.n
+
+
+def resolve_sketch_dtype(left, right):
+    # int64 when every chunk was integer, float64 as soon as one was not
+    if left is None or left == right:
+        return right
+    return 'float64'
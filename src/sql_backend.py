@@ -0,0 +1,249 @@
+import time
+import pandas as pd
+import numpy as np
+import sqlalchemy as sa
+
+from src.data_prep import profile_exclusions, report_exclusions, date_detect, collapse_pivot
+from src.streaming import pivot_from_counts
+
+
+def sql_dtype(col_type):
+    """
+    Desc: maps a SQLAlchemy column type to the dtype pandas would load it as
+
+    Params:
+        col_type: SQLAlchemy type instance as returned by the inspector
+
+    output:
+        dtype string ('int64', 'float64', 'datetime64[ns]' or 'object')
+
+    """
+
+    if isinstance(col_type, sa.Integer):
+        return 'int64'
+    if isinstance(col_type, (sa.Float, sa.Numeric)):
+        return 'float64'
+    if isinstance(col_type, (sa.Date, sa.DateTime)):
+        return 'datetime64[ns]'
+    return 'object'
+
+def chunked(columns, size):
+    # splits a column list into batches so single statements stay a manageable width
+    return [columns[i:i + size] for i in range(0, len(columns), size)]
+
+
+class Sql_Data_Prep:
+
+    def __init__(self, engine, table, target_var = '', id_threshold = 0.5, null_threshold = 0.99, columns = None,
+                 batch_size = 100, sample_size = 1000):
+        """
+        Desc:
+            Equivalent of Data_Prep that pushes the profiling and pivot counts down into the database. Only aggregate rows
+            (counts per column, per target class and per (value, target) pair) are returned, plus at most sample_size
+            distinct values of each text column for date detection.
+
+        Params:
+            engine: SQLAlchemy engine
+            table: name of the table to analyse
+            target_var: name of the target variable (default allows regular histogram tables to be generated)
+            id_threshold, null_threshold: as per Data_Prep
+            columns: subset of columns to analyse (default all columns of the table)
+            batch_size: number of columns aggregated per statement
+            sample_size: number of distinct values sampled per text column for date detection
+
+        output:
+            object with the Data_Prep column lists and a pivots method
+
+        """
+
+        self.engine = engine
+        self.target_var = target_var
+        self.batch_size = batch_size
+
+        schema = {c['name']: c['type'] for c in sa.inspect(engine).get_columns(table)}
+        if columns is None:
+            columns = list(schema)
+        elif target_var != '' and target_var not in columns:
+            columns = [target_var] + list(columns)
+
+        self.columns = list(columns)
+        self.table = sa.table(table, *[sa.column(col) for col in schema])
+        self.target = self.table.c[target_var] if target_var in schema else None
+
+        start = time.time()
+        self.profile = self.profile_columns()
+        print("profiled " + str(len(self.columns)) + " columns in " + str(round(time.time() - start, 2)) + "s")
+
+        # columns that pandas would load as float because of missing values
+        self.dtypes = {col: sql_dtype(schema[col]) for col in self.columns}
+        for col in self.columns:
+            if self.dtypes[col] == 'int64' and self.profile.loc[col, 'null_count'] > 0:
+                self.dtypes[col] = 'float64'
+        self.profile['dtype'] = pd.Series(self.dtypes)
+
+        Ids_cats, trivial, null_cols, num_exclude = profile_exclusions(self.profile, id_threshold, null_threshold)
+
+        self.Ids_cats = Ids_cats
+        self.trivial = trivial
+        self.date_formats = {}
+        self.date_cols = [col for col in self.columns if self.dtypes[col] == 'datetime64[ns]'] + date_detect(self.date_sample(sample_size), date_formats = self.date_formats)
+        self.null_cols = null_cols
+        self.num_exclude = num_exclude if self.target is not None else []
+        report_exclusions(self)
+
+        keep = [col for col in self.columns if col != target_var and col not in self.total_exclude]
+        self.numeric_cols = pd.Index([col for col in keep if self.dtypes[col] in ['float64', 'int64']])
+        self.cat_cols = pd.Index([col for col in keep if self.dtypes[col] == 'object'])
+
+        if self.target is not None:
+            query = sa.select(self.target).where(self.target.isnot(None)).group_by(self.target).order_by(self.target)
+            with self.engine.connect() as conn:
+                self.target_vals = [row[0] for row in conn.execute(query)]
+
+    def profile_columns(self):
+        """
+        Desc: profile_columns equivalent computed with one aggregate statement per batch of columns for the row, null and
+              distinct counts, and one GROUP BY target statement per batch for the per-class presence
+
+        output:
+            profile: dataframe indexed by column name in the profile_columns layout (top_value is not computed in the database)
+
+        """
+
+        records = {col: {} for col in self.columns}
+
+        with self.engine.connect() as conn:
+            for batch in chunked(self.columns, self.batch_size):
+                start = time.time()
+
+                exprs = [sa.func.count().label('n_rows')]
+                for i, col in enumerate(batch):
+                    exprs.append(sa.func.count(self.table.c[col]).label('n' + str(i)))
+                    exprs.append(sa.func.count(sa.distinct(self.table.c[col])).label('d' + str(i)))
+                row = conn.execute(sa.select(*exprs).select_from(self.table)).mappings().one()
+
+                if self.target is not None:
+                    presence = [sa.func.count(self.table.c[col]).label('n' + str(i)) for i, col in enumerate(batch)]
+                    query = sa.select(*presence).where(self.target.isnot(None)).group_by(self.target)
+                    per_class = pd.DataFrame(conn.execute(query).mappings().all())
+                else:
+                    per_class = pd.DataFrame()
+
+                # query time spread evenly across the batch
+                seconds = (time.time() - start) / len(batch)
+
+                for i, col in enumerate(batch):
+                    records[col] = {'dtype': 'object',
+                                    'n_rows': int(row['n_rows']),
+                                    'null_count': int(row['n_rows'] - row['n' + str(i)]),
+                                    'n_unique': int(row['d' + str(i)]),
+                                    'top_value': np.nan,
+                                    'top_count': 0,
+                                    'target_levels': int((per_class['n' + str(i)] > 0).sum()) if len(per_class) else 0,
+                                    'seconds': seconds}
+
+        profile = pd.DataFrame.from_dict(records, orient = 'index')
+        profile.index.name = 'column'
+        return profile
+
+    def date_sample(self, sample_size):
+        # small sample of distinct values of each text column, used for date detection
+        sample = {}
+        with self.engine.connect() as conn:
+            for col in self.columns:
+                if self.dtypes[col] != 'object':
+                    continue
+                column = self.table.c[col]
+                query = sa.select(column).where(column.isnot(None)).distinct().limit(sample_size)
+                sample[col] = pd.Series([row[0] for row in conn.execute(query)], dtype = 'object')
+        return pd.DataFrame({col: values.reindex(range(max([len(v) for v in sample.values()], default = 0))) for col, values in sample.items()})
+
+    def crosstab_counts(self, columns, target_types = ''):
+        """
+        Desc: per (value, target) row counts for a list of columns, with one statement per batch of columns: GROUPING SETS
+              on databases that support it (e.g. postgresql) and a UNION ALL of per-column GROUP BYs otherwise (e.g. sqlite)
+
+        Params:
+            columns: list of columns
+            target_types: default counts per value only
+
+        output:
+            counts: dict of column name -> count series indexed by (value, target) or by value
+
+        """
+
+        use_target = target_types != '' and self.target is not None
+        grouping_sets = self.engine.dialect.name == 'postgresql'
+        counts = {}
+
+        with self.engine.connect() as conn:
+            for batch in chunked(list(columns), self.batch_size):
+                if grouping_sets:
+                    rows = pd.DataFrame(conn.execute(self.grouping_sets_query(batch, use_target)).mappings().all())
+                    for i, col in enumerate(batch):
+                        # grouping() is 0 for the rows grouped by this column
+                        part = rows[rows['g' + str(i)] == 0] if len(rows) else rows
+                        counts[col] = self.to_counts(part, col, use_target)
+                    continue
+
+                # one union per dtype, so each statement returns a single value type
+                for dtype in dict.fromkeys(self.dtypes[col] for col in batch):
+                    group = [col for col in batch if self.dtypes[col] == dtype]
+                    rows = pd.DataFrame(conn.execute(self.union_query(group, use_target)).mappings().all())
+                    for i, col in enumerate(group):
+                        part = rows[rows['k'] == i].rename(columns = {'v': col}) if len(rows) else rows
+                        counts[col] = self.to_counts(part, col, use_target)
+
+        return counts
+
+    def grouping_sets_query(self, batch, use_target):
+        # one GROUPING SETS statement over a batch of columns, with a grouping() flag per column
+        cols = [self.table.c[col] for col in batch]
+        keys = [sa.tuple_(col, self.target) if use_target else sa.tuple_(col) for col in cols]
+        exprs = cols + [sa.func.grouping(col).label('g' + str(i)) for i, col in enumerate(cols)]
+        exprs += [self.target, sa.func.count().label('n')] if use_target else [sa.func.count().label('n')]
+        return sa.select(*exprs).group_by(sa.func.grouping_sets(*keys))
+
+    def union_query(self, batch, use_target):
+        # UNION ALL of one GROUP BY per column, each row tagged with the position k of its column in the batch
+        queries = []
+        for i, col in enumerate(batch):
+            column = self.table.c[col]
+            keys = [column, self.target] if use_target else [column]
+            exprs = [sa.literal(i).label('k'), column.label('v')] + keys[1:] + [sa.func.count().label('n')]
+            queries.append(sa.select(*exprs).group_by(*keys))
+        return sa.union_all(*queries) if len(queries) > 1 else queries[0]
+
+    def to_counts(self, rows, col, use_target):
+        # count series in the layout pivot_from_counts expects
+        keys = [col, self.target_var] if use_target else [col]
+        if len(rows) == 0:
+            return pd.Series([], index = pd.MultiIndex.from_arrays([[]] * len(keys)), dtype = 'int64')
+        return rows.set_index(keys)['n'].astype('int64')
+
+    def pivots(self, columns, target_types = '', config_df = None):
+        """
+        Desc: produces the same pivots dict as pivot_index over the full table, with the counting done in the database
+
+        Params:
+            columns: list of columns (e.g. cat_cols or numeric_cols)
+            target_types: the names of the two target values (default allows regular histogram tables to be generated)
+            config_df: optional categorical config, collapses columns to the levels their graph shows (as per pivot_index)
+
+        output:
+            pivots: the collection of pivots
+
+        """
+
+        counts = self.crosstab_counts(columns, target_types)
+
+        if target_types == '':
+            pivots = {col: pivot_from_counts(counts[col], col, self.dtypes[col]) for col in columns}
+        else:
+            pivots = {col: pivot_from_counts(counts[col], col, self.dtypes[col], self.target_var, target_types) for col in columns}
+
+        if config_df is not None:
+            sort_col = target_types[1] if target_types != '' else 'vals'
+            pivots = {col: collapse_pivot(temp, config_df.loc[col], sort_col) if col in config_df.index else temp for col, temp in pivots.items()}
+
+        return pivots
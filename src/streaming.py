@@ -0,0 +1,539 @@
+import os
+import io
+import glob
+import fnmatch
+import time
+import boto3
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from src.data_prep import profile_exclusions, report_exclusions, date_detect, collapse_pivot, is_text_dtype
+from src.sketches import Column_Sketch, Quantile_Sketch, sketch_profile
+
+
+def read_chunks(path, chunksize = 500000, file_format = None, **read_kwargs):
+    """
+    Desc: reads a CSV file in chunks of rows, or a Parquet file one row group at a time
+
+    Params:
+        path: path to a .csv or .parquet file, or a file object
+        chunksize: number of rows per chunk for CSV input (Parquet uses the file's own row groups)
+        file_format: 'csv' or 'parquet' (default taken from the file extension)
+        read_kwargs: passed on to pd.read_csv / ParquetFile.read_row_group (e.g. usecols, dtype, columns)
+
+    output:
+        generator of dataframe chunks
+
+    """
+
+    if file_format is None:
+        file_format = 'parquet' if os.path.splitext(str(path))[1].lower() in ['.parquet', '.pq'] else 'csv'
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq # optional dependency, only needed for parquet input
+
+        parquet_file = pq.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(i, **read_kwargs).to_pandas()
+    else:
+        for chunk in pd.read_csv(path, chunksize = chunksize, **read_kwargs):
+            yield chunk
+
+def resolve_dtype(left, right):
+    """
+    Desc: combines the dtype of a column seen in two chunks, e.g. int64 in one chunk and float64 (int with missing values) in another
+
+    Params:
+        left, right: dtype strings
+
+    output:
+        dtype string valid for both chunks
+
+    """
+
+    if left == right:
+        return left
+    if left in ['int64', 'float64'] and right in ['int64', 'float64']:
+        return 'float64'
+    return 'object'
+
+def normalise_column(values):
+    # dtype string of the pivot index pivot_index gives the column, and the values to count: text as objects (whether
+    # object or the pandas 3 str dtype) and categoricals, e.g. dictionary encoded parquet columns, as their categories
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories.dtype
+        if is_text_dtype(categories):
+            return str(categories), values.astype('object')
+        return str(categories), values.astype('float64' if categories.kind in 'iuf' else 'object')
+    if is_text_dtype(values.dtype):
+        return str(values.dtype), values.astype('object')
+    return str(values.dtype), values
+
+def chunk_counts(chunk, target_var = ''):
+    """
+    Desc: partial aggregate of a chunk, counting rows per (value, target) pair for every column including missing values
+
+    Params:
+        chunk: dataframe chunk
+        target_var: name of the target variable (default counts rows per value only)
+
+    output:
+        counts: dict of column name -> series of counts indexed by (value, target), or by value when there is no target
+        dtypes: dict of column name -> dtype string of the column in this chunk
+        seconds: dict of column name -> time taken
+
+    """
+
+    counts, dtypes, seconds = {}, {}, {}
+
+    for col in chunk.columns:
+        start = time.time()
+
+        dtypes[col], values = normalise_column(chunk[col])
+
+        # numeric values are counted as floats so chunks with and without missing values merge on the same keys
+        if dtypes[col] in ['int64', 'float64']:
+            values = values.astype('float64')
+
+        if target_var != '':
+            keys = pd.DataFrame({'value': values.values, 'target': chunk[target_var].values})
+            counts[col] = keys.groupby(['value', 'target'], dropna = False).size()
+        else:
+            counts[col] = values.rename('value').to_frame().groupby(['value'], dropna = False).size()
+
+        seconds[col] = time.time() - start
+
+    return counts, dtypes, seconds
+
+def merge_counts(left, right):
+    """
+    Desc: merges two partial count series for the same column
+
+    Params:
+        left, right: count series as produced by chunk_counts
+
+    output:
+        merged count series
+
+    """
+
+    if left is None:
+        return right
+
+    levels = list(range(left.index.nlevels))
+    return pd.concat([left, right]).groupby(level = levels, dropna = False).sum()
+
+def profile_from_counts(counts, dtype, seconds = 0.0):
+    """
+    Desc: derives the profile_columns statistics of a column from its merged counts
+
+    Params:
+        counts: merged count series for one column
+        dtype: resolved dtype string of the column
+        seconds: time spent counting the column
+
+    output:
+        dict with the same keys as a profile_columns row
+
+    """
+
+    values = counts.index.get_level_values(0)
+    valid = ~values.isna()
+
+    per_value = counts[valid].groupby(level = 0).sum()
+
+    if len(per_value) > 0:
+        top_value, top_count = per_value.idxmax(), int(per_value.max())
+    else:
+        top_value, top_count = np.nan, 0
+
+    if counts.index.nlevels > 1:
+        present = counts[valid & ~counts.index.get_level_values(1).isna()]
+        target_levels = present.groupby(level = 1).sum().gt(0).sum()
+    else:
+        target_levels = 0
+
+    return {'dtype': dtype,
+            'n_rows': int(counts.sum()),
+            'null_count': int(counts[~valid].sum()),
+            'n_unique': len(per_value),
+            'top_value': top_value,
+            'top_count': top_count,
+            'target_levels': int(target_levels),
+            'seconds': seconds}
+
+def pivot_from_counts(counts, col, dtype, target_var = '', target_types = ''):
+    """
+    Desc: builds the pivot_index table of a single column from its merged counts
+
+    Params:
+        counts: merged count series for the column
+        col: column name
+        dtype: resolved dtype string of the column
+        target_var: name of the target variable (default produces the histogram table)
+        target_types: the names of the two target values
+
+    output:
+        temp: pivot identical to the pivot_index output for the column
+
+    """
+
+    counts = counts[~counts.index.get_level_values(0).isna()]
+
+    if target_var == '':
+        temp = counts.groupby(level = 0).sum()
+        temp.index = temp.index.astype(dtype)
+        temp.index.name = col
+        temp = temp.fillna(0).to_frame(name='vals')
+
+    else:
+        counts = counts[~counts.index.get_level_values(1).isna()]
+        counts.index = counts.index.set_levels(counts.index.levels[0].astype(dtype), level = 0)
+        counts.index.names = [col, target_var]
+        temp = counts.unstack().fillna(0)
+        temp.columns = target_types
+
+    return temp
+
+
+class Chunk_Aggregator:
+
+    def __init__(self, target_var = '', sketch = False, max_levels = 100000, error = 0.01, quantile_k = None):
+        """
+        Desc:
+            Mergeable partial aggregates of a dataset: per-column (value, target) counts, dtypes, timings and the date
+            formats found in the first chunk. Aggregators of different chunks or partitions combine with merge.
+
+            With sketch enabled every column also gets a constant memory Column_Sketch for profiling. In every mode the
+            exact counts of a column are dropped once it has more than max_levels (value, target) pairs, so ID and
+            continuous columns never hold (or send back from a worker) what amounts to row data; such a column is
+            profiled from a Column_Sketch from then on and left out of the pivots.
+
+            With quantile_k set every numeric column also gets a Quantile_Sketch over the target == 1 rows (all rows when
+            there is no target), which Numerical_Graph_Config takes in place of the dataframe.
+
+        Params:
+            target_var: name of the target variable (default counts rows per value only)
+            sketch: profile with Column_Sketch instead of the exact counts
+            max_levels: (value, target) pairs above which the exact counts of a column are dropped
+            error: HyperLogLog error of the sketches
+            quantile_k: accuracy parameter of the Quantile_Sketch of numeric columns (default keeps no quantile sketches)
+
+        """
+
+        self.target_var = target_var
+        self.sketch = sketch
+        self.max_levels = max_levels
+        self.error = error
+        self.counts = {}
+        self.dtypes = {}
+        self.seconds = {}
+        self.sketches = {}
+        self.quantile_k = quantile_k
+        self.quantile_sketches = {}
+        self.high_card = []
+        self.date_formats = {}
+        self.date_cols = []
+        self.n_chunks = 0
+
+    def update(self, chunk):
+        # adds the partial aggregates of one more chunk
+        if self.n_chunks == 0:
+            self.date_cols = date_detect(chunk, date_formats = self.date_formats)
+
+        counted = [col for col in chunk.columns if col not in self.high_card]
+        self.add_counts(*chunk_counts(chunk[counted], self.target_var))
+
+        # every column is sketched in sketch mode, otherwise only the columns whose counts were dropped
+        target = chunk[self.target_var] if self.target_var in chunk.columns else None
+        for col in chunk.columns if self.sketch else [col for col in chunk.columns if col in self.high_card]:
+            dtype, values = normalise_column(chunk[col])
+            self.dtypes[col] = resolve_dtype(self.dtypes.get(col, dtype), dtype)
+            self.sketches.setdefault(col, Column_Sketch(self.error)).update(values, target)
+        self.drop_high_cardinality()
+
+        if self.quantile_k:
+            rows = chunk[self.target_var] == 1 if self.target_var in chunk.columns else slice(None)
+            for col in chunk.columns:
+                if col != self.target_var and str(chunk[col].dtype) in ['float64', 'int64']:
+                    self.quantile_sketches.setdefault(col, Quantile_Sketch(self.quantile_k)).update(chunk.loc[rows, col])
+
+        self.n_chunks += 1
+
+    def add_counts(self, counts, dtypes, seconds):
+        for col in counts:
+            self.counts[col] = merge_counts(self.counts.get(col), counts[col])
+            self.dtypes[col] = resolve_dtype(self.dtypes.get(col, dtypes[col]), dtypes[col])
+            self.seconds[col] = self.seconds.get(col, 0.0) + seconds[col]
+
+    def merge(self, other):
+        """
+        Desc: merges the aggregates of another chunk or partition into this one
+
+        Params:
+            other: Chunk_Aggregator over the same columns
+
+        """
+
+        # dates are detected on the first chunk of the data
+        if self.n_chunks == 0:
+            self.date_cols = other.date_cols
+            self.date_formats = other.date_formats
+
+        # dtypes first, so the column order follows the other side for columns it dropped
+        self.dtypes.update({col: resolve_dtype(self.dtypes.get(col, dtype), dtype) for col, dtype in other.dtypes.items()})
+
+        for col in other.high_card:
+            if col not in self.high_card:
+                self.drop_column(col)
+
+        self.add_counts({col: c for col, c in other.counts.items() if col not in self.high_card}, other.dtypes, other.seconds)
+
+        for col, col_sketch in other.sketches.items():
+            self.add_sketch(col, col_sketch)
+
+        # counts the other side still kept for a column dropped here go into its sketch
+        if not self.sketch:
+            for col, c in other.counts.items():
+                if col in self.high_card:
+                    self.add_sketch(col, Column_Sketch.from_counts(c, other.dtypes[col], self.error, seconds = other.seconds[col]))
+
+        for col, col_sketch in other.quantile_sketches.items():
+            if col in self.quantile_sketches:
+                self.quantile_sketches[col].merge(col_sketch)
+            else:
+                self.quantile_sketches[col] = col_sketch
+
+        self.n_chunks += other.n_chunks
+        self.drop_high_cardinality()
+
+    def add_sketch(self, col, col_sketch):
+        if col in self.sketches:
+            self.sketches[col].merge(col_sketch)
+        else:
+            self.sketches[col] = col_sketch
+
+    def drop_column(self, col):
+        # drops the exact counts of a column, outside sketch mode they become its sketch
+        counts = self.counts.pop(col, None)
+        self.high_card.append(col)
+        if not self.sketch and counts is not None:
+            self.add_sketch(col, Column_Sketch.from_counts(counts, self.dtypes[col], self.error, seconds = self.seconds.get(col, 0.0)))
+
+    def drop_high_cardinality(self):
+        # exact counts of columns with too many levels to pivot are dropped, the sketches keep profiling them
+        for col in list(self.counts):
+            if col != self.target_var and len(self.counts[col]) > self.max_levels:
+                self.drop_column(col)
+
+
+class Streaming_Data_Prep(Chunk_Aggregator):
+
+    def __init__(self, path, target_var = '', id_threshold = 0.5, null_threshold = 0.99, chunksize = 500000, 
+                 sketch = False, max_levels = 100000, error = 0.01, quantile_k = None, **read_kwargs):
+        """
+        Desc:
+            Out-of-core equivalent of Data_Prep. Reads the input chunk by chunk and keeps only mergeable per-column count
+            tables, from which the column profile, exclusion lists and pivot_index tables are derived.
+
+            Peak memory is bounded by the chunk size plus the number of distinct values per column, which is capped
+            at max_levels (value, target) pairs. ID columns that are known up front are best dropped via usecols/columns.
+
+        Params:
+            path: .csv or .parquet file
+            target_var: name of the target variable (default allows regular histogram tables to be generated)
+            id_threshold, null_threshold: as per Data_Prep
+            chunksize: rows per CSV chunk
+            sketch, max_levels, error, quantile_k: as per Chunk_Aggregator
+            read_kwargs: passed on to read_chunks
+
+        output:
+            object with the Data_Prep column lists and a pivots method
+
+        """
+
+        Chunk_Aggregator.__init__(self, target_var, sketch, max_levels, error, quantile_k)
+        self.path = path
+
+        for chunk in read_chunks(path, chunksize, **read_kwargs):
+            self.update(chunk)
+
+        print("read " + str(self.n_chunks) + " chunks")
+        self.summarise(id_threshold, null_threshold)
+
+    def summarise(self, id_threshold, null_threshold):
+        # derives the profile and Data_Prep column lists from the merged counts
+        target_var = self.target_var
+
+        if self.sketch:
+            self.profile = sketch_profile(self.sketches, self.dtypes)
+        else:
+            self.profile = pd.DataFrame.from_dict({col: profile_from_counts(self.counts[col], self.dtypes[col], self.seconds[col]) for col in self.counts}, orient = 'index')
+            if self.high_card:
+                # columns whose counts were dropped are profiled from their sketch, in column order
+                high_card = sketch_profile({col: self.sketches[col] for col in self.high_card}, self.dtypes)
+                self.profile = pd.concat([self.profile, high_card]).reindex([col for col in self.dtypes if col in self.counts or col in self.high_card])
+            self.profile.index.name = 'column'
+        Ids_cats, trivial, null_cols, num_exclude = profile_exclusions(self.profile, id_threshold, null_threshold)
+
+        self.Ids_cats = Ids_cats
+        self.trivial = trivial
+        self.null_cols = null_cols
+        self.num_exclude = num_exclude if target_var in self.counts else []
+        report_exclusions(self)
+
+        too_many = [col for col in self.high_card if col not in self.total_exclude]
+        if too_many:
+            print("skipping " + str(len(too_many)) + " variables with more than " + str(self.max_levels) + " levels:")
+            print(too_many)
+
+        keep = [col for col in self.profile.index if col != target_var and col not in self.total_exclude and col not in self.high_card]
+        self.numeric_cols = pd.Index([col for col in keep if self.dtypes[col] in ['float64', 'int64']])
+        self.cat_cols = pd.Index([col for col in keep if is_text_dtype(self.dtypes[col])])
+
+        if target_var in self.counts:
+            self.target_vals = list(self.counts[target_var].index.get_level_values(1).dropna().unique())
+
+        # counts for excluded columns are no longer needed
+        for col in self.total_exclude:
+            self.counts.pop(col, None)
+
+    def pivots(self, columns, target_types = '', config_df = None):
+        """
+        Desc: produces the same pivots dict as pivot_index over the full data
+
+        Params:
+            columns: list of columns (e.g. cat_cols or numeric_cols)
+            target_types: the names of the two target values (default allows regular histogram tables to be generated)
+            config_df: optional categorical config, collapses columns to the levels their graph shows (as per pivot_index)
+
+        output:
+            pivots: the collection of pivots
+
+        """
+
+        if target_types == '':
+            pivots = {col: pivot_from_counts(self.counts[col].groupby(level = 0, dropna = False).sum(), col, self.dtypes[col]) for col in columns}
+        else:
+            pivots = {col: pivot_from_counts(self.counts[col], col, self.dtypes[col], self.target_var, target_types) for col in columns}
+
+        if config_df is not None:
+            sort_col = target_types[1] if target_types != '' else 'vals'
+            pivots = {col: collapse_pivot(temp, config_df.loc[col], sort_col) if col in config_df.index else temp for col, temp in pivots.items()}
+
+        return pivots
+
+
+def list_partitions(source, pattern = '*', endpoint_url = None):
+    """
+    Desc: lists the partition files of a dataset
+
+    Params:
+        source: local directory, or an s3://bucket/prefix location
+        pattern: filename pattern the partitions must match e.g. '*.parquet'
+        endpoint_url: optional S3 endpoint, for S3 compatible stores and local stand-ins
+
+    output:
+        sorted list of local paths or s3:// urls
+
+    """
+
+    if not source.startswith('s3://'):
+        return sorted(glob.glob(os.path.join(source, pattern)))
+
+    bucket, _, prefix = source[len('s3://'):].partition('/')
+    client = boto3.client('s3', endpoint_url = endpoint_url)
+
+    files = []
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket = bucket, Prefix = prefix):
+        for obj in page.get('Contents', []):
+            if fnmatch.fnmatch(os.path.basename(obj['Key']), pattern):
+                files.append('s3://' + bucket + '/' + obj['Key'])
+    return sorted(files)
+
+def open_partition(path, endpoint_url = None):
+    # local paths are read directly, s3 objects are fetched into memory (one partition at a time per worker)
+    if not path.startswith('s3://'):
+        return path
+
+    bucket, _, key = path[len('s3://'):].partition('/')
+    body = boto3.client('s3', endpoint_url = endpoint_url).get_object(Bucket = bucket, Key = key)['Body']
+    return io.BytesIO(body.read())
+
+def partition_counts(path, target_var = '', chunksize = 500000, endpoint_url = None, read_kwargs = None, 
+                     sketch = False, max_levels = 100000, error = 0.01, quantile_k = None):
+    """
+    Desc: map step, reduces one partition file to its partial aggregates. Runs in a worker process and
+          only returns the aggregates, never row data: columns over max_levels come back as sketches whatever the
+          sketch setting
+
+    Params:
+        path: local path or s3:// url of the partition
+        target_var: name of the target variable
+        chunksize: rows per CSV chunk within the partition
+        endpoint_url: optional S3 endpoint
+        read_kwargs: passed on to read_chunks
+        sketch, max_levels, error, quantile_k: as per Chunk_Aggregator
+
+    output:
+        aggregate: Chunk_Aggregator of the partition
+
+    """
+
+    if read_kwargs is None:
+        read_kwargs = {}
+
+    file_format = 'parquet' if os.path.splitext(path)[1].lower() in ['.parquet', '.pq'] else 'csv'
+
+    aggregate = Chunk_Aggregator(target_var, sketch, max_levels, error, quantile_k)
+    for chunk in read_chunks(open_partition(path, endpoint_url), chunksize, file_format, **read_kwargs):
+        aggregate.update(chunk)
+
+    return aggregate
+
+
+class Partitioned_Data_Prep(Streaming_Data_Prep):
+
+    def __init__(self, source, target_var = '', id_threshold = 0.5, null_threshold = 0.99, pattern = '*', n_jobs = None, 
+                 chunksize = 500000, endpoint_url = None, sketch = False, max_levels = 100000, error = 0.01, 
+                 quantile_k = None, **read_kwargs):
+        """
+        Desc:
+            Map-reduce equivalent of Data_Prep over a directory (or S3 prefix) of partition files. Each partition is reduced
+            to per-column count tables in a worker process, and the driver merges those into the same profile, column
+            lists and pivots as Streaming_Data_Prep over the concatenated data.
+
+        Params:
+            source: local directory, or an s3://bucket/prefix location
+            target_var: name of the target variable (default allows regular histogram tables to be generated)
+            id_threshold, null_threshold: as per Data_Prep
+            pattern: filename pattern of the partitions e.g. '*.csv'
+            n_jobs: number of worker processes (default uses every core)
+            chunksize: rows per CSV chunk within a partition
+            endpoint_url: optional S3 endpoint, for S3 compatible stores and local stand-ins
+            sketch, max_levels, error, quantile_k: as per Chunk_Aggregator
+            read_kwargs: passed on to read_chunks
+
+        output:
+            object with the Data_Prep column lists and a pivots method
+
+        """
+
+        Chunk_Aggregator.__init__(self, target_var, sketch, max_levels, error, quantile_k)
+        self.path = source
+
+        self.partitions = list_partitions(source, pattern, endpoint_url)
+        print("found " + str(len(self.partitions)) + " partitions")
+
+        start = time.time()
+        with ProcessPoolExecutor(max_workers = n_jobs) as executor:
+            tasks = [executor.submit(partition_counts, path, target_var, chunksize, endpoint_url, read_kwargs, sketch, max_levels, error, quantile_k) 
+                     for path in self.partitions]
+
+            # merged in partition order, so dates come from the first partition as Streaming_Data_Prep does with the first chunk
+            for task in tasks:
+                self.merge(task.result())
+
+        print("reduced " + str(len(self.partitions)) + " partitions in " + str(round(time.time() - start, 2)) + "s")
+        self.summarise(id_threshold, null_threshold)
@@ -0,0 +1,44 @@
+import os
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.batch import run_dataset
+from src.pivot_store import Pivot_Store
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(7)
+    n = 3000
+    pd.DataFrame({'target': rng.integers(0, 2, n),
+                  'plan': rng.choice(['basic', 'plus', 'premium'], n),
+                  'age': rng.integers(18, 80, n),
+                  'spend': rng.gamma(2, 30, n).round(0)}).to_csv(tmp_path / 'data.csv', index = False)
+    return {'name': 'data', 'path': str(tmp_path / 'data.csv'), 'root_folder': str(tmp_path / 'run'),
+            'target_var': 'target', 'target_types': ['non_target', 'target']}
+
+
+def graphs(root_folder, kind):
+    return sorted(os.listdir(os.path.join(root_folder, kind)))
+
+
+def test_num_config_change_rerenders_from_per_value_pivots(dataset):
+    timings, error = run_dataset(dataset)
+    assert error is None
+    assert graphs(dataset['root_folder'], 'Numeric') == ['age.jpg', 'spend.jpg']
+
+    # per value pivots are saved, so a new bin_length only needs the graphs re-drawn
+    store = Pivot_Store(dataset['root_folder'] + '/Pivots/pivots')
+    assert 'binned' not in store['age'].attrs
+    assert len(store['age']) == 62
+
+    timings, error = run_dataset({**dataset, 'num_config': {'age': {'bin_length': 7}}})
+    assert error is None
+
+
+def test_prebinned_numeric_pivots_are_opt_in(dataset):
+    timings, error = run_dataset({**dataset, 'prebin_numeric': True})
+    assert error is None
+    assert graphs(dataset['root_folder'], 'Numeric') == ['age.jpg', 'spend.jpg']
+    assert 'binned' in Pivot_Store(dataset['root_folder'] + '/Pivots/pivots')['age'].attrs
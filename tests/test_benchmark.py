@@ -0,0 +1,25 @@
+import os
+import numpy as np
+import pytest
+
+from src.benchmark import run_benchmark, run_case, compare
+
+small = {'rows': 3000, 'numeric_cols': 2, 'cat_cols': 2, 'cardinality': 5}
+
+
+def test_every_generated_column_is_charted_and_measured_per_stage(tmp_path):
+    results = run_benchmark({'tiny': small}, str(tmp_path))
+    assert list(results['stage']) == ['profile', 'target', 'config', 'pivots', 'render']
+    assert sorted(os.listdir(tmp_path / 'tiny' / 'Categorical')) == ['cat_0.jpg', 'cat_1.jpg']
+    assert sorted(os.listdir(tmp_path / 'tiny' / 'Numeric')) == ['num_0.jpg', 'num_1.jpg']
+
+    # stages report their own peak, not one process wide figure
+    assert not results['peak_mb'].isna().any()
+    assert results['peak_mb'].nunique() > 1
+    assert not compare(results, results)['regression'].any()
+
+
+def test_undetected_columns_fail_the_case(tmp_path):
+    # every level distinct, so the text columns are excluded as IDs
+    with pytest.raises(ValueError, match = 'categorical'):
+        run_case('ids', {**small, 'cardinality': 100000}, str(tmp_path / 'ids'), render = False, memory = False)
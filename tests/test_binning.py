@@ -0,0 +1,112 @@
+import itertools
+import math
+from fractions import Fraction
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import pivot_index
+from src.graph_generator import bin_pivot
+from src.histograms import Histogram_Pyramid
+from src.lift import lift_tables
+
+settings = [setting for setting in itertools.product([0, 0.1, 0.25, 1, 3, 7.5], [0, 10, 45, 45.05], [0, 3, -2.5, 0.3])]
+
+
+@pytest.fixture(scope = 'module')
+def df():
+    rng = np.random.default_rng(8)
+    n = 3000
+    return pd.DataFrame({'quarters': rng.integers(-80, 240, n) / 4,
+                         'ints': rng.integers(-5, 60, n).astype('float64')})
+
+
+def reference(pivot, bin_length, upper_class, lower_class):
+    # the binning rule value by value in exact arithmetic: values up to lower_class and from upper_class up in the class
+    # rows, bins anchored at lower_class (else the smallest value) labelled by their right edge, and the bin reaching
+    # upper_class counted in the upper_class row
+    b, upper, lower = Fraction(str(bin_length)), Fraction(str(upper_class)), Fraction(str(lower_class))
+    values = [Fraction(str(v)) for v in pivot.index]
+    origin = lower if lower != 0 else min(values)
+
+    below_count, above_count, bins, per_value = 0, 0, {}, []
+    for v, c in zip(values, pivot['vals']):
+        is_below, is_above = lower != 0 and v <= lower, upper != 0 and v >= upper
+        below_count += c if is_below else 0
+        above_count += c if is_above else 0
+        if is_below or is_above:
+            continue
+        if b == 0:
+            per_value.append((v, c))
+            continue
+        k = max(0, math.ceil((v - origin) / b) - 1)
+        if upper != 0 and origin + (k + 1) * b >= upper:
+            above_count += c
+        else:
+            bins[k] = bins.get(k, 0) + c
+
+    rows = [(lower, below_count)] if lower != 0 else []
+    if bins:
+        rows += [(origin + (k + 1) * b, bins.get(k, 0)) for k in range(min(bins), max(bins) + 1)]
+    rows += per_value
+    rows += [(upper, above_count)] if upper != 0 else []
+    return pd.DataFrame({'vals': [c for label, c in rows]}, index = pd.Index([float(label) for label, c in rows], dtype = 'float64'))
+
+
+def check(result, expected):
+    pd.testing.assert_frame_equal(result[['vals']], expected, check_dtype = False, check_names = False, check_exact = True)
+    labels = result.index.to_numpy()
+    assert (np.diff(labels) > 0).all(), labels
+
+
+@pytest.mark.parametrize('setting', settings)
+def test_every_engine_matches_the_reference(df, setting):
+    bin_length, upper_class, lower_class = setting
+    columns = list(df.columns)
+    pivots = pivot_index(df, columns)
+    config_df = pd.DataFrame([setting] * len(columns), columns = ['bin_length', 'upper_class', 'lower_class'], index = columns)
+
+    tables = lift_tables('numeric_hist', pivots, config_df, columns)
+    binned = pivot_index(df, columns, config_df = config_df) if any(setting) else pivots
+
+    for col in columns:
+        expected = reference(pivots[col], bin_length, upper_class, lower_class)
+        check(bin_pivot(pivots[col], ['vals'], bin_length, upper_class, lower_class), expected)
+        check(tables[col], expected)
+        check(binned[col], expected)
+        if bin_length != 0:
+            check(Histogram_Pyramid(pivots[col]).rebin(bin_length, upper_class, lower_class), expected)
+
+
+def test_labels_are_anchored_at_lower_class_and_capped_at_upper_class():
+    pivot = pd.DataFrame({'vals': np.ones(43, dtype = 'int64')}, index = pd.Index(np.arange(1, 44, dtype = 'float64')))
+
+    result = bin_pivot(pivot, ['vals'], 1, 45, 3)
+    assert list(result.index[:3]) == [3.0, 4.0, 5.0]
+    assert result.index[-1] == 45.0 and result.index[-2] == 43.0
+    assert result['vals'].sum() == 43
+
+    # the last bin reaching upper_class is counted in its row instead of being labelled past it
+    result = bin_pivot(pivot, ['vals'], 4, 41, 3)
+    assert list(result.index) == [3.0, 7.0, 11.0, 15.0, 19.0, 23.0, 27.0, 31.0, 35.0, 39.0, 41.0]
+    assert result.loc[41.0, 'vals'] == 43 - 39
+
+
+def test_fractional_labels_are_rounded():
+    pivot = pd.DataFrame({'vals': np.ones(30, dtype = 'int64')}, index = pd.Index(np.arange(30) / 10))
+
+    labels = bin_pivot(pivot, ['vals'], 0.1, 0, 0).index
+    assert [str(label) for label in labels[:10]] == ['0.1', '0.2', '0.3', '0.4', '0.5', '0.6', '0.7', '0.8', '0.9', '1.0']
+
+
+@pytest.mark.parametrize('setting', [(5, 90, 10), (3, 80, 20), (2.5, 0, 0), (0.125, 0, 0), (4, 0, 30)])
+def test_widened_pyramid_matches_bin_pivot_on_continuous_data(setting):
+    rng = np.random.default_rng(11)
+    df = pd.DataFrame({'score': rng.normal(50, 15, 200000).round(3)})
+    pivot = pivot_index(df, ['score'])['score']
+    pyramid = Histogram_Pyramid(pivot)
+    assert pyramid.widened
+
+    result = pyramid.rebin(*setting)
+    pd.testing.assert_frame_equal(result, bin_pivot(pivot, ['vals'], *setting), check_dtype = False, check_exact = True)
+    assert result.index.name == 'score'
@@ -0,0 +1,142 @@
+import io
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import Data_Prep, pivot_index, convert_dates, date_detect
+
+
+@pytest.fixture
+def csv_df():
+    # read back from csv, so text columns get the dtype pandas gives them on this version (str on pandas 3)
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame({'target': rng.integers(0, 2, n),
+                       'a': rng.choice(['x', 'y', 'z'], n),
+                       'cat_1': rng.choice(list('pqrs'), n),
+                       'num': rng.integers(0, 20, n),
+                       'f': rng.normal(0, 1, n).round(1)})
+    return pd.read_csv(io.StringIO(df.to_csv(index = False)))
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_text_columns_are_categorical(csv_df, compact):
+    data_prep = Data_Prep(csv_df, 'target', compact = compact)
+    assert list(data_prep.cat_cols) == ['a', 'cat_1']
+    assert list(data_prep.numeric_cols) == ['num', 'f']
+
+
+def test_compact_store_uses_categories(csv_df):
+    data_prep = Data_Prep(csv_df, 'target', compact = True)
+    assert isinstance(data_prep.df['a'].dtype, pd.CategoricalDtype)
+    assert data_prep.df['num'].dtype == 'int8'
+
+
+def test_compact_pivots_match_default(csv_df):
+    default = Data_Prep(csv_df.copy(), 'target')
+    compact = Data_Prep(csv_df.copy(), 'target', compact = True)
+    target_types = ['non_target', 'target']
+
+    for subset, cols in [('df_cat', default.cat_cols), ('df_numeric', default.numeric_cols)]:
+        expected = pivot_index(getattr(default, subset), cols, 'target', target_types)
+        got = pivot_index(getattr(compact, subset), cols, 'target', target_types)
+        for col in cols:
+            pd.testing.assert_frame_equal(got[col], expected[col], check_exact = True)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_dates_convert_in_every_mode(csv_df, compact):
+    days = pd.date_range('2021-01-01', periods = len(csv_df), freq = 'h').strftime('%Y-%m-%d %H:%M')
+    data_prep = Data_Prep(csv_df.assign(day = days), 'target', compact = compact)
+    assert data_prep.date_cols == ['day']
+
+    data_prep.convert_dates()
+    assert pd.api.types.is_datetime64_any_dtype(data_prep.df['day'])
+    assert data_prep.df['day'].iloc[-1] == pd.Timestamp(days[-1])
+
+
+def test_values_outside_the_sample_that_do_not_parse_become_nat():
+    df = pd.DataFrame({'day': ['2021-01-0' + str(i % 9 + 1) for i in range(50)]})
+    df.loc[7, 'day'] = 'not a date'
+
+    convert_dates(df, {'day': '%Y-%m-%d'})
+    assert df['day'].isna().tolist() == [i == 7 for i in range(50)]
+
+
+def first_exclusions(df, target_var, id_threshold = 0.5, null_threshold = 0.99):
+    # the exclusion rules as first written in Data_Prep
+    ids = [col for col in df.columns if len(df[col].unique())/(len(df[col].dropna())+1) >= id_threshold]
+    trivial = [col for col in df.columns if len(df[col].dropna().value_counts()) == 1]
+    nulls = [col for col in df.columns if len(df[col].dropna())/len(df) <= (1 - null_threshold)]
+    num_exclude = [col for col in df.select_dtypes(include=['float64', 'int64']).columns if len(df.groupby([col, target_var]).size().unstack().fillna(0).columns) < 2]
+    return ids, trivial, nulls, num_exclude
+
+
+@pytest.mark.parametrize('id_threshold, null_threshold', [(0.5, 0.99), (0.9, 0.5)])
+def test_exclusions_follow_the_first_rules(id_threshold, null_threshold):
+    rng = np.random.default_rng(14)
+    n = 2000
+    target = rng.integers(0, 2, n)
+    df = pd.DataFrame({'target': target,
+                       'row_id': np.arange(n),
+                       'constant': np.full(n, 'same', dtype = 'object'),
+                       'empty': np.full(n, np.nan),
+                       'user': np.array(['user_' + str(i) for i in rng.integers(0, 1500, n)], dtype = 'object'),
+                       'mostly_empty': np.where(rng.random(n) < 0.7, np.nan, rng.normal(0, 1, n)),
+                       'plan': rng.choice(['basic', 'plus'], n).astype('object'),
+                       'one_class': np.where(target == 1, rng.normal(0, 1, n), np.nan),
+                       'age': rng.integers(18, 80, n)})
+
+    data_prep = Data_Prep(df, 'target', id_threshold, null_threshold)
+    ids, trivial, nulls, num_exclude = first_exclusions(df, 'target', id_threshold, null_threshold)
+    assert (data_prep.Ids_cats, data_prep.trivial, data_prep.null_cols, data_prep.num_exclude) == (ids, trivial, nulls, num_exclude)
+    assert data_prep.total_exclude == ids + trivial + data_prep.date_cols + nulls + num_exclude
+    assert {'row_id', 'constant', 'empty', 'one_class'} <= set(data_prep.total_exclude)
+    assert 'user' in data_prep.Ids_cats or id_threshold > 0.5
+    assert list(data_prep.cat_cols) == [col for col in ['user', 'plan'] if col not in data_prep.total_exclude]
+    assert list(data_prep.numeric_cols) == [col for col in ['mostly_empty', 'age'] if col not in data_prep.total_exclude]
+
+
+@pytest.fixture
+def dates_df():
+    days = pd.Series(pd.date_range('2020-01-01', periods = 3000, freq = 'D'))
+    return pd.DataFrame({'iso': days.dt.strftime('%Y-%m-%d'),
+                         'dayfirst': days.dt.strftime('%d/%m/%Y'),
+                         'text': np.resize(['a', 'b', 'c'], 3000)})
+
+
+def test_date_detect_leaves_df_unchanged(dates_df):
+    before = dates_df.copy()
+    assert date_detect(dates_df) == ['iso', 'dayfirst']
+    pd.testing.assert_frame_equal(dates_df, before)
+
+
+def test_date_formats_are_inferred_and_cached_per_column(dates_df):
+    formats = {}
+    date_detect(dates_df, date_formats = formats)
+    assert formats == {'iso': '%Y-%m-%d', 'dayfirst': '%d/%m/%Y'}
+
+    # cached columns are not sampled again
+    formats['text'] = '%Y-%m-%d'
+    assert date_detect(dates_df, date_formats = formats) == ['iso', 'dayfirst', 'text']
+
+
+def test_column_whose_sample_parses_but_most_values_do_not_is_rejected():
+    n = 10000
+    values = np.full(n, 'free text', dtype = 'object')
+    # dates only at the rows date_sample picks
+    sampled = np.unique(np.linspace(0, n - 1, num = 1000).astype(int))
+    values[sampled] = '2021-03-04'
+    df = pd.DataFrame({'notes': values})
+
+    formats = {}
+    assert date_detect(df, date_formats = formats) == []
+    assert formats == {}
+
+
+def test_sketch_settings_reach_the_profile(csv_df):
+    exact = Data_Prep(csv_df, 'target', sketch = True)
+    approximate = Data_Prep(csv_df, 'target', sketch = True, error = 0.05, exact_limit = 2)
+
+    assert exact.profile['n_unique'].equals(Data_Prep(csv_df, 'target').profile['n_unique'])
+    assert (approximate.profile['n_unique'] != exact.profile['n_unique']).any()
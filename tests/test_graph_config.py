@@ -0,0 +1,107 @@
+import os
+import math
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.graph_config import Numerical_Graph_Config, numeric_defaults, closest_value
+
+
+@pytest.fixture
+def root_folder(tmp_path):
+    os.makedirs(tmp_path / 'Config')
+    return str(tmp_path)
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(12)
+    n = 5000
+    return pd.DataFrame({'target': rng.integers(0, 2, n),
+                         'a': rng.normal(100, 20, n).round(1),
+                         'b': rng.gamma(2, 30, n).round(1)})
+
+
+def config_of(df, cols, root_folder):
+    return Numerical_Graph_Config(df, cols, 'target', root_folder).default_config_numeric
+
+
+def fingerprints(root_folder):
+    return pd.read_csv(root_folder + "/Config/num_config_fingerprint.csv", index_col = 0)
+
+
+def test_new_column_gets_defaults(df, root_folder):
+    first = config_of(df, ['a'], root_folder)
+    config = config_of(df, ['a', 'b'], root_folder)
+
+    assert list(config.index) == ['a', 'b']
+    pd.testing.assert_series_equal(config.loc['a'], first.loc['a'])
+    pd.testing.assert_series_equal(config.loc['b'], numeric_defaults(df, ['b'], 'target').loc['b'], check_dtype = False)
+
+
+def test_drifted_column_is_regenerated(df, root_folder):
+    config_of(df, ['a', 'b'], root_folder)
+    drifted = df.assign(a = df['a'] * 2)
+    config = config_of(drifted, ['a', 'b'], root_folder)
+
+    expected = numeric_defaults(drifted, ['a', 'b'], 'target')
+    pd.testing.assert_series_equal(config.loc['a'], expected.loc['a'], check_dtype = False)
+    assert fingerprints(root_folder).loc['a', 'q95'] == pytest.approx(drifted.loc[drifted['target'] == 1, 'a'].quantile(0.95))
+
+
+def test_user_edited_row_is_kept(df, root_folder):
+    config = config_of(df, ['a', 'b'], root_folder)
+    config.loc['a', 'bin_length'] = 123
+    config.to_csv(root_folder + "/Config/num_config.csv")
+
+    config = config_of(df.assign(a = df['a'] * 2), ['a', 'b'], root_folder)
+    assert config.loc['a', 'bin_length'] == 123
+
+
+def test_small_drifts_add_up_to_a_refresh(df, root_folder):
+    first = config_of(df, ['a', 'b'], root_folder)
+    original = fingerprints(root_folder)
+
+    # 3% per run stays under the 5% tolerance, the unchanged rows keep the fingerprint their defaults came from
+    config = config_of(df.assign(a = df['a'] * 1.03), ['a', 'b'], root_folder)
+    pd.testing.assert_frame_equal(fingerprints(root_folder), original)
+    pd.testing.assert_frame_equal(config, first)
+
+    # a second 3% run is 6% away from the data the defaults were built from
+    shifted = df.assign(a = df['a'] * 1.03**2)
+    config = config_of(shifted, ['a', 'b'], root_folder)
+    pd.testing.assert_series_equal(config.loc['a'], numeric_defaults(shifted, ['a'], 'target').loc['a'], check_dtype = False)
+    pd.testing.assert_series_equal(fingerprints(root_folder).loc['b'], original.loc['b'])
+
+
+def closest_value_defaults(df, cols, target_var):
+    # the defaults as first written, with closest_value over the descending unique values of every column
+    target_list = df.loc[df[target_var] == 1]
+    rows = {}
+    for col in cols:
+        values = list(df[col].dropna().sort_values(ascending = False).unique())
+        rows[col] = {'upper_class': closest_value(values, target_list[col].quantile(0.95)),
+                     'lower_class': closest_value(values, target_list[col].quantile(0.05)),
+                     'bin_length': math.ceil(2*(target_list[col].quantile(0.75) - target_list[col].quantile(0.25))/(len(target_list[col].dropna())**(1/3)))}
+    return pd.DataFrame.from_dict(rows, orient = 'index')[['upper_class', 'lower_class', 'bin_length']]
+
+
+def test_numeric_defaults_on_a_fixed_frame():
+    df = pd.DataFrame({'target': [1] * 11 + [0, 0, 0],
+                       # the 95% quantile of the target rows is 10, as far from 8 as from 12: the larger value wins
+                       'tie': [0] * 10 + [20, 8, 12, -5],
+                       'const': [7.0] * 14,
+                       'f': [0.1, 0.4, 0.4, 2.5, 9.9, 3.3, -1.0, 100.0, 5, 6, 7, 8, 1, 2]})
+    cols = ['tie', 'const', 'f']
+
+    defaults = numeric_defaults(df, cols, 'target')
+    assert defaults.loc['tie'].tolist() == [12, 0, 0]
+    assert defaults.loc['const'].tolist() == [7, 7, 0]
+    assert defaults.loc['f'].tolist() == [100, -1, 6]
+    pd.testing.assert_frame_equal(defaults, closest_value_defaults(df, cols, 'target'), check_dtype = False)
+
+
+def test_numeric_defaults_match_closest_value(df):
+    df = df.assign(ints = np.random.default_rng(13).integers(0, 12, len(df)), nulls = df['b'].mask(df['a'] > 110))
+    cols = ['a', 'b', 'ints', 'nulls']
+    pd.testing.assert_frame_equal(numeric_defaults(df, cols, 'target'), closest_value_defaults(df, cols, 'target'), check_dtype = False)
@@ -0,0 +1,73 @@
+import itertools
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import pivot_index
+from src.graph_generator import cat_table, numeric_table
+from src.lift import lift_tables
+
+target_types = ['non_target', 'target']
+
+cat_settings = list(itertools.product([0, 1], [-1, 0, 1], [0, 1, 2, 5], [0, 1, 3, 10]))
+num_settings = list(itertools.product([0, 0.5, 1, 3, 7], [0, 10, 25.5], [0, 2, 4.25]))
+
+
+@pytest.fixture(scope = 'module')
+def df():
+    rng = np.random.default_rng(6)
+    n = 4000
+    f = rng.normal(10, 6, n).round(2)
+    f[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({'target': rng.integers(0, 2, n),
+                         'a': rng.choice(list('abcdefg'), n, p = [0.3, 0.2, 0.15, 0.15, 0.1, 0.05, 0.05]).astype('object'),
+                         'b': rng.choice(['x', 'y', 'z'], n).astype('object'),
+                         'c': rng.choice(['p', 'q'], n).astype('object'),
+                         'i': rng.integers(0, 30, n),
+                         'f': f})
+
+
+def with_index(temp):
+    # the index columns index_chart adds to a treated pivot
+    temp = temp.copy()
+    temp['index'] = (temp[target_types[1]] / temp[target_types[1]].sum()) / (temp[target_types[0]] / temp[target_types[0]].sum())
+    temp['index benchmark'] = 1
+    return temp
+
+
+def check_tables(tables, expected):
+    assert list(tables) == list(expected)
+    for col in expected:
+        pd.testing.assert_frame_equal(tables[col], expected[col], check_dtype = False, check_index_type = False)
+
+
+@pytest.mark.parametrize('kind', ['cat', 'cat_hist'])
+@pytest.mark.parametrize('setting', cat_settings)
+def test_cat_lift_matches_cat_table(df, kind, setting):
+    columns = ['a', 'b', 'c']
+    target = kind == 'cat'
+    pivots = pivot_index(df, columns, 'target', target_types) if target else pivot_index(df, columns)
+    config_df = pd.DataFrame([setting] * len(columns), columns = ['custom_sort', 'asc/desc', 'soft_cat_limit', 'hard_cat_limit'], index = columns)
+    # custom orders are row positions, as sort_order reads them
+    orders = {col: list(range(len(pivots[col])))[::-1] for col in columns}
+
+    tables = lift_tables(kind, pivots, config_df, columns, target_types if target else '', orders)
+
+    sort_col = target_types[1] if target else 'vals'
+    expected = {col: cat_table(pivots[col], col, config_df.loc[col], sort_col, orders[col]) for col in columns}
+    check_tables(tables, {col: with_index(temp) for col, temp in expected.items()} if target else expected)
+
+
+@pytest.mark.parametrize('kind', ['numeric', 'numeric_hist'])
+@pytest.mark.parametrize('setting', num_settings)
+def test_numeric_lift_matches_numeric_table(df, kind, setting):
+    columns = ['i', 'f']
+    target = kind == 'numeric'
+    pivots = pivot_index(df, columns, 'target', target_types) if target else pivot_index(df, columns)
+    config_df = pd.DataFrame([setting] * len(columns), columns = ['bin_length', 'upper_class', 'lower_class'], index = columns)
+
+    tables = lift_tables(kind, pivots, config_df, columns, target_types if target else '')
+
+    count_cols = target_types if target else ['vals']
+    expected = {col: numeric_table(pivots[col], config_df.loc[col], count_cols) for col in columns}
+    check_tables(tables, {col: with_index(temp) for col, temp in expected.items()} if target else expected)
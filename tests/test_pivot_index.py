@@ -0,0 +1,100 @@
+import itertools
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import pivot_index, class_pivot_index, one_vs_rest, one_vs_rest_index, collapse_pivot
+from src.graph_generator import cat_table
+
+target_types = ['non_target', 'target']
+
+
+def groupby_pivot(df, col, target_var = '', target_types = ''):
+    # the original per-column groupby of pivot_index
+    if target_var == '':
+        return df.groupby([col]).size().fillna(0).to_frame(name = 'vals')
+    temp = df.groupby([col, target_var]).size().unstack().fillna(0)
+    temp.columns = target_types
+    return temp
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(5)
+    n = 5000
+    f = rng.normal(0, 1, n).round(1)
+    f[rng.random(n) < 0.1] = np.nan
+    s = rng.choice(['a', 'b', 'c', 'd'], n).astype('object')
+    s[rng.random(n) < 0.05] = None
+    df = pd.DataFrame({'target': rng.integers(0, 2, n),
+                       'str': s,
+                       'int': rng.integers(-3, 40, n),
+                       'float': f,
+                       'rare': rng.choice(['common', 'rare'], n, p = [0.999, 0.001])})
+    # a level only seen in the non target class
+    df.loc[df.index[df['target'] == 0][0], 'rare'] = 'only_zero'
+    return df
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_crosstab_matches_groupby(df, n_jobs):
+    columns = ['str', 'int', 'float', 'rare']
+    pivots = pivot_index(df, columns, 'target', target_types, n_jobs = n_jobs)
+
+    for col in columns:
+        pd.testing.assert_frame_equal(pivots[col], groupby_pivot(df, col, 'target', target_types), check_dtype = False, check_exact = True)
+
+
+def test_crosstab_matches_groupby_without_target(df):
+    columns = ['str', 'int', 'float']
+    pivots = pivot_index(df, columns)
+
+    for col in columns:
+        pd.testing.assert_frame_equal(pivots[col], groupby_pivot(df, col), check_dtype = False, check_exact = True)
+
+
+def test_one_vs_rest_matches_pivot_index_on_the_relabelled_target(df):
+    rng = np.random.default_rng(6)
+    classes = pd.Series(rng.choice(['bronze', 'silver', 'gold', 'platinum'], len(df), p = [0.4, 0.3, 0.2, 0.1]), index = df.index)
+    # a level seen with a single class only
+    classes[df['rare'] == 'only_zero'] = 'gold'
+    columns = ['str', 'int', 'float', 'rare']
+    class_pivots = class_pivot_index(df, columns, classes)
+    indexes = one_vs_rest_index(class_pivots)
+
+    for cls in classes.unique():
+        relabelled = df.assign(target = (classes == cls).astype('int64'))
+        expected = pivot_index(relabelled, columns, 'target', target_types)
+        pivots = one_vs_rest(class_pivots, cls, target_types)
+
+        for col in columns:
+            pd.testing.assert_frame_equal(pivots[col], expected[col], check_dtype = False, check_exact = True)
+            temp = expected[col]
+            index = (temp['target'] / temp['target'].sum()) / (temp['non_target'] / temp['non_target'].sum())
+            pd.testing.assert_series_equal(indexes[col][cls], index, check_names = False)
+
+
+def first_cat_table(temp, config, sort_col):
+    # cat_table as first written, on the full pivot: stable sort, soft limit into 'other/unsp', then the hard limit
+    if config['asc/desc'] != 0:
+        temp = temp.sort_values([sort_col], ascending = config['asc/desc'] == 1, kind = 'stable')
+    if config['soft_cat_limit'] != 0:
+        other = pd.DataFrame(temp.iloc[int(config['soft_cat_limit']):].sum(), columns = ['other/unsp']).transpose()
+        temp = pd.concat([temp.iloc[:int(config['soft_cat_limit'])], other], ignore_index = False)
+    if config['hard_cat_limit'] != 0:
+        temp = temp.iloc[:int(config['hard_cat_limit'])]
+    return temp
+
+
+@pytest.mark.parametrize('setting', list(itertools.product([-1, 1], [0, 1, 2, 3, 4, 10], [0, 2, 3, 4, 10])))
+def test_collapse_pivot_matches_cat_table_on_the_full_pivot(setting):
+    config = pd.Series({'custom_sort': 0, 'asc/desc': setting[0], 'soft_cat_limit': setting[1], 'hard_cat_limit': setting[2]})
+    # levels sorted as pivot_index gives them, with counts out of that order and ties at every cut
+    full = pd.DataFrame({'non_target': [4, 9, 1, 6, 2, 7, 3], 'target': [3, 5, 3, 1, 2, 3, 2]},
+                        index = pd.Index(list('abcdefg'), name = 'level'))
+    small = full.iloc[:2]
+
+    for temp in [full, small]:
+        collapsed = collapse_pivot(temp, config, 'target')
+        pd.testing.assert_frame_equal(cat_table(collapsed, 'level', config, 'target'), first_cat_table(temp, config, 'target'),
+                                      check_dtype = False, check_names = False)
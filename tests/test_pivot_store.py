@@ -0,0 +1,98 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import pivot_index, class_pivot_index
+from src.pivot_store import Pivot_Cache, Pivot_Store, save_pivots
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(1)
+    n = 2000
+    return pd.DataFrame({'target': rng.integers(0, 2, n),
+                         'a': rng.choice(['x', 'y', 'z'], n).astype('object'),
+                         'b': rng.choice(['p', 'q'], n).astype('object'),
+                         'num': rng.integers(0, 30, n)})
+
+
+def test_cache_matches_pivot_index_and_reloads(df, tmp_path, capsys):
+    target_types = ['non_target', 'target']
+    cache = Pivot_Cache(str(tmp_path))
+    expected = pivot_index(df, ['a', 'b', 'num'], 'target', target_types)
+
+    first = cache.pivot_index(df, ['a', 'b', 'num'], 'target', target_types)
+    assert "0 loaded, 3 computed" in capsys.readouterr().out
+
+    second = Pivot_Cache(str(tmp_path)).pivot_index(df, ['a', 'b', 'num'], 'target', target_types)
+    assert "3 loaded, 0 computed" in capsys.readouterr().out
+
+    for col in expected:
+        pd.testing.assert_frame_equal(first[col], expected[col])
+        pd.testing.assert_frame_equal(second[col], expected[col])
+
+
+def test_changed_column_is_recomputed(df, tmp_path, capsys):
+    cache = Pivot_Cache(str(tmp_path))
+    cache.pivot_index(df, ['a', 'b'], 'target', ['non_target', 'target'])
+    capsys.readouterr()
+
+    df.loc[0, 'a'] = 'w'
+    pivots = cache.pivot_index(df, ['a', 'b'], 'target', ['non_target', 'target'])
+    assert "1 loaded, 1 computed" in capsys.readouterr().out
+    assert 'w' in pivots['a'].index
+
+
+def round_trip(pivots, tmp_path):
+    save_pivots(pivots, str(tmp_path / 'pivots'))
+    return Pivot_Store(str(tmp_path / 'pivots'))
+
+
+def test_saved_pivots_reload_with_their_dtypes(tmp_path):
+    rng = np.random.default_rng(2)
+    n = 2000
+    df = pd.DataFrame({'target': rng.integers(0, 2, n),
+                       'str': pd.Series(rng.choice(['x', 'y', 'z'], n), dtype = 'str'),
+                       'obj': rng.choice(['x', 'y'], n).astype('object'),
+                       'bool': rng.choice([True, False], n),
+                       'int': rng.integers(-5, 30, n),
+                       'float': rng.normal(0, 1, n).round(2),
+                       'cat': pd.Categorical(rng.choice(['lo', 'mid', 'hi'], n), categories = ['lo', 'mid', 'hi'])})
+    columns = [col for col in df.columns if col != 'target']
+    pivots = pivot_index(df, columns, 'target', ['non_target', 'target'])
+    # binned at pivot time, the settings are kept in attrs
+    binned = pivot_index(df, ['float'], config_df = pd.DataFrame({'bin_length': [0.5], 'upper_class': [1.5], 'lower_class': [-1.5]}, index = ['float']))
+    pivots['float_binned'] = binned['float']
+
+    store = round_trip(pivots, tmp_path)
+    assert list(store) == list(pivots)
+    for col in pivots:
+        pd.testing.assert_frame_equal(store[col], pivots[col], check_exact = True)
+        assert store[col].attrs == pivots[col].attrs
+    assert 'binned' in store['float_binned'].attrs
+
+
+def test_multiclass_pivots_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    n = 2000
+    df = pd.DataFrame({'a': rng.choice(['x', 'y', 'z'], n), 'num': rng.integers(0, 10, n)})
+    pivots = class_pivot_index(df, ['a', 'num'], pd.Series(rng.integers(0, 4, n)))
+
+    store = round_trip(pivots, tmp_path)
+    for col in pivots:
+        pd.testing.assert_frame_equal(store[col], pivots[col], check_exact = True)
+
+
+def test_mixed_object_levels_keep_their_types(tmp_path):
+    levels = pd.Index([1, '1', 2.5, True, 'x', None], dtype = 'object', name = 'mixed')
+    pivot = pd.DataFrame({'vals': np.arange(6)}, index = levels)
+
+    reloaded = round_trip({'mixed': pivot}, tmp_path)['mixed']
+    pd.testing.assert_frame_equal(reloaded, pivot, check_exact = True)
+    assert [type(level) for level in reloaded.index] == [int, str, float, bool, str, type(None)]
+
+
+def test_unsupported_object_levels_are_rejected(tmp_path):
+    pivot = pd.DataFrame({'vals': [1, 2]}, index = pd.Index([pd.Timestamp('2021-01-01'), 'x'], dtype = 'object'))
+    with pytest.raises(TypeError):
+        save_pivots({'when': pivot}, str(tmp_path / 'pivots'))
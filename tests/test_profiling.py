@@ -0,0 +1,60 @@
+import tracemalloc
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import Data_Prep
+from src.profiling import Memory_Meter, Stage_Profiler
+
+
+@pytest.fixture(autouse = True)
+def tracing():
+    # a Stage_Profiler leaves tracing on, which would slow down the rest of the suite
+    yield
+    tracemalloc.stop()
+
+
+def test_each_stage_reports_its_own_peak():
+    profiler = Stage_Profiler()
+    meter = Memory_Meter()
+
+    large = np.ones(40 * 1024**2 // 8)
+    del large
+    profiler.record('large', peak_mb = meter.lap())
+    small = np.ones(1024**2 // 8)
+    del small
+    profiler.record('small', peak_mb = meter.lap())
+
+    peaks = profiler.report().set_index('stage')['peak_mb']
+    assert 40 <= peaks['large'] < 45
+    assert 1 <= peaks['small'] < 5
+
+
+def test_nested_meters_keep_the_peak_of_inner_stages():
+    Stage_Profiler()
+    outer = Memory_Meter()
+
+    inner = Memory_Meter()
+    large = np.ones(20 * 1024**2 // 8)
+    del large
+    assert 20 <= inner.lap() < 25
+
+    assert 20 <= outer.lap() < 25
+    assert inner.lap() < 5
+
+
+def test_data_prep_records_the_memory_of_each_column():
+    rng = np.random.default_rng(10)
+    n = 20000
+    df = pd.DataFrame({'target': rng.integers(0, 2, n), 'wide': rng.normal(0, 1, n), 'flag': rng.choice(['a', 'b'], n)})
+    profiler = Stage_Profiler()
+    Data_Prep(df, 'target', profiler = profiler)
+
+    peaks = profiler.report().set_index('column').loc[['target', 'wide', 'flag'], 'peak_mb']
+    assert not peaks.isna().any()
+    # not one process wide figure repeated for every column
+    assert peaks.nunique() > 1
+
+
+def test_meters_measure_nothing_without_tracing():
+    assert np.isnan(Memory_Meter().lap())
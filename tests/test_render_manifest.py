@@ -0,0 +1,89 @@
+import os
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import pivot_index
+from src.graph_generator import cat_graph_generate_hist, numeric_graph_generate, chart_path, directory_setup, index_chart, templates
+
+
+@pytest.fixture
+def pivots():
+    rng = np.random.default_rng(9)
+    df = pd.DataFrame({'plan': rng.choice(['basic', 'plus', 'premium'], 500).astype('object')})
+    return pivot_index(df, ['plan'])
+
+
+def test_chart_path_matches_directory_setup():
+    # root_folder '' saves under the folders directory_setup('') creates
+    assert chart_path('cat', 'plan', '') == '/Categorical/plan.jpg'
+    assert chart_path('numeric_hist', 'age', 'run') == 'run/Numeric/age.jpg'
+
+
+def test_charts_are_saved_under_root_folder_and_skipped_when_unchanged(tmp_path, monkeypatch, pivots):
+    monkeypatch.chdir(tmp_path)
+    directory_setup('run')
+    config_df = pd.DataFrame({'custom_sort': [0], 'asc/desc': [0], 'soft_cat_limit': [0], 'hard_cat_limit': [0]}, index = ['plan'])
+
+    time_list = cat_graph_generate_hist(pivots, config_df, 'run', ['plan'])
+    assert os.path.isfile(tmp_path / 'run' / 'Categorical' / 'plan.jpg')
+    assert not os.path.exists(tmp_path / 'Categorical')
+    assert time_list[0] > 0
+
+    manifest = pd.read_csv(tmp_path / 'run' / 'render_manifest.csv', index_col = 0)
+    assert list(manifest.index) == ['Categorical/plan.jpg']
+
+    assert cat_graph_generate_hist(pivots, config_df, 'run', ['plan']) == [0.0]
+
+
+def test_parallel_render_matches_serial_and_skips_failed_columns(tmp_path, capfd):
+    rng = np.random.default_rng(10)
+    n = 2000
+    df = pd.DataFrame({'target': rng.integers(0, 2, n), 'age': rng.integers(18, 80, n),
+                       'spend': rng.gamma(2, 30, n).round(0), 'visits': rng.integers(0, 40, n)})
+    target_types = ['non_target', 'target']
+    columns = ['age', 'spend', 'visits']
+    pivots = pivot_index(df, columns, 'target', target_types)
+    # binned at pivot time with other settings than the config, so its chart fails
+    pivots['visits'] = pivot_index(df, ['visits'], 'target', target_types, config_df = pd.DataFrame({'bin_length': [5], 'upper_class': [0], 'lower_class': [0]}, index = ['visits']))['visits']
+    config_df = pd.DataFrame({'upper_class': [70, 150, 0], 'lower_class': [20, 10, 0], 'bin_length': [5, 20, 10]}, index = columns)
+
+    folders = {}
+    for n_jobs in [1, 2]:
+        root_folder = str(tmp_path / ('jobs_' + str(n_jobs)))
+        directory_setup(root_folder)
+        time_list = numeric_graph_generate(pivots, target_types, config_df, root_folder, n_jobs = n_jobs)
+        assert len(time_list) == 3
+        assert "failed to render visits" in capfd.readouterr().out
+
+        folders[n_jobs] = root_folder
+        assert sorted(os.listdir(root_folder + '/Numeric')) == ['age.jpg', 'spend.jpg']
+        manifest = pd.read_csv(root_folder + '/render_manifest.csv', index_col = 0)
+        assert list(manifest.index) == ['Numeric/age.jpg', 'Numeric/spend.jpg']
+
+    for name in ['age.jpg', 'spend.jpg']:
+        with open(folders[1] + '/Numeric/' + name, 'rb') as serial, open(folders[2] + '/Numeric/' + name, 'rb') as parallel:
+            assert serial.read() == parallel.read()
+    pd.testing.assert_frame_equal(pd.read_csv(folders[1] + '/render_manifest.csv'), pd.read_csv(folders[2] + '/render_manifest.csv'))
+
+
+def test_reused_template_keeps_nothing_of_the_previous_column(tmp_path):
+    target_types = ['non_target', 'target']
+    wide = pd.DataFrame({'non_target': np.arange(10, 20), 'target': np.arange(1, 11)}, index = pd.Index(list('abcdefghij'), name = 'wide'))
+    narrow = pd.DataFrame({'non_target': [5, 7, 9], 'target': [30, 2, 4]}, index = pd.Index(['x', 'y', 'z'], name = 'narrow'))
+
+    templates.clear()
+    index_chart(wide.copy(), target_types, str(tmp_path / 'wide.jpg'), (12, 6))
+    index_chart(narrow.copy(), target_types, str(tmp_path / 'reused.jpg'), (12, 6))
+    template = templates[((12, 6), True)]
+
+    assert [bar.get_height() for bar in template.bars if bar.get_visible()] == [30, 2, 4]
+    assert [label.get_text() for label in template.ax1.get_xticklabels()] == ['x', 'y', 'z']
+    assert template.ax1.get_xlabel() == 'narrow'
+    assert template.ax1.get_xlim() == (-0.5, 2.5)
+    assert len(template.index_line.get_xdata()) == len(template.benchmark_line.get_xdata()) == 3
+
+    # the same file as a template that never drew the wide column
+    templates.clear()
+    index_chart(narrow.copy(), target_types, str(tmp_path / 'fresh.jpg'), (12, 6))
+    assert (tmp_path / 'reused.jpg').read_bytes() == (tmp_path / 'fresh.jpg').read_bytes()
@@ -0,0 +1,85 @@
+import math
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.graph_config import numeric_defaults, sketch_numeric_defaults
+from src.sketches import Quantile_Sketch
+
+# documented rank error of the default k = 200 at 99% confidence
+epsilon = 0.0165
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(4)
+    n = 40000
+    return pd.DataFrame({'target': rng.integers(0, 2, n),
+                         'normal': rng.normal(50, 10, n).round(2),
+                         'skewed': rng.lognormal(3, 1, n).round(1),
+                         'counts': rng.poisson(4, n).astype('float64')})
+
+
+def chunked_sketches(df, cols, chunks):
+    # one sketch per chunk of the target == 1 rows, as Chunk_Aggregator builds them
+    rows = df[df['target'] == 1]
+    sketches = {col: Quantile_Sketch() for col in cols}
+    for part in np.array_split(np.arange(len(rows)), chunks):
+        for col in cols:
+            sketches[col].update(rows[col].iloc[part])
+    return sketches
+
+
+def merged_sketches(df, cols, partitions):
+    # independent sketches per partition merged on the driver, as Partitioned_Data_Prep does
+    merged = None
+    for i, part in enumerate(np.array_split(np.arange(len(df)), partitions)):
+        rows = df.iloc[part]
+        sketches = {col: Quantile_Sketch(seed = i) for col in cols}
+        for col in cols:
+            sketches[col].update(rows.loc[rows['target'] == 1, col])
+        if merged is None:
+            merged = sketches
+        else:
+            for col in cols:
+                merged[col].merge(sketches[col])
+    return merged
+
+
+def within_rank(sorted_values, value, q):
+    # value is an acceptable q quantile if its rank range overlaps q +/- epsilon
+    n = len(sorted_values)
+    low = np.searchsorted(sorted_values, value, side = 'left') / n
+    high = np.searchsorted(sorted_values, value, side = 'right') / n
+    return low <= q + epsilon and high >= q - epsilon
+
+
+@pytest.mark.parametrize('build', [lambda df, cols: chunked_sketches(df, cols, 8),
+                                   lambda df, cols: merged_sketches(df, cols, 5)], ids = ['chunked', 'merged'])
+def test_sketch_defaults_within_rank_error(df, build):
+    cols = ['normal', 'skewed', 'counts']
+    exact = numeric_defaults(df, cols, 'target')
+    approximate = sketch_numeric_defaults(build(df, cols), cols)
+
+    assert list(approximate.index) == list(exact.index)
+    for col in cols:
+        values = np.sort(df.loc[df['target'] == 1, col].values)
+        n = len(values)
+
+        assert within_rank(values, approximate.loc[col, 'upper_class'], 0.95)
+        assert within_rank(values, approximate.loc[col, 'lower_class'], 0.05)
+
+        # the widest and narrowest interquartile ranges the rank error allows bound the Freedman-Diaconis bin length
+        quantile = lambda q: values[min(n - 1, max(0, int(math.floor(q * n))))]
+        widest = math.ceil(2*(quantile(0.75 + epsilon) - quantile(0.25 - epsilon))/(n**(1/3)))
+        narrowest = math.ceil(2*(quantile(0.75 - epsilon) - quantile(0.25 + epsilon))/(n**(1/3)))
+        assert narrowest <= approximate.loc[col, 'bin_length'] <= widest
+        assert narrowest <= exact.loc[col, 'bin_length'] <= widest
+
+
+def test_sketch_count_and_extremes_are_exact(df):
+    sketches = merged_sketches(df, ['skewed'], 3)
+    values = df.loc[df['target'] == 1, 'skewed']
+
+    assert sketches['skewed'].count() == values.count()
+    assert sketches['skewed'].quantile([0, 1]) == [values.min(), values.max()]
@@ -0,0 +1,85 @@
+import os
+import pandas as pd
+import numpy as np
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from src.data_prep import Data_Prep, pivot_index
+from src.sql_backend import Sql_Data_Prep
+
+target_types = ['non_target', 'target']
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(3)
+    n = 2000
+    num_f = rng.normal(size = n).round(1)
+    num_f[rng.random(n) < 0.1] = np.nan
+    cat_b = rng.choice(['p', 'q', 'r'], n).astype('object')
+    cat_b[rng.random(n) < 0.05] = None
+    return pd.DataFrame({'target': rng.integers(0, 2, n),
+                         'row_id': np.arange(n),
+                         'cat_a': rng.choice(['x', 'y', 'z'], n).astype('object'),
+                         'cat_b': cat_b,
+                         'num_i': rng.integers(0, 20, n),
+                         'num_f': num_f})
+
+
+def load(df, engine):
+    df.to_sql('data', engine, index = False)
+    return engine
+
+
+@pytest.fixture
+def engine(df, tmp_path):
+    return load(df, sa.create_engine('sqlite:///' + str(tmp_path / 'data.db')))
+
+
+def check_matches_pandas(df, engine, batch_size):
+    expected = Data_Prep(df, 'target')
+    prep = Sql_Data_Prep(engine, 'data', 'target', batch_size = batch_size)
+
+    assert prep.Ids_cats == expected.Ids_cats
+    assert list(prep.cat_cols) == list(expected.cat_cols)
+    assert list(prep.numeric_cols) == list(expected.numeric_cols)
+
+    for columns in [list(prep.cat_cols), list(prep.numeric_cols)]:
+        pivots = prep.pivots(columns, target_types)
+        reference = pivot_index(df, columns, 'target', target_types)
+        for col in columns:
+            pd.testing.assert_frame_equal(pivots[col], reference[col], check_dtype = False, check_index_type = False)
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 100])
+def test_sqlite_matches_pandas(df, engine, batch_size):
+    check_matches_pandas(df, engine, batch_size)
+
+
+def test_sqlite_one_statement_per_batch_and_dtype(df, engine):
+    prep = Sql_Data_Prep(engine, 'data', 'target')
+    statements = []
+    sa.event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    prep.crosstab_counts(['cat_a', 'cat_b', 'num_i', 'num_f'], target_types)
+
+    # one UNION ALL for the text columns, one per numeric dtype
+    assert len(statements) == 3
+    assert 'UNION ALL' in statements[0]
+
+
+def test_postgres_grouping_sets_query(df, engine):
+    prep = Sql_Data_Prep(engine, 'data', 'target')
+    sql = str(prep.grouping_sets_query(['cat_a', 'num_i'], True).compile(dialect = postgresql.dialect()))
+
+    assert 'GROUP BY GROUPING SETS((data.cat_a, data.target), (data.num_i, data.target))' in sql
+    assert 'grouping(data.cat_a) AS g0' in sql and 'grouping(data.num_i) AS g1' in sql
+
+
+@pytest.mark.skipif('EDA_TOOL_POSTGRES_URL' not in os.environ, reason = 'needs a postgres database in EDA_TOOL_POSTGRES_URL')
+def test_postgres_matches_pandas(df):
+    engine = sa.create_engine(os.environ['EDA_TOOL_POSTGRES_URL'])
+    with engine.begin() as conn:
+        conn.execute(sa.text('DROP TABLE IF EXISTS data'))
+    check_matches_pandas(df, load(df, engine), 2)
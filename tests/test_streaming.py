@@ -0,0 +1,75 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.data_prep import Data_Prep, pivot_index
+from src.streaming import Partitioned_Data_Prep, Streaming_Data_Prep, partition_counts
+
+
+@pytest.fixture
+def partitions(tmp_path):
+    rng = np.random.default_rng(2)
+    n = 3000
+    df = pd.DataFrame({'target': rng.integers(0, 2, n),
+                       'row_id': np.arange(n),
+                       'cat': rng.choice(['x', 'y', 'z'], n),
+                       'num': rng.integers(0, 20, n)})
+    for i, part in enumerate(np.array_split(np.arange(n), 3)):
+        df.iloc[part].to_csv(tmp_path / ('part_' + str(i) + '.csv'), index = False)
+    return df, tmp_path
+
+
+@pytest.mark.parametrize('sketch', [False, True])
+def test_partition_counts_cap_levels(partitions, sketch):
+    df, path = partitions
+    aggregate = partition_counts(str(path / 'part_0.csv'), 'target', chunksize = 400, sketch = sketch, max_levels = 100)
+
+    assert aggregate.high_card == ['row_id']
+    assert 'row_id' not in aggregate.counts
+    assert all(len(counts) <= 100 for counts in aggregate.counts.values())
+    assert aggregate.sketches['row_id'].n_rows == 1000
+
+
+def test_capped_id_column_is_still_profiled(partitions):
+    df, path = partitions
+    expected = Data_Prep(df, 'target')
+    partitioned = Partitioned_Data_Prep(str(path), 'target', pattern = '*.csv', n_jobs = 2, chunksize = 400, max_levels = 100)
+
+    assert partitioned.Ids_cats == expected.Ids_cats == ['row_id']
+    assert list(partitioned.profile.index) == list(df.columns)
+    assert partitioned.profile.loc['row_id', 'n_unique'] == len(df)
+    assert list(partitioned.cat_cols) == list(expected.cat_cols)
+    assert list(partitioned.numeric_cols) == list(expected.numeric_cols)
+
+
+@pytest.mark.parametrize('target_types', [['non_target', 'target'], ''])
+def test_streaming_pivots_match_pivot_index(tmp_path, target_types):
+    rng = np.random.default_rng(3)
+    n = 4000
+    text = rng.choice(['x', 'y', 'z'], n).astype('object')
+    text[rng.random(n) < 0.05] = None
+    decimals = rng.normal(0, 1, n).round(1)
+    decimals[rng.random(n) < 0.05] = np.nan
+    counts = rng.integers(0, 9, n).astype('float64')
+    counts[rng.random(n) < 0.05] = np.nan
+    df = pd.DataFrame({'target': rng.integers(0, 2, n),
+                       'text': text,
+                       'level': pd.Categorical(rng.choice(['lo', 'mid', 'hi'], n)),
+                       'int': rng.integers(-3, 12, n),
+                       'counts': counts,
+                       'decimals': decimals})
+    target_var = 'target' if target_types else ''
+    # several row groups, so the pivots are merged across chunks
+    df[[col for col in df.columns if target_var or col != 'target']].to_parquet(tmp_path / 'data.parquet', row_group_size = 700)
+
+    # the frame as it loads in memory, e.g. text as str on pandas 3
+    df = pd.read_parquet(tmp_path / 'data.parquet')
+    streamed = Streaming_Data_Prep(str(tmp_path / 'data.parquet'), target_var)
+    assert streamed.n_chunks == 6
+
+    columns = ['text', 'level', 'int', 'counts', 'decimals']
+    assert list(streamed.cat_cols) + list(streamed.numeric_cols) == columns
+    expected = pivot_index(df, columns, target_var, target_types)
+    pivots = streamed.pivots(columns, target_types)
+    for col in columns:
+        pd.testing.assert_frame_equal(pivots[col], expected[col], check_exact = True)